@@ -0,0 +1,308 @@
+"""
+Shared audio fan-out hub for the Direct Stream Bot.
+
+Every guild listens to the same 24/7 stream, so instead of one FFmpeg process
+per voice connection the hub runs a single Opus ingest per unique stream and
+keeps its packets in a ring buffer. Each voice client plays a lightweight
+HubAudioSource that just reads packets from that buffer, so origin bandwidth
+and encoding CPU stay the same no matter how many guilds are listening.
+"""
+
+import logging
+import threading
+import time
+
+import discord
+
+from standby import StandbyIngest, STANDBY_OFF, STANDBY_HOT
+
+logger = logging.getLogger(__name__)
+
+FRAME_DURATION = 0.02  # seconds of audio in one Opus packet
+OPUS_SILENCE = b'\xf8\xff\xfe'  # a single Opus silence frame
+
+
+class StreamBroadcast:
+    def __init__(self, key, ingest_source, buffer_packets=250, linger=5.0, on_finished=None,
+                 standby_factory=None, standby_mode=STANDBY_OFF):
+        self.key = key
+        self._source = ingest_source  # an Opus AudioSource, e.g. discord.FFmpegOpusAudio
+        self._standby_factory = standby_factory  # creates another ingest like the first one
+        self.standby_mode = standby_mode
+        self._standby = None
+        self._swap_lock = threading.Lock()
+        self.failovers = 0
+        self.last_packet_at = time.monotonic()  # when the ingest last delivered real audio, not filler
+        self._capacity = buffer_packets
+        self._packets = [None] * buffer_packets
+        self._filler = [False] * buffer_packets  # whether each buffered packet is padding silence
+        self._next_seq = 0  # sequence number the next ingested packet will get
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.ended = False
+        self.listeners = 0
+        self._sources = set()  # HubAudioSources reading from this ingest
+        self.idle_since = None  # when the last listener left
+        self.linger = linger  # seconds to keep ingesting after the last listener leaves
+        self.on_finished = on_finished
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._ingest_loop, name='hub-ingest', daemon=True)
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def latest_seq(self):
+        return self._next_seq
+
+    @property
+    def packets_ingested(self):
+        return self._next_seq
+
+    def start(self):
+        self._thread.start()
+        if self.standby_mode == STANDBY_HOT:
+            self.prepare_standby()
+
+    def stop(self):
+        """Stop the ingest; killing FFmpeg also unblocks a pending read"""
+        self._stopped = True
+        with self._swap_lock:
+            standby, self._standby = self._standby, None
+        if standby:
+            standby.stop()
+        try:
+            self._source.cleanup()
+        except Exception as e:
+            logger.warning(f"Error stopping shared ingest: {e}")
+
+    def prepare_standby(self):
+        """Start warming a second ingest so a failure can be handed over without probing again"""
+        with self._swap_lock:
+            if self._standby_factory is None or self._stopped or self.ended:
+                return
+            if self._standby and not self._standby.failed:
+                return
+            logger.info(f"Warming standby ingest for {self.key[:60]}")
+            self._standby = StandbyIngest(self._standby_factory)
+
+    def fail_over(self):
+        """Called when listeners report a stall: swap in the standby, or stop so the next join starts fresh"""
+        if self.delivering_audio():
+            # Real audio is flowing again (another listener already failed over, or the origin recovered)
+            return True
+        if self._take_over(self._source):
+            return True
+        logger.warning(f"Shared ingest for {self.key[:60]} stalled with no standby ready, stopping it")
+        self.stop()
+        return False
+
+    def delivering_audio(self, within=1.0):
+        """Whether the ingest delivered real audio, not just filler silence, in the last within seconds"""
+        return time.monotonic() - self.last_packet_at < within
+
+    def _take_over(self, failed_source):
+        """Replace a failed ingest with the warm standby, returns True if packets can keep flowing"""
+        with self._swap_lock:
+            if self._source is not failed_source:
+                return True  # already replaced
+            standby = self._standby
+            source = standby.take() if standby else None
+            if source is None:
+                return False
+            self._standby = None
+            self._source = source
+            self.failovers += 1
+        logger.info(f"Shared ingest failed over to the standby pipeline ({self.failovers} failover(s))")
+        # Killing the old FFmpeg also unblocks the reader thread if it is stuck in read()
+        try:
+            failed_source.cleanup()
+        except Exception as e:
+            logger.warning(f"Error stopping failed ingest: {e}")
+        if self.standby_mode == STANDBY_HOT:
+            self.prepare_standby()
+        return True
+
+    def _ingest_loop(self):
+        """Reader thread: pull packets from the ingest and publish them at real-time pace"""
+        next_time = time.perf_counter()
+        try:
+            while not self._stopped:
+                source = self._source
+                try:
+                    packet = source.read()
+                except Exception as e:
+                    logger.error(f"Shared ingest read failed: {e}")
+                    packet = b''
+                if not packet:
+                    if not self._stopped and self._take_over(source):
+                        continue
+                    break
+                # The ingest's jitter buffer pads a stalled upstream with silence, which says nothing about its health
+                filler = getattr(source, 'is_filler', False) or packet == OPUS_SILENCE
+                if not filler:
+                    self.last_packet_at = time.monotonic()
+
+                if self.listeners == 0 and self.idle_since and time.monotonic() - self.idle_since > self.linger:
+                    logger.info(f"Stopping shared ingest for {self.key[:60]} (no listeners)")
+                    break
+
+                with self._cond:
+                    self._packets[self._next_seq % self._capacity] = packet
+                    self._filler[self._next_seq % self._capacity] = filler
+                    self._next_seq += 1
+                    self._cond.notify_all()
+
+                # Pace to real time so a burst of downloaded segments doesn't run past the listeners
+                next_time += FRAME_DURATION
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -1.0:
+                    # We were stalled; carry on from now rather than bursting to catch up
+                    next_time = time.perf_counter()
+        except Exception as e:
+            logger.error(f"Shared ingest failed: {e}")
+        finally:
+            with self._cond:
+                self.ended = True
+                self._cond.notify_all()
+            if not self._stopped and self.listeners:
+                logger.warning(f"Shared ingest ended after {self._next_seq} packets")
+                # Tell the listeners' sessions now, rather than when their players run dry
+                for source in list(self._sources):
+                    if source.on_ingest_ended:
+                        try:
+                            source.on_ingest_ended()
+                        except Exception as e:
+                            logger.warning(f"Error reporting the end of the shared ingest: {e}")
+            self.stop()
+            if self.on_finished:
+                self.on_finished(self)
+
+    def read_packet(self, seq, timeout=FRAME_DURATION):
+        """Return (packet, next_seq, is_filler) for a listener whose cursor is at seq"""
+        with self._cond:
+            # A listener that fell more than a buffer behind skips to the newest packet
+            if seq < self._next_seq - self._capacity:
+                seq = self._next_seq - 1
+
+            if seq >= self._next_seq:
+                if self.ended:
+                    return b'', seq, False
+                self._cond.wait(timeout)
+                if seq >= self._next_seq:
+                    # Nothing yet: send silence to keep the player going, or end with the ingest
+                    return (b'', seq, False) if self.ended else (OPUS_SILENCE, seq, True)
+
+            return self._packets[seq % self._capacity], seq + 1, self._filler[seq % self._capacity]
+
+
+class HubAudioSource(discord.AudioSource):
+    def __init__(self, hub, broadcast, start_delay_packets=5):
+        self._hub = hub
+        self._broadcast = broadcast
+        # Start slightly behind the newest packet so small scheduling jitter never underruns
+        self._cursor = max(0, broadcast.latest_seq - start_delay_packets)
+        self._released = False
+        self.joined_existing = False  # True when the ingest was already running
+        self.on_ingest_ended = None  # called on the ingest thread if the ingest dies under this listener
+        self.is_filler = False  # whether the last read() returned padding silence rather than audio
+
+    @property
+    def broadcast(self):
+        return self._broadcast
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        packet, self._cursor, self.is_filler = self._broadcast.read_packet(self._cursor)
+        return packet
+
+    def cleanup(self):
+        if not self._released:
+            self._released = True
+            self._hub.release(self)
+
+
+class BroadcastHub:
+    def __init__(self, buffer_seconds=5, linger=5.0, standby_mode=STANDBY_OFF):
+        self.buffer_packets = max(int(buffer_seconds / FRAME_DURATION), 10)
+        self.linger = linger  # seconds to keep an ingest alive after its last listener leaves
+        self.standby_mode = standby_mode  # whether each ingest keeps a warm standby pipeline
+        self._broadcasts = {}
+        self._lock = threading.Lock()
+
+    def create_source(self, key, ingest_factory):
+        """Return a source for the stream identified by key, starting its ingest with ingest_factory() if needed"""
+        with self._lock:
+            source = self._join(key)
+        if source is not None:
+            return source
+
+        # Spawning FFmpeg (and an HLS ingest) is slow, so it happens outside the lock that other guilds'
+        # joins and the player threads' releases need
+        ingest_source = ingest_factory()
+        with self._lock:
+            source = self._join(key)
+            if source is None:
+                broadcast = StreamBroadcast(
+                    key,
+                    ingest_source,
+                    buffer_packets=self.buffer_packets,
+                    linger=self.linger,
+                    on_finished=self._forget,
+                    standby_factory=ingest_factory,
+                    standby_mode=self.standby_mode
+                )
+                self._broadcasts[key] = broadcast
+                broadcast.start()
+                logger.info(f"Started shared ingest for {key[:60]}")
+                return self._add_listener(broadcast)
+
+        # Another caller started an ingest for this stream in the meantime; use that one
+        try:
+            ingest_source.cleanup()
+        except Exception as e:
+            logger.warning(f"Error stopping spare ingest: {e}")
+        return source
+
+    def _join(self, key):
+        """Return a new listener on the running ingest for key, or None if there isn't one; needs the lock"""
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None or broadcast.ended:
+            return None
+        logger.info(f"Joining shared ingest ({broadcast.listeners} listener(s) already)")
+        source = self._add_listener(broadcast)
+        source.joined_existing = True
+        return source
+
+    def _add_listener(self, broadcast):
+        """Register a new listener on broadcast and return its source; needs the lock"""
+        broadcast.listeners += 1
+        broadcast.idle_since = None
+        source = HubAudioSource(self, broadcast)
+        broadcast._sources.add(source)
+        return source
+
+    def release(self, source):
+        """Called when a listener's player finishes; the ingest stops itself once it has lingered unused"""
+        broadcast = source.broadcast
+        with self._lock:
+            broadcast._sources.discard(source)
+            broadcast.listeners -= 1
+            if broadcast.listeners <= 0:
+                broadcast.listeners = 0
+                broadcast.idle_since = time.monotonic()
+
+    def _forget(self, broadcast):
+        with self._lock:
+            if self._broadcasts.get(broadcast.key) is broadcast:
+                del self._broadcasts[broadcast.key]
+
+    def stats(self):
+        """Return (key, listeners, packets ingested) for every running ingest"""
+        with self._lock:
+            return [(b.key, b.listeners, b.packets_ingested) for b in self._broadcasts.values() if not b.ended]
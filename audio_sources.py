@@ -0,0 +1,336 @@
+"""
+Audio source helpers for the Direct Stream Bot.
+
+The default playback mode asks FFmpeg for Opus packets directly, with volume
+applied inside FFmpeg's filter graph (or a plain stream copy when the source is
+already Opus at full volume). discord.py then sends the packets as they are,
+so the bot's Python process does no per-frame decoding, scaling or encoding.
+"""
+
+import asyncio
+import logging
+import shlex
+import threading
+import time
+from collections import deque
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+PLAYBACK_MODE_OPUS = 'opus'
+PLAYBACK_MODE_PCM = 'pcm'
+
+FRAME_DURATION = 0.02  # seconds of audio in one frame
+OPUS_SILENCE_FRAME = b'\xf8\xff\xfe'
+
+# Output options that FFmpegOpusAudio already sets (or that clash with Opus output)
+OPUS_CONFLICTING_OPTIONS = {'-af', '-filter:a', '-ar', '-ac', '-b:a', '-c:a', '-acodec', '-f'}
+
+# HTTP input options, which FFmpeg rejects when the input is a pipe or a local file
+HTTP_INPUT_OPTIONS = {'-reconnect', '-reconnect_streamed', '-reconnect_delay_max', '-timeout', '-rw_timeout'}
+
+
+def strip_options(options, conflicting=OPUS_CONFLICTING_OPTIONS):
+    """Remove FFmpeg options (and their values), by default the output options FFmpegOpusAudio manages itself"""
+    if not options:
+        return ''
+    tokens = shlex.split(options)
+    kept = []
+    skip_value = False
+    for token in tokens:
+        if skip_value:
+            skip_value = False
+            continue
+        if token in conflicting:
+            skip_value = True
+            continue
+        kept.append(token)
+    return ' '.join(shlex.quote(token) for token in kept)
+
+
+def create_audio_source(stream_url, ffmpeg_options, playback_mode=PLAYBACK_MODE_OPUS, volume=0.8,
+                        source_codec=None, bitrate=128, pipe=False, error_log=None):
+    """Create a discord.py audio source for stream_url (or a file-like object with pipe=True) in the given playback mode"""
+    # FFmpeg's stderr goes to error_log (an FFmpegErrorLog) when given, otherwise to the console
+    before_options = ffmpeg_options.get('before_options', '')
+    options = ffmpeg_options.get('options', '')
+    if pipe or not stream_url.startswith(('http://', 'https://')):
+        before_options = strip_options(before_options, HTTP_INPUT_OPTIONS)
+
+    if playback_mode == PLAYBACK_MODE_PCM:
+        # Legacy path: FFmpeg decodes to PCM, Python scales volume, libopus encodes in-process
+        audio_source = discord.FFmpegPCMAudio(stream_url, pipe=pipe, before_options=before_options, options=options,
+                                              stderr=error_log)
+        if error_log is not None:
+            error_log.process = audio_source._process
+        return discord.PCMVolumeTransformer(audio_source, volume=volume)
+
+    options = strip_options(options)
+    if source_codec == 'opus' and volume == 1.0:
+        # Already Opus and no filtering needed, so FFmpeg only remuxes the packets
+        logger.info("Source is already Opus, using stream copy")
+        codec = 'copy'
+    else:
+        codec = None  # FFmpegOpusAudio encodes with libopus
+        options = f'{options} -af volume={volume:g}'.strip()
+
+    audio_source = discord.FFmpegOpusAudio(
+        stream_url,
+        bitrate=bitrate,
+        codec=codec,
+        pipe=pipe,
+        before_options=before_options,
+        options=options,
+        stderr=error_log
+    )
+    if error_log is not None:
+        error_log.process = audio_source._process
+    return audio_source
+
+
+class FFmpegErrorLog:
+    """Keeps the last lines FFmpeg wrote to stderr, so a failure can be blamed on FFmpeg or on its input"""
+
+    # Messages that mean the input failed (origin, network or pipe), not FFmpeg or its options
+    INPUT_ERROR_MARKERS = (
+        'server returned', 'http error', 'connection refused', 'connection reset', 'connection timed out',
+        'timed out', 'i/o error', 'input/output error', 'end of file', 'network is unreachable',
+        'failed to resolve', 'name or service not known', 'invalid data found when processing input', 'broken pipe'
+    )
+
+    def __init__(self, max_lines=20):
+        self.process = None  # FFmpeg's Popen, set by create_audio_source
+        self.lines = deque(maxlen=max_lines)
+        self._partial = b''
+
+    def write(self, data):
+        # Called on discord.py's stderr reader thread
+        self._partial += data
+        *lines, self._partial = self._partial.split(b'\n')
+        for line in lines:
+            line = line.decode(errors='replace').strip()
+            if line:
+                logger.warning(f"FFmpeg: {line}")
+                self.lines.append(line)
+
+    def failure(self):
+        """Describe how FFmpeg itself failed, or None while it runs, once it ended cleanly or was killed, or if its input was to blame"""
+        returncode = self.process.poll() if self.process else None
+        if returncode is None or returncode <= 0:
+            return None
+        text = '\n'.join(self.lines).lower()
+        if any(marker in text for marker in self.INPUT_ERROR_MARKERS):
+            return None
+        return f"FFmpeg exited with code {returncode}: {self.lines[-1] if self.lines else 'no output'}"
+
+
+async def probe_source_codec(stream_url, timeout=10):
+    """Return the audio codec of stream_url using ffprobe, or None if it can't be determined"""
+    try:
+        codec, _bitrate = await asyncio.wait_for(
+            discord.FFmpegOpusAudio.probe(stream_url, method='native'),
+            timeout=timeout
+        )
+        return codec
+    except asyncio.TimeoutError:
+        logger.warning(f"Probing source codec timed out after {timeout} seconds")
+        return None
+    except Exception as e:
+        logger.warning(f"Could not probe source codec: {e}")
+        return None
+
+
+class InstrumentedAudioSource(discord.AudioSource):
+    """Wraps an audio source and counts the audio frames and bytes it actually delivers"""
+
+    # is_playing() stays true while FFmpeg is stuck on a dead segment, so the
+    # frame rate is the real health signal; the health monitor calls check()
+
+    FRAMES_PER_SECOND = 50  # 20 ms frames
+    SILENT_PACKETS = (OPUS_SILENCE_FRAME,)  # Opus silence never counts as audio, even from a source without is_filler
+
+    def __init__(self, source, stall_window=5.0, min_rate=0.5, startup_timeout=30.0, warning_after=1.0,
+                 on_first_audio=None):
+        self._source = source
+        self.on_first_audio = on_first_audio  # called (on the player thread) with the seconds to first audio
+        self.stall_window = stall_window  # seconds the rate must stay low before it's a stall
+        self.min_rate = min_rate  # fraction of real-time rate that counts as healthy
+        self.startup_timeout = startup_timeout  # seconds to wait for the first audio frame
+        self.warning_after = warning_after  # seconds without audio before an early warning
+        self.frames = 0
+        self.audio_frames = 0
+        self.bytes_read = 0
+        self.frames_per_second = 0.0
+        self.bytes_per_second = 0.0
+        self.reset()
+
+    @property
+    def source(self):
+        return self._source
+
+    def reset(self):
+        """Start judging the stream afresh, e.g. after the wrapped source was swapped"""
+        self.created_at = time.monotonic()
+        self.first_audio_at = None
+        self.last_audio_at = None
+        self.stalled = False
+        self.warning = None
+        self._warned = False
+        self._samples = deque()
+
+    def swap_source(self, source):
+        """Replace the wrapped source under a running player; returns the old one for the caller to clean up"""
+        old_source, self._source = self._source, source
+        self.on_first_audio = None  # the startup time of a swapped-in source says nothing about its options
+        self.reset()
+        return old_source
+
+    def is_opus(self):
+        return self._source.is_opus()
+
+    def read(self):
+        source = self._source
+        data = source.read()
+        if not data and source is not self._source:
+            # The source was swapped while this read was blocked; carry on with the new one
+            source = self._source
+            data = source.read()
+        self.frames += 1
+        # Sources that pad gaps with silence (jitter buffer, hub, standby) flag it, for PCM as well as Opus
+        if data and not getattr(source, 'is_filler', False) and data not in self.SILENT_PACKETS:
+            now = time.monotonic()
+            if self.first_audio_at is None:
+                self.first_audio_at = now
+                logger.info(f"First audio after {now - self.created_at:.2f} seconds")
+                if self.on_first_audio:
+                    self.on_first_audio(now - self.created_at)
+            self.last_audio_at = now
+            self.audio_frames += 1
+            self.bytes_read += len(data)
+        return data
+
+    def cleanup(self):
+        self._source.cleanup()
+
+    def pop_warning(self):
+        """Return the early warning raised by check() once, or None"""
+        warning, self.warning = self.warning, None
+        return warning
+
+    def check(self, now=None):
+        """Sample the counters; returns a stall description once, or None while healthy"""
+        if self.stalled:
+            return None
+        now = time.monotonic() if now is None else now
+
+        if self.first_audio_at is None:
+            if now - self.created_at > self.startup_timeout:
+                self.stalled = True
+                return f"no audio {self.startup_timeout:.0f}s after starting playback"
+            return None
+
+        self._samples.append((now, self.audio_frames, self.bytes_read))
+        while len(self._samples) > 1 and now - self._samples[0][0] > self.stall_window:
+            self._samples.popleft()
+
+        oldest_time, oldest_frames, oldest_bytes = self._samples[0]
+        elapsed = now - oldest_time
+        if elapsed <= 0:
+            return None
+        self.frames_per_second = (self.audio_frames - oldest_frames) / elapsed
+        self.bytes_per_second = (self.bytes_read - oldest_bytes) / elapsed
+
+        # Only judge once we've watched a full window (or nothing has arrived for that long)
+        silent_for = now - self.last_audio_at
+        if silent_for >= self.warning_after and not self._warned:
+            # Not a stall yet, but early enough to warm up a standby pipeline
+            self._warned = True
+            self.warning = f"no audio for {silent_for:.1f}s"
+        elif silent_for < self.warning_after:
+            self._warned = False
+        if silent_for >= self.stall_window or (
+            elapsed >= self.stall_window * 0.9
+            and self.frames_per_second < self.FRAMES_PER_SECOND * self.min_rate
+        ):
+            self.stalled = True
+            return f"audio stall ({self.frames_per_second:.1f} frames/s, no audio for {silent_for:.1f}s)"
+        return None
+
+
+class JitterBufferSource(discord.AudioSource):
+    """Queues frames from a bursty source on a reader thread and plays them out at a steady depth"""
+
+    # FFmpeg delivers a live stream in bursts (one HLS segment at a time), and
+    # without a buffer any gap between bursts reaches the listeners as a dropout
+
+    def __init__(self, source, target_frames=25, max_frames=150):
+        self._source = source
+        self.target_frames = target_frames  # depth to (re)fill to before playing, i.e. the added latency
+        self.max_frames = max(max_frames, target_frames + 1)  # beyond this, drop the oldest frames to catch up
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._buffering = True
+        self._ended = False
+        self._stopped = False
+        self.underruns = 0
+        self.overruns = 0
+        self.frames_dropped = 0
+        self.is_filler = False  # whether the last read() returned padding silence rather than audio
+        self._silence = OPUS_SILENCE_FRAME if source.is_opus() else b'\x00' * discord.opus.Encoder.FRAME_SIZE
+        self._thread = threading.Thread(target=self._fill_loop, name='jitter-buffer', daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    def _fill_loop(self):
+        try:
+            while not self._stopped:
+                frame = self._source.read()
+                if not frame:
+                    break
+                with self._cond:
+                    self._frames.append(frame)
+                    if len(self._frames) > self.max_frames:
+                        # Latency has built up; skip the oldest audio to get back to the target depth
+                        dropped = len(self._frames) - self.target_frames
+                        for _ in range(dropped):
+                            self._frames.popleft()
+                        self.overruns += 1
+                        self.frames_dropped += dropped
+                        logger.info(f"Jitter buffer overrun, skipped {dropped} frames to catch up")
+                    if self._buffering and len(self._frames) >= self.target_frames:
+                        self._buffering = False
+                    self._cond.notify_all()
+        except Exception as e:
+            logger.error(f"Jitter buffer reader failed: {e}")
+        finally:
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def is_opus(self):
+        return self._source.is_opus()
+
+    def read(self):
+        with self._cond:
+            if (self._buffering or not self._frames) and not self._ended:
+                # Wait up to one frame so a reader polling us doesn't spin
+                self._cond.wait(FRAME_DURATION)
+            self.is_filler = False
+            if self._ended:
+                # Play out what is left, then end like the wrapped source
+                return self._frames.popleft() if self._frames else b''
+            if not self._buffering and not self._frames:
+                self.underruns += 1
+                self._buffering = True
+            if self._buffering:
+                self.is_filler = True
+                return self._silence
+            return self._frames.popleft()
+
+    def cleanup(self):
+        self._stopped = True
+        self._source.cleanup()
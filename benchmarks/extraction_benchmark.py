@@ -0,0 +1,275 @@
+"""
+Extraction benchmark for the stream URL extractor, against a recorded corpus.
+
+Serves benchmarks/extraction_corpus with replay_server.py in its own process
+and runs each extraction strategy of StreamExtractor on every recorded page:
+  yt-dlp           yt-dlp in the worker pool, reusing each worker's YoutubeDL
+  yt-dlp-fresh     yt-dlp with a new YoutubeDL for every extraction
+  yt-dlp-process   yt-dlp in a worker process (YTDLP_ISOLATION = 'process')
+  html-page        the streaming media scanner on the page itself, no iframes
+  html-iframes     the scanner on the page and its embedded players, concurrently
+  m3u8-direct      the direct-fetch playlist search used when a URL looks wrong
+  full             extract() as the bot calls it: yt-dlp and the scanner raced, then ranking
+  sequential       extract() with the race turned off: yt-dlp first, the scanner only if it fails
+
+For every strategy it reports the hit rate (the URL found is one the corpus
+expects), wall time, CPU time and peak Python memory per page, and which
+stage produced the result of the full and sequential extractions. CPU time
+is the whole process, so it includes yt-dlp's worker threads but not the
+yt-dlp-process worker; memory is measured in a separate traced run, because
+tracing slows everything else down.
+
+Usage:
+    python benchmarks/extraction_benchmark.py
+    python benchmarks/extraction_benchmark.py --strategies html-page html-iframes --runs 20
+    python benchmarks/extraction_benchmark.py --latency 0.05 --save baseline.json
+    python benchmarks/extraction_benchmark.py --compare baseline.json --tolerance 0.2
+
+With --compare the exit code is 1 if a strategy got slower than the baseline
+by more than the tolerance or lost hits, so it can gate a change.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from replay_server import CORPUS_DIR, READY_LINE_PREFIX
+from voice_load_test import spawn_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import SharedHTTPClient  # noqa: E402
+from stream_extractor import StreamExtractor  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ['yt-dlp', 'yt-dlp-fresh', 'yt-dlp-process', 'html-page', 'html-iframes', 'm3u8-direct', 'full', 'sequential']
+
+
+def load_corpus(corpus_dir, origin):
+    with open(os.path.join(corpus_dir, 'corpus.json'), 'r', encoding='utf-8') as f:
+        cases = json.load(f)['cases']
+    for case in cases:
+        case['url'] = f"{origin}/{case['page']}"
+        case['expected'] = [url.replace('{{ORIGIN}}', origin) for url in case['expected']]
+    return cases
+
+
+async def run_strategy(strategy, extractors, url):
+    """Run one strategy on a page URL; returns the media URLs it found, best first"""
+    extractor = extractors['default']
+    if strategy == 'yt-dlp':
+        return await extractor._extract_with_ytdlp(url)
+    if strategy == 'yt-dlp-fresh':
+        return await extractors['fresh']._extract_with_ytdlp(url)
+    if strategy == 'yt-dlp-process':
+        return await extractors['process']._extract_with_ytdlp(url)
+    if strategy == 'html-page':
+        page_only = extractors['page-only']
+        return await page_only._extract_from_html(await page_only.http_client.session(), url)
+    if strategy == 'html-iframes':
+        return await extractor._extract_from_html(await extractor.http_client.session(), url)
+    if strategy == 'm3u8-direct':
+        found = await extractor.find_m3u8_url(url)
+        return [found] if found else []
+    if strategy in ('full', 'sequential'):
+        if strategy == 'sequential':
+            extractor = extractors['sequential']
+        found = await extractor.extract(url)
+        # extract() hands back the page URL itself when it found nothing
+        return [found] if found and found != url else []
+    raise ValueError(f"Unknown strategy {strategy}")
+
+
+async def measure(strategy, extractors, case, trace_memory=False):
+    """One run of a strategy on a corpus case"""
+    if trace_memory:
+        tracemalloc.start()
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    error = None
+    try:
+        found = await run_strategy(strategy, extractors, case['url'])
+    except Exception as e:
+        found, error = [], f"{type(e).__name__}: {e}"
+    run = {
+        'seconds': time.perf_counter() - started,
+        'cpu_seconds': time.process_time() - cpu_started,
+        'found': found[0] if found else None,
+        'error': error,
+    }
+    if trace_memory:
+        run['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if strategy in ('full', 'sequential') and run['found']:
+        run['stage'] = extractors['default' if strategy == 'full' else 'sequential'].last_winner
+    run['hit'] = run['found'] in case['expected'] if case['expected'] else run['found'] is None
+    return run
+
+
+def summarize_case(runs, traced):
+    last = runs[-1]
+    summary = {
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'cpu_seconds': statistics.median(run['cpu_seconds'] for run in runs),
+        'peak_bytes': traced['peak_bytes'],
+        'found': last['found'],
+        'hit': all(run['hit'] for run in runs),
+        'error': last['error'],
+    }
+    if 'stage' in last:
+        summary['stage'] = last['stage']
+    return summary
+
+
+def summarize_strategy(cases):
+    """Totals over the corpus for one strategy; cases maps case name to its summary"""
+    hits = sum(1 for case in cases.values() if case['hit'])
+    total_seconds = sum(case['seconds'] for case in cases.values())
+    return {
+        'hits': hits,
+        'cases': len(cases),
+        'hit_rate': hits / len(cases) if cases else 0,
+        'median_seconds': statistics.median(case['seconds'] for case in cases.values()),
+        'max_seconds': max(case['seconds'] for case in cases.values()),
+        'total_seconds': total_seconds,
+        'cpu_seconds': sum(case['cpu_seconds'] for case in cases.values()),
+        'peak_bytes': max(case['peak_bytes'] for case in cases.values()),
+        # Time spent per page found: the number to order strategies by
+        'seconds_per_hit': total_seconds / hits if hits else None,
+    }
+
+
+def print_report(results):
+    strategies = results['strategies']
+    print()
+    print(f"{'strategy':<14} {'hits':>6} {'median':>8} {'max':>8} {'CPU':>8} {'peak mem':>9} {'per hit':>8}")
+    for name, strategy in strategies.items():
+        totals = strategy['totals']
+        per_hit = totals['seconds_per_hit']
+        print(f"{name:<14} {totals['hits']:>3}/{totals['cases']:<2} {totals['median_seconds'] * 1000:>6.0f}ms "
+              f"{totals['max_seconds'] * 1000:>6.0f}ms {totals['cpu_seconds'] * 1000:>6.0f}ms "
+              f"{totals['peak_bytes'] / 1024:>7.0f}KB {f'{per_hit * 1000:.0f}ms' if per_hit else 'n/a':>8}")
+    print("\n(median and max are per page, CPU is the total over the corpus, per hit is the total time per page found)")
+
+    case_names = list(next(iter(strategies.values()))['cases']) if strategies else []
+    print()
+    print(f"{'case':<22}" + ''.join(f"{name:>18}" for name in strategies))
+    for case_name in case_names:
+        cells = []
+        for strategy in strategies.values():
+            case = strategy['cases'][case_name]
+            mark = 'hit' if case['hit'] else ('miss' if case['found'] else 'none')
+            if case.get('stage'):
+                mark += f" {case['stage']}"
+            cells.append(f"{mark} {case['seconds'] * 1000:.0f}ms")
+        print(f"{case_name:<22}" + ''.join(f"{cell:>18}" for cell in cells))
+    print("\n(hit: an expected URL, miss: some other URL, none: nothing found; full and sequential also show the stage used)")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a saved baseline; returns the regressions"""
+    regressions = []
+    print(f"\nCompared with baseline (tolerance {tolerance:.0%}):")
+    for name, strategy in results['strategies'].items():
+        before = baseline.get('strategies', {}).get(name)
+        if not before:
+            continue
+        old, new = before['totals'], strategy['totals']
+        change = (new['total_seconds'] - old['total_seconds']) / old['total_seconds'] if old['total_seconds'] else 0
+        flags = []
+        # Ignore tiny absolute changes, they are noise
+        if change > tolerance and new['total_seconds'] - old['total_seconds'] > 0.01:
+            flags.append('slower')
+        if new['hits'] < old['hits']:
+            flags.append('lost hits')
+        if flags:
+            regressions.append((name, flags))
+        print(f"  {name:<14} {old['total_seconds'] * 1000:>7.0f}ms -> {new['total_seconds'] * 1000:>7.0f}ms "
+              f"({change:+.0%}), hits {old['hits']} -> {new['hits']}"
+              f"{'  <-- ' + ', '.join(flags) if flags else ''}")
+    return regressions
+
+
+async def run_benchmark(args):
+    server, origin = await spawn_server('replay_server.py', READY_LINE_PREFIX, '--corpus', args.corpus,
+                                        '--port', '0', '--latency', str(args.latency), verbose=args.verbose)
+    http_client = SharedHTTPClient()
+    options = {'ytdlp_timeout': args.ytdlp_timeout, 'http_client': http_client}
+    extractors = {
+        'default': StreamExtractor(**options),
+        'page-only': StreamExtractor(iframe_depth=0, **options),
+        'sequential': StreamExtractor(race=False, **options),
+        'fresh': StreamExtractor(reuse_ytdlp=False, **options),
+        'process': StreamExtractor(max_workers=1, isolation='process', **options),
+    }
+    results = {'runs': args.runs, 'latency': args.latency, 'strategies': {}}
+    try:
+        cases = load_corpus(args.corpus, origin)
+        if args.cases:
+            cases = [case for case in cases if case['name'] in args.cases]
+        if {'yt-dlp', 'yt-dlp-fresh', 'full', 'sequential'} & set(args.strategies):
+            # Importing yt-dlp is a one-off cost, not part of any extraction
+            await asyncio.wrap_future(extractors['fresh'].warm_up())
+        if 'yt-dlp-process' in args.strategies:
+            # So is starting the worker process
+            await asyncio.wrap_future(extractors['process'].warm_up())
+
+        for strategy in args.strategies:
+            case_results = {}
+            for case in cases:
+                runs = [await measure(strategy, extractors, case) for _ in range(args.runs)]
+                traced = await measure(strategy, extractors, case, trace_memory=True)
+                case_results[case['name']] = summarize_case(runs, traced)
+            results['strategies'][strategy] = {'totals': summarize_strategy(case_results), 'cases': case_results}
+            totals = results['strategies'][strategy]['totals']
+            print(f"{strategy}: {totals['hits']}/{totals['cases']} hits, {totals['total_seconds']:.2f}s in total")
+    finally:
+        for extractor in extractors.values():
+            extractor.shutdown()
+        await http_client.close()
+        server.terminate()
+        await server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure each stream URL extraction strategy on the recorded corpus")
+    parser.add_argument('--strategies', nargs='+', default=STRATEGIES, choices=STRATEGIES,
+                        help="strategies to measure")
+    parser.add_argument('--cases', nargs='+', help="only these corpus cases (by name)")
+    parser.add_argument('--corpus', default=CORPUS_DIR, help="corpus directory")
+    parser.add_argument('--runs', type=int, default=5, help="timed runs per strategy and page; the median is reported")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the replay server adds to every response")
+    parser.add_argument('--ytdlp-timeout', type=float, default=20, help="seconds before yt-dlp is given up on")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file from an earlier --save")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument('--verbose', action='store_true', help="show the extractor's and the server's log output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
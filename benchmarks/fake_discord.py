@@ -0,0 +1,206 @@
+"""
+Local stand-in for the Discord API and gateway, for benchmarks.
+
+Serves just enough of the REST API (login, application info and the gateway
+lookup) and of the gateway websocket (HELLO, IDENTIFY, READY and heartbeats)
+for a discord.py bot to log in and reach on_ready without touching the real
+Discord. Call patch_discord() in the bot's process to point discord.py at it.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_VERSION = 10
+BOT_USER_ID = '100000000000000001'
+APPLICATION_ID = '100000000000000002'
+OWNER_USER_ID = '100000000000000003'
+
+# Gateway opcodes
+OP_DISPATCH = 0
+OP_HEARTBEAT = 1
+OP_IDENTIFY = 2
+OP_HELLO = 10
+OP_HEARTBEAT_ACK = 11
+
+HEARTBEAT_ACK_DELAY = 0.05  # seconds
+
+
+def patch_discord(base_url):
+    """Point discord.py's REST client and gateway at a FakeDiscord server, e.g. http://127.0.0.1:8000"""
+    import discord.gateway
+    import discord.http
+    import yarl
+    discord.http.Route.BASE = f'{base_url}/api/v{API_VERSION}'
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(base_url.replace('http', 'ws', 1) + '/gateway')
+
+    # discord.py always opens voice websockets with wss://, the fake servers only speak plain ws://
+    ws_connect = discord.http.HTTPClient.ws_connect
+    local_wss = 'wss://' + base_url.split('://', 1)[1]
+
+    async def local_ws_connect(self, url, *, compress=0):
+        if url.startswith(local_wss):
+            url = 'ws://' + url[len('wss://'):]
+        return await ws_connect(self, url, compress=compress)
+
+    discord.http.HTTPClient.ws_connect = local_ws_connect
+
+
+def write_bot_config(directory, **settings):
+    """Write a config.py with the repo's settings, overridden by settings, for a bot run against a fake server"""
+    with open(os.path.join(REPO_DIR, 'config.py'), 'r', encoding='utf-8') as f:
+        text = f.read()
+    text += "\n\n# Added for the benchmark\n"
+    settings.setdefault('BOT_TOKEN', 'benchmark-token')
+    for name, value in settings.items():
+        text += f"{name} = {value!r}\n"
+    with open(os.path.join(directory, 'config.py'), 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def json_response(data):
+    # discord.py only decodes JSON when the content type is exactly application/json, without a charset
+    return web.Response(body=json.dumps(data).encode(), headers={'Content-Type': 'application/json'})
+
+
+def bot_user():
+    return {
+        'id': BOT_USER_ID,
+        'username': 'benchmark-bot',
+        'discriminator': '0',
+        'global_name': None,
+        'avatar': None,
+        'bot': True,
+        'flags': 0,
+    }
+
+
+class FakeDiscord:
+    def __init__(self, host='127.0.0.1', port=0, heartbeat_interval=41250):
+        self.host = host
+        self.port = port  # 0 picks a free port
+        self.heartbeat_interval = heartbeat_interval  # milliseconds, sent in HELLO
+        self.sessions = []  # one dict of timings per gateway connection
+        self._runner = None
+        self._session_ids = itertools.count(1)
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def make_app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get(f'/api/v{API_VERSION}/users/@me', self._get_me),
+            web.get(f'/api/v{API_VERSION}/oauth2/applications/@me', self._get_application),
+            web.get(f'/api/v{API_VERSION}/gateway', self._get_gateway),
+            web.get(f'/api/v{API_VERSION}/gateway/bot', self._get_gateway),
+            web.get('/gateway', self._gateway),
+        ])
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Fake Discord listening on {self.base_url}")
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _get_me(self, request):
+        return json_response(bot_user())
+
+    async def _get_application(self, request):
+        return json_response({
+            'id': APPLICATION_ID,
+            'name': 'benchmark-bot',
+            'description': '',
+            'icon': None,
+            'bot_public': False,
+            'bot_require_code_grant': False,
+            'owner': {**bot_user(), 'id': OWNER_USER_ID, 'username': 'benchmark-owner', 'bot': False},
+            'verify_key': '',
+            'flags': 0,
+        })
+
+    async def _get_gateway(self, request):
+        return json_response({
+            'url': self.base_url.replace('http', 'ws', 1) + '/gateway',
+            'shards': 1,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    def ready_payload(self, session_id):
+        """The READY event data; subclasses add guilds here"""
+        return {
+            'v': API_VERSION,
+            'user': bot_user(),
+            'guilds': [],
+            'session_id': session_id,
+            'resume_gateway_url': self.base_url.replace('http', 'ws', 1) + '/gateway',
+            'application': {'id': APPLICATION_ID, 'flags': 0},
+        }
+
+    async def after_ready(self, ws, session):
+        """Hook for subclasses to send more events once READY has gone out"""
+
+    async def handle_op(self, ws, session, op, data):
+        """Hook for subclasses to handle opcodes the base gateway ignores"""
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session = {'connected_at': time.perf_counter(), 'sequence': 0, 'id': f'session-{next(self._session_ids)}'}
+        self.sessions.append(session)
+        await ws.send_str(json.dumps({'op': OP_HELLO, 'd': {'heartbeat_interval': self.heartbeat_interval}}))
+        async for message in ws:
+            if message.type != web.WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            op = payload.get('op')
+            if op == OP_HEARTBEAT:
+                # discord.py notes the send time only after the send completes; an instant local ACK
+                # beats that and is logged as a heartbeat a whole interval behind
+                await asyncio.sleep(HEARTBEAT_ACK_DELAY)
+                await ws.send_str(json.dumps({'op': OP_HEARTBEAT_ACK}))
+            elif op == OP_IDENTIFY:
+                session['identified_at'] = time.perf_counter()
+                await self.dispatch(ws, session, 'READY', self.ready_payload(session['id']))
+                session['ready_at'] = time.perf_counter()
+                await self.after_ready(ws, session)
+            else:
+                await self.handle_op(ws, session, op, payload.get('d'))
+        session['closed_at'] = time.perf_counter()
+        return ws
+
+    async def dispatch(self, ws, session, event, data):
+        session['sequence'] += 1
+        await ws.send_str(json.dumps({'op': OP_DISPATCH, 't': event, 's': session['sequence'], 'd': data}))
+
+
+async def _main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = await FakeDiscord(port=8765).start()
+    print(f"Fake Discord running at {server.base_url}, press Ctrl+C to stop")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,330 @@
+"""
+Synthetic live HLS origin, for offline streaming benchmarks.
+
+Serves a stream page (/watch) that embeds a live HLS playlist, the playlist
+itself and its segments, all generated on the fly, so the bot's extraction,
+HLS ingest and playback can be exercised without the real stream. Segments
+are packed MPEG audio (a quiet MP3 tone, 48 kHz mono), which FFmpeg decodes
+like any other HLS audio rendition, and the playlist is a sliding live window
+that advances in real time.
+
+The origin can be made to misbehave, per stream:
+  - latency / latency_jitter: delay before every playlist and segment response
+  - loss: fraction of segment responses cut off halfway through the transfer
+  - stall_every / stall_seconds: the playlist stops advancing for stall_seconds
+    after every stall_every seconds of stream, as when the encoder stalls
+  - url_ttl: playlist and segment URLs are signed and answer 403 once expired,
+    like a CDN token; the page always hands out a freshly signed URL
+
+POST /control/config with any of the settings starts a new stream (new URLs,
+fresh counters) and GET /control/stats returns what the origin has served.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import random
+import time
+
+from aiohttp import web
+
+from fake_discord import json_response
+
+logger = logging.getLogger(__name__)
+
+READY_LINE_PREFIX = 'FAKE_HLS_URL '
+
+SAMPLE_RATE = 48000
+FRAME_SECONDS = 1152 / SAMPLE_RATE  # an MPEG-1 Layer III frame holds 1152 samples, 24 ms at 48 kHz
+MP3_BITRATES = [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]  # kbps, MPEG-1 Layer III
+
+DEFAULT_SETTINGS = {
+    'segment_duration': 2.0,  # seconds, rounded to whole MP3 frames
+    'bitrate': 128,  # kbps, one of MP3_BITRATES
+    'window': 6,  # segments listed in the live playlist
+    'latency': 0.0,  # seconds before each response
+    'latency_jitter': 0.0,  # up to this many extra seconds, uniformly random
+    'loss': 0.0,  # fraction of segment responses cut off halfway
+    'stall_every': 0.0,  # seconds of stream between stalls (0 = never)
+    'stall_seconds': 0.0,  # how long each stall lasts
+    'url_ttl': 0.0,  # seconds a signed URL stays valid (0 = URLs aren't signed)
+}
+
+
+class BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def write(self, value, width):
+        self.bits.extend((value >> shift) & 1 for shift in range(width - 1, -1, -1))
+
+    def to_bytes(self):
+        bits = self.bits + [0] * (-len(self.bits) % 8)
+        return bytes(int(''.join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+
+
+def mp3_tone_frame(bitrate=128, line=8, global_gain=180):
+    """One MPEG-1 Layer III mono frame whose only spectral line is line (of 576), i.e. a steady quiet tone"""
+    # Pure silence would be encoded by FFmpeg as Opus silence frames, which the bot doesn't count as audio
+    header = BitWriter()
+    header.write(0x7FF, 11)  # frame sync
+    header.write(0b11, 2)  # MPEG-1
+    header.write(0b01, 2)  # Layer III
+    header.write(1, 1)  # no CRC
+    header.write(MP3_BITRATES.index(bitrate) + 1, 4)
+    header.write(0b01, 2)  # 48 kHz
+    header.write(0, 1)  # no padding
+    header.write(0, 1)  # private bit
+    header.write(0b11, 2)  # single channel
+    header.write(0, 6)  # mode extension, copyright, original, emphasis
+
+    # The spectrum is coded in the count1 region with table B: four bits per quadruple of lines,
+    # the complement of the values, then a sign bit for each non-zero value
+    main_data = BitWriter()
+    quadruples = line // 4 + 1
+    for index in range(quadruples):
+        values = [1 if index * 4 + offset == line else 0 for offset in range(4)]
+        code = sum(value << (3 - offset) for offset, value in enumerate(values))
+        main_data.write(code ^ 0b1111, 4)
+        main_data.write(0, sum(values))  # positive
+    granule_bits = len(main_data.bits)
+
+    side_info = BitWriter()
+    side_info.write(0, 9)  # main_data_begin: no bit reservoir
+    side_info.write(0, 5)  # private bits
+    side_info.write(0, 4)  # scfsi
+    for _ in range(2):  # two granules with the same content
+        side_info.write(granule_bits, 12)  # part2_3_length (no scale factors, so all Huffman bits)
+        side_info.write(0, 9)  # big_values
+        side_info.write(global_gain, 8)
+        side_info.write(0, 4)  # scalefac_compress: no scale factor bits
+        side_info.write(0, 1)  # long blocks
+        side_info.write(0, 15)  # table_select x3
+        side_info.write(0, 4)  # region0_count
+        side_info.write(0, 3)  # region1_count
+        side_info.write(0, 1)  # preflag
+        side_info.write(0, 1)  # scalefac_scale
+        side_info.write(1, 1)  # count1 table B
+
+    both_granules = BitWriter()
+    both_granules.bits = main_data.bits * 2
+    frame = header.to_bytes() + side_info.to_bytes() + both_granules.to_bytes()
+    frame_size = 144 * bitrate * 1000 // SAMPLE_RATE
+    return frame + b'\x00' * (frame_size - len(frame))  # the rest is ancillary data
+
+
+def make_segment(duration, bitrate):
+    """Return (segment bytes, exact duration in seconds) for a segment of about duration seconds"""
+    frames = max(1, round(duration / FRAME_SECONDS))
+    return mp3_tone_frame(bitrate) * frames, frames * FRAME_SECONDS
+
+
+class HLSOrigin:
+    def __init__(self, host='127.0.0.1', port=0, **settings):
+        self.host = host
+        self.port = port  # 0 picks a free port
+        self.settings = dict(DEFAULT_SETTINGS)
+        self._secret = os.urandom(16)
+        self._stream_ids = itertools.count(1)
+        self._runner = None
+        self.configure(**settings)
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def page_url(self):
+        return f'{self.base_url}/watch'
+
+    def configure(self, **settings):
+        """Change the origin's behaviour and start a new stream with it"""
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        for name, value in settings.items():
+            self.settings[name] = float(value) if name not in ('bitrate', 'window') else int(value)
+        if self.settings['bitrate'] not in MP3_BITRATES:
+            raise ValueError(f"Bitrate must be one of {MP3_BITRATES}")
+
+        self.stream_id = next(self._stream_ids)
+        self.started_at = time.monotonic()
+        self.segment, self.segment_duration = make_segment(self.settings['segment_duration'], self.settings['bitrate'])
+        self.counters = {
+            'pages': 0, 'playlists': 0, 'playlists_not_modified': 0, 'segments': 0, 'segments_cut': 0,
+            'forbidden': 0, 'not_found': 0, 'bytes': 0,
+        }
+        logger.info(f"Stream {self.stream_id}: {self.settings}")
+
+    def make_app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get('/watch', self._page),
+            web.get('/live/{stream}/index.m3u8', self._playlist),
+            web.get('/live/{stream}/{sequence}.mp3', self._segment),
+            web.post('/control/config', self._post_config),
+            web.get('/control/stats', self._get_stats),
+        ])
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"HLS origin listening on {self.base_url}")
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def live_seconds(self, now=None):
+        """Seconds of stream produced so far; stalls don't count"""
+        elapsed = (time.monotonic() if now is None else now) - self.started_at
+        every, stall = self.settings['stall_every'], self.settings['stall_seconds']
+        if every <= 0 or stall <= 0:
+            return elapsed
+        cycles, into_cycle = divmod(elapsed, every + stall)
+        return cycles * every + min(into_cycle, every)
+
+    def newest_sequence(self):
+        # The stream is already a full window old when it starts, so players have segments to begin with
+        return self.settings['window'] - 1 + int(self.live_seconds() / self.segment_duration)
+
+    def signature(self, stream_id, expires):
+        return hmac.new(self._secret, f'{stream_id}:{expires}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def signed_query(self):
+        if self.settings['url_ttl'] <= 0:
+            return ''
+        expires = int(time.time() + self.settings['url_ttl'])
+        return f'?expires={expires}&sig={self.signature(self.stream_id, expires)}'
+
+    def _check_request(self, request):
+        """Raise the HTTP error a request for the current stream should get, if any"""
+        if request.match_info['stream'] != str(self.stream_id):
+            self.counters['not_found'] += 1
+            raise web.HTTPNotFound()
+        if self.settings['url_ttl'] <= 0:
+            return
+        expires = request.query.get('expires', '')
+        signature = request.query.get('sig', '')
+        if (not expires.isdigit() or int(expires) < time.time()
+                or not hmac.compare_digest(signature, self.signature(self.stream_id, expires))):
+            self.counters['forbidden'] += 1
+            raise web.HTTPForbidden(text="URL expired or signature invalid")
+
+    async def _delay(self):
+        delay = self.settings['latency'] + random.uniform(0, self.settings['latency_jitter'])
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _page(self, request):
+        self.counters['pages'] += 1
+        playlist_url = f'{self.base_url}/live/{self.stream_id}/index.m3u8{self.signed_query()}'
+        html = (
+            '<!DOCTYPE html><html><head><title>Synthetic live stream</title></head><body>'
+            f'<video id="player" controls autoplay src="{playlist_url}"></video>'
+            '</body></html>'
+        )
+        return web.Response(text=html, content_type='text/html')
+
+    async def _playlist(self, request):
+        self._check_request(request)
+        await self._delay()
+        newest = self.newest_sequence()
+        first = max(0, newest - self.settings['window'] + 1)
+        etag = f'"{self.stream_id}-{newest}"'
+        if request.headers.get('If-None-Match') == etag:
+            self.counters['playlists_not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+
+        self.counters['playlists'] += 1
+        # Segment URLs carry the playlist's own signature, so they expire with it
+        query = request.query_string
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}',
+            f'#EXT-X-MEDIA-SEQUENCE:{first}',
+        ]
+        for sequence in range(first, newest + 1):
+            lines.append(f'#EXTINF:{self.segment_duration:.3f},')
+            lines.append(f'{sequence}.mp3' + (f'?{query}' if query else ''))
+        return web.Response(
+            text='\n'.join(lines) + '\n',
+            headers={'Content-Type': 'application/vnd.apple.mpegurl', 'ETag': etag, 'Cache-Control': 'no-cache'}
+        )
+
+    async def _segment(self, request):
+        self._check_request(request)
+        try:
+            sequence = int(request.match_info['sequence'])
+        except ValueError:
+            raise web.HTTPNotFound()
+        if sequence < 0 or sequence > self.newest_sequence():
+            self.counters['not_found'] += 1
+            raise web.HTTPNotFound()
+        await self._delay()
+
+        body = self.segment
+        response = web.StreamResponse(headers={'Content-Type': 'audio/mpeg', 'Content-Length': str(len(body))})
+        await response.prepare(request)
+        if random.random() < self.settings['loss']:
+            # The connection dies mid-transfer, so the client gets a truncated body
+            self.counters['segments_cut'] += 1
+            await response.write(body[:len(body) // 2])
+            request.transport.close()
+            return response
+        self.counters['segments'] += 1
+        self.counters['bytes'] += len(body)
+        await response.write(body)
+        await response.write_eof()
+        return response
+
+    def stats(self):
+        return {
+            'stream_id': self.stream_id,
+            'settings': self.settings,
+            'live_seconds': self.live_seconds(),
+            'newest_sequence': self.newest_sequence(),
+            **self.counters,
+        }
+
+    async def _post_config(self, request):
+        try:
+            self.configure(**request.query)
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        return json_response({'page_url': self.page_url, **self.stats()})
+
+    async def _get_stats(self, request):
+        return json_response(self.stats())
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    settings = {name: getattr(args, name) for name in DEFAULT_SETTINGS if getattr(args, name) is not None}
+    origin = await HLSOrigin(port=args.port, **settings).start()
+    # The streaming benchmark reads this line to find the origin
+    print(READY_LINE_PREFIX + origin.base_url, flush=True)
+    logger.info(f"Stream page: {origin.page_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a synthetic live HLS origin")
+    parser.add_argument('--port', type=int, default=8766, help="HTTP port (0 picks a free one)")
+    for name, default in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), help=f"default {default}")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,377 @@
+"""
+Local stand-in for Discord's voice servers, for load testing.
+
+Extends FakeDiscord with any number of guilds, each with one voice channel,
+and a voice gateway plus UDP endpoint that speak enough of the voice protocol
+(IDENTIFY, READY, IP discovery, SELECT_PROTOCOL, SESSION_DESCRIPTION, RESUME,
+heartbeats) for discord.py's VoiceClient to connect and send audio. Every RTP
+packet that arrives is timed, so packet rate, jitter, gaps and losses can be
+reported per stream. The voice websocket of any guild can be dropped on
+demand to measure how long reconnecting takes.
+
+Run it as a separate process so its timing isn't disturbed by the bot under
+test; a small control API serves the stats:
+    GET  /control/stats
+    POST /control/drop?count=N&code=4015
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+import time
+
+from aiohttp import web
+
+from fake_discord import BOT_USER_ID, FakeDiscord, bot_user, json_response
+
+logger = logging.getLogger(__name__)
+
+# Voice gateway opcodes
+VOICE_IDENTIFY = 0
+VOICE_SELECT_PROTOCOL = 1
+VOICE_READY = 2
+VOICE_HEARTBEAT = 3
+VOICE_SESSION_DESCRIPTION = 4
+VOICE_SPEAKING = 5
+VOICE_HEARTBEAT_ACK = 6
+VOICE_RESUME = 7
+VOICE_HELLO = 8
+VOICE_RESUMED = 9
+
+OP_VOICE_STATE_UPDATE = 4  # main gateway
+ENCRYPTION_MODES = ['aead_xchacha20_poly1305_rtpsize', 'xsalsa20_poly1305_lite', 'xsalsa20_poly1305']
+FIRST_GUILD_ID = 200000000000000000
+READY_LINE_PREFIX = 'FAKE_DISCORD_URL '
+RTP_CLOCK_RATE = 48000
+MAX_INTERVAL_MS = 1000  # longer inter-packet gaps are counted in the last histogram bucket
+# RTP header, the 3-byte Opus silence frame, the AEAD tag and the 4-byte nonce; no real audio packet is this small
+SILENCE_PACKET_SIZE = 12 + 3 + 16 + 4
+
+
+class StreamStats:
+    """Running RTP arrival statistics for one SSRC, without keeping every packet"""
+
+    def __init__(self):
+        self.packets = 0
+        self.silent_packets = 0  # Opus silence frames, sent while the bot has no audio to play
+        self.bytes = 0
+        self.first_at = None
+        self.last_at = None
+        self.jitter = 0.0  # RFC 3550 interarrival jitter, seconds
+        self.max_gap = 0.0
+        self.intervals = [0] * (MAX_INTERVAL_MS + 1)  # histogram of inter-arrival times in whole milliseconds
+        self._last_timestamp = None
+        self._first_sequence = None
+        self._highest_sequence = None  # extended past 16-bit wraparound
+
+    def add(self, arrival, sequence, timestamp, size):
+        self.packets += 1
+        if size <= SILENCE_PACKET_SIZE:
+            self.silent_packets += 1
+        self.bytes += size
+        if self.first_at is None:
+            self.first_at = arrival
+            self._first_sequence = self._highest_sequence = sequence
+        else:
+            interval = arrival - self.last_at
+            self.max_gap = max(self.max_gap, interval)
+            self.intervals[min(int(interval * 1000), MAX_INTERVAL_MS)] += 1
+            # Difference between how far apart the packets arrived and how far apart they were sent
+            transit = interval - ((timestamp - self._last_timestamp) & 0xFFFFFFFF) / RTP_CLOCK_RATE
+            self.jitter += (abs(transit) - self.jitter) / 16
+
+            delta = (sequence - self._highest_sequence) & 0xFFFF
+            if delta < 0x8000:
+                self._highest_sequence += delta
+        self.last_at = arrival
+        self._last_timestamp = timestamp
+
+    @property
+    def lost(self):
+        if self._first_sequence is None:
+            return 0
+        return max(self._highest_sequence - self._first_sequence + 1 - self.packets, 0)
+
+    def percentile_interval(self, fraction):
+        """Inter-arrival time in milliseconds that this fraction of packets arrived within"""
+        total = sum(self.intervals)
+        if not total:
+            return None
+        running = 0
+        for milliseconds, count in enumerate(self.intervals):
+            running += count
+            if running >= total * fraction:
+                return milliseconds
+        return MAX_INTERVAL_MS
+
+    def to_dict(self):
+        duration = (self.last_at - self.first_at) if self.packets > 1 else 0
+        return {
+            'packets': self.packets,
+            'audio_packets': self.packets - self.silent_packets,
+            'silent_packets': self.silent_packets,
+            'bytes': self.bytes,
+            'duration': duration,
+            'packets_per_second': (self.packets - 1) / duration if duration else 0,
+            'jitter_ms': self.jitter * 1000,
+            'interval_p50_ms': self.percentile_interval(0.5),
+            'interval_p99_ms': self.percentile_interval(0.99),
+            'max_gap_ms': self.max_gap * 1000,
+            'lost': self.lost,
+        }
+
+
+class VoiceUDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        arrival = time.perf_counter()
+        if len(data) == 74 and data[:2] == b'\x00\x01':
+            # IP discovery: echo the address the packet came from
+            ssrc = struct.unpack_from('>I', data, 4)[0]
+            reply = bytearray(74)
+            struct.pack_into('>HHI', reply, 0, 2, 70, ssrc)
+            ip = address[0].encode('ascii')
+            reply[8:8 + len(ip)] = ip
+            struct.pack_into('>H', reply, 72, address[1])
+            self.transport.sendto(bytes(reply), address)
+        elif len(data) >= 12 and data[0] & 0xC0 == 0x80:
+            sequence, timestamp, ssrc = struct.unpack_from('>HII', data, 2)
+            self.server.record_packet(ssrc, arrival, sequence, timestamp, len(data))
+
+
+class VoiceSession:
+    """One guild's voice connection as seen by the fake voice server"""
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.ssrc = None
+        self.ws = None
+        self.requested_at = None  # when the bot asked to join, through the main gateway
+        self.connected_at = None  # when the first SESSION_DESCRIPTION went out
+        self.connects = 0
+        self.resumes = 0
+        self.dropped_at = None
+        self.reconnect_times = []  # seconds from a dropped websocket to the next session description
+        self.stream = StreamStats()
+
+
+class FakeVoiceDiscord(FakeDiscord):
+    def __init__(self, guilds=1, **kwargs):
+        super().__init__(**kwargs)
+        self.guild_ids = [str(FIRST_GUILD_ID + index * 10) for index in range(guilds)]
+        self.voice = {}  # guild id -> VoiceSession
+        self._by_ssrc = {}
+        self._ssrcs = itertools.count(1000)
+        self._udp = None
+
+    def make_app(self):
+        app = super().make_app()
+        app.add_routes([
+            web.get('/voice/', self._voice_gateway),
+            web.get('/control/stats', self._get_stats),
+            web.post('/control/drop', self._post_drop),
+        ])
+        return app
+
+    async def start(self):
+        await super().start()
+        loop = asyncio.get_running_loop()
+        self._udp, _ = await loop.create_datagram_endpoint(lambda: VoiceUDPProtocol(self), local_addr=(self.host, 0))
+        logger.info(f"Fake voice UDP endpoint on port {self.udp_port}, {len(self.guild_ids)} guild(s)")
+        return self
+
+    async def stop(self):
+        if self._udp is not None:
+            self._udp.close()
+        await super().stop()
+
+    @property
+    def udp_port(self):
+        return self._udp.get_extra_info('sockname')[1]
+
+    def guild_payload(self, guild_id):
+        channel_id = str(int(guild_id) + 1)
+        return {
+            'id': guild_id,
+            'name': f'Load test {guild_id}',
+            'unavailable': False,
+            'member_count': 1,
+            'owner_id': str(int(guild_id) + 2),
+            'features': [],
+            'emojis': [],
+            'stickers': [],
+            'threads': [],
+            'voice_states': [],
+            'roles': [{
+                'id': guild_id, 'name': '@everyone', 'permissions': str(3238400 | 0x400 | 0x800),
+                'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False,
+            }],
+            'members': [self.member_payload()],
+            'channels': [{
+                'id': channel_id, 'type': 2, 'name': 'Load test voice', 'guild_id': guild_id, 'position': 0,
+                'permission_overwrites': [], 'bitrate': 64000, 'user_limit': 0, 'parent_id': None,
+                'rtc_region': None, 'nsfw': False,
+            }],
+        }
+
+    def member_payload(self):
+        return {
+            'user': bot_user(), 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00',
+            'deaf': False, 'mute': False, 'flags': 0,
+        }
+
+    def ready_payload(self, session_id):
+        payload = super().ready_payload(session_id)
+        # Like Discord: guilds are unavailable in READY and arrive as GUILD_CREATE events afterwards
+        payload['guilds'] = [{'id': guild_id, 'unavailable': True} for guild_id in self.guild_ids]
+        return payload
+
+    async def after_ready(self, ws, session):
+        for guild_id in self.guild_ids:
+            await self.dispatch(ws, session, 'GUILD_CREATE', self.guild_payload(guild_id))
+
+    async def handle_op(self, ws, session, op, data):
+        if op != OP_VOICE_STATE_UPDATE:
+            return
+        guild_id = str(data['guild_id'])  # discord.py sends it as an int
+        channel_id = data.get('channel_id')
+        voice = self.voice.setdefault(guild_id, VoiceSession(guild_id))
+        if channel_id is not None:
+            voice.requested_at = voice.requested_at or time.perf_counter()
+            # The server update goes first, so discord.py's resume path sees both updates
+            await self.dispatch(ws, session, 'VOICE_SERVER_UPDATE', {
+                'token': f'voice-{guild_id}',
+                'guild_id': guild_id,
+                'endpoint': f'{self.host}:{self.port}/voice',
+            })
+        await self.dispatch(ws, session, 'VOICE_STATE_UPDATE', {
+            'guild_id': guild_id,
+            'channel_id': channel_id,
+            'user_id': BOT_USER_ID,
+            'session_id': session['id'],
+            'deaf': False,
+            'mute': False,
+            'self_deaf': data.get('self_deaf', False),
+            'self_mute': data.get('self_mute', False),
+            'self_video': False,
+            'suppress': False,
+            'member': self.member_payload(),
+        })
+
+    def record_packet(self, ssrc, arrival, sequence, timestamp, size):
+        voice = self._by_ssrc.get(ssrc)
+        if voice is not None:
+            voice.stream.add(arrival, sequence, timestamp, size)
+
+    async def _voice_gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({'op': VOICE_HELLO, 'd': {'heartbeat_interval': 13750}}))
+        voice = None
+        async for message in ws:
+            if message.type != web.WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            op, data = payload.get('op'), payload.get('d')
+            if op == VOICE_HEARTBEAT:
+                nonce = data.get('t') if isinstance(data, dict) else data
+                await ws.send_str(json.dumps({'op': VOICE_HEARTBEAT_ACK, 'd': {'t': nonce}}))
+            elif op == VOICE_IDENTIFY:
+                guild_id = str(data['server_id'])
+                voice = self.voice.setdefault(guild_id, VoiceSession(guild_id))
+                voice.ws = ws
+                voice.ssrc = next(self._ssrcs)
+                self._by_ssrc[voice.ssrc] = voice
+                await ws.send_str(json.dumps({'op': VOICE_READY, 'd': {
+                    'ssrc': voice.ssrc, 'ip': self.host, 'port': self.udp_port, 'modes': ENCRYPTION_MODES,
+                }}))
+            elif op == VOICE_SELECT_PROTOCOL and voice is not None:
+                await self._send_session_description(ws, voice, data['data']['mode'])
+            elif op == VOICE_RESUME:
+                voice = self.voice.get(str(data['server_id']))
+                if voice is None:
+                    await ws.close(code=4006)
+                    break
+                voice.ws = ws
+                voice.resumes += 1
+                await ws.send_str(json.dumps({'op': VOICE_RESUMED, 'd': None}))
+                # discord.py waits for a secret key on every new voice websocket, resumed or not
+                await self._send_session_description(ws, voice, ENCRYPTION_MODES[0])
+        return ws
+
+    async def _send_session_description(self, ws, voice, mode):
+        await ws.send_str(json.dumps({'op': VOICE_SESSION_DESCRIPTION, 'd': {
+            'mode': mode, 'secret_key': list(os.urandom(32)), 'dave_protocol_version': 0,
+        }}))
+        now = time.perf_counter()
+        voice.connects += 1
+        if voice.connected_at is None:
+            voice.connected_at = now
+        if voice.dropped_at is not None:
+            voice.reconnect_times.append(now - voice.dropped_at)
+            voice.dropped_at = None
+
+    async def drop(self, count, code=4015):
+        """Close the voice websocket of up to count connected guilds; returns how many were dropped"""
+        dropped = 0
+        for voice in list(self.voice.values()):
+            if dropped >= count:
+                break
+            if voice.ws is not None and not voice.ws.closed:
+                voice.dropped_at = time.perf_counter()
+                await voice.ws.close(code=code)
+                dropped += 1
+        logger.info(f"Dropped {dropped} voice connection(s) with close code {code}")
+        return dropped
+
+    def stats(self):
+        guilds = []
+        for voice in self.voice.values():
+            guilds.append({
+                'guild_id': voice.guild_id,
+                'ssrc': voice.ssrc,
+                'connect_seconds': (voice.connected_at - voice.requested_at)
+                                   if voice.connected_at and voice.requested_at else None,
+                'connects': voice.connects,
+                'resumes': voice.resumes,
+                'reconnect_seconds': voice.reconnect_times,
+                'still_reconnecting': voice.dropped_at is not None,
+                **voice.stream.to_dict(),
+            })
+        return {'guilds': guilds, 'gateway_sessions': len(self.sessions)}
+
+    async def _get_stats(self, request):
+        return json_response(self.stats())
+
+    async def _post_drop(self, request):
+        count = int(request.query.get('count', 1))
+        code = int(request.query.get('code', 4015))
+        return json_response({'dropped': await self.drop(count, code)})
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = await FakeVoiceDiscord(guilds=args.guilds, port=args.port).start()
+    # The load test reads this line to find the server
+    print(READY_LINE_PREFIX + server.base_url, flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a fake Discord API, gateway and voice server")
+    parser.add_argument('--guilds', type=int, default=1, help="guilds, each with one voice channel")
+    parser.add_argument('--port', type=int, default=8765, help="HTTP/websocket port (0 picks a free one)")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
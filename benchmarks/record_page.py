@@ -0,0 +1,120 @@
+"""
+Record a live player page into the extraction corpus.
+
+Fetches the page with the extractor's own headers, follows its iframes the
+way the extractor does (with MediaScanner, up to --depth), and stores every
+page it fetched under extraction_corpus/pages/<host>/<path>. Absolute and
+protocol-relative links to the recorded hosts and to the media hosts found are
+rewritten to {{ORIGIN}}/<host>/..., so the replay server serves the whole
+chain locally. A case for the page is added to corpus.json; its expected URL
+is whatever the scanner finds today, so check it by hand before relying on it.
+
+Usage:
+    python benchmarks/record_page.py https://veplay.top/stream/... --name veplay
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from urllib.parse import urlparse
+
+import aiohttp
+
+from replay_server import CORPUS_DIR, page_path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from media_scanner import MediaScanner  # noqa: E402
+from stream_extractor import PAGE_HEADERS  # noqa: E402
+
+
+def host_path(url):
+    """'https://host/a/b?c' -> 'host/a/b'"""
+    parsed = urlparse(url)
+    return parsed.netloc + (parsed.path or '/')
+
+
+async def fetch_pages(url, depth, max_pages, timeout):
+    """Fetch a page and its iframes breadth first; returns ({url: html}, media URLs found)"""
+    pages = {}
+    media = []
+    queue = [(url, 0)]
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(timeout=client_timeout) as session:
+        while queue and len(pages) < max_pages:
+            page_url, page_depth = queue.pop(0)
+            if page_url in pages:
+                continue
+            try:
+                async with session.get(page_url, headers=PAGE_HEADERS) as response:
+                    response.raise_for_status()
+                    html = await response.text(errors='replace')
+            except Exception as e:
+                print(f"  could not fetch {page_url}: {e}")
+                continue
+            pages[page_url] = html
+            print(f"  recorded {page_url} ({len(html) // 1024} KB)")
+
+            scanner = MediaScanner(page_url, max_iframes=8)
+            scanner.feed(html, final=True)
+            for found in [scanner.best] + scanner.candidates:
+                if found and found not in media:
+                    media.append(found)
+            if page_depth < depth:
+                queue.extend((iframe_url, page_depth + 1) for iframe_url in scanner.iframes)
+    return pages, media
+
+
+def rewrite(text, hosts):
+    """Point links to the recorded hosts at the replay server"""
+    for host in hosts:
+        text = re.sub(r'(?:https?:)?//' + re.escape(host) + r'(?=[/"\'\s?#]|$)', '{{ORIGIN}}/' + host, text)
+    return text
+
+
+def record(url, name, depth, max_pages, timeout, corpus_dir, notes):
+    pages, media = asyncio.run(fetch_pages(url, depth, max_pages, timeout))
+    if url not in pages:
+        sys.exit(f"Could not record {url}")
+
+    hosts = sorted({urlparse(page_url).netloc for page_url in pages} | {urlparse(found).netloc for found in media},
+                   key=len, reverse=True)  # longest first, so a host isn't rewritten inside a longer one
+    for page_url, html in pages.items():
+        path = os.path.join(corpus_dir, 'pages', page_path(host_path(page_url)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(rewrite(html, hosts))
+
+    manifest_path = os.path.join(corpus_dir, 'corpus.json')
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    case = {
+        'name': name,
+        'page': host_path(url).rstrip('/'),
+        'expected': [rewrite(found, hosts) for found in media[:1]],
+        'notes': notes or f"Recorded from {url}; expected URL not checked yet",
+    }
+    manifest['cases'] = [existing for existing in manifest['cases'] if existing['name'] != name] + [case]
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    print(f"Recorded {len(pages)} page(s) as case {name!r}, expected: {case['expected'] or 'nothing'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a player page and its iframes into the extraction corpus")
+    parser.add_argument('url', help="page to record")
+    parser.add_argument('--name', required=True, help="case name in corpus.json (replaces a case with the same name)")
+    parser.add_argument('--depth', type=int, default=3, help="iframe levels to follow")
+    parser.add_argument('--max-pages', type=int, default=12, help="most pages to record")
+    parser.add_argument('--timeout', type=float, default=15, help="seconds per request")
+    parser.add_argument('--corpus', default=CORPUS_DIR, help="corpus directory")
+    parser.add_argument('--notes', help="description of the case")
+    args = parser.parse_args()
+    record(args.url, args.name, args.depth, args.max_pages, args.timeout, args.corpus, args.notes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Replay server for the recorded extraction corpus.
+
+Serves the pages in benchmarks/extraction_corpus/pages over HTTP, so the
+extractor can be run against recorded player pages without the network. A
+page recorded from https://host/path is stored as pages/host/path and served
+at /host/path; query strings are ignored. Recorded pages refer to each other
+and to their media through {{ORIGIN}}, which is replaced with this server's
+address, and {{PADDING:n}} expands to n KB of inline script, so large pages
+don't have to be stored as large files.
+
+Media URLs that weren't recorded (.m3u8, .mp4, .mp3) get a small synthetic
+answer, so yt-dlp's format probing and the candidate ranking have something to
+fetch. Everything else that isn't in the corpus is a 404.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extraction_corpus')
+READY_LINE_PREFIX = 'REPLAY_URL '
+
+PADDING_PATTERN = re.compile(r'\{\{PADDING:(\d+)\}\}')
+CONTENT_TYPES = {
+    '.html': 'text/html', '.htm': 'text/html', '.js': 'application/javascript', '.json': 'application/json',
+    '.m3u8': 'application/vnd.apple.mpegurl', '.mp4': 'video/mp4', '.mp3': 'audio/mpeg',
+}
+
+# Served for playlists that weren't recorded: a short live window of segments
+SYNTHETIC_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:100
+#EXTINF:6.000,
+segment100.ts
+#EXTINF:6.000,
+segment101.ts
+#EXTINF:6.000,
+segment102.ts
+"""
+SYNTHETIC_MEDIA_BYTES = 256 * 1024
+
+
+def page_path(path):
+    """Where a page is stored under pages/, from its host/path ("player.example/watch" -> "player.example/watch/index.html")"""
+    path = path.split('?', 1)[0].split('#', 1)[0].strip('/')
+    if '/' not in path or '.' not in path.rsplit('/', 1)[1]:
+        path += '/index.html'
+    return path
+
+
+def padding_script(kilobytes):
+    """Inline script of about kilobytes KB, like the bundled player code real pages carry"""
+    line = 'var _p{0}=function(a,b){{return (a*{0}+b)%65521}};\n'
+    chunks = ['<script>\n']
+    size = 0
+    index = 0
+    while size < kilobytes * 1024:
+        text = line.format(index)
+        chunks.append(text)
+        size += len(text)
+        index += 1
+    chunks.append('</script>')
+    return ''.join(chunks)
+
+
+class ReplayServer:
+    def __init__(self, corpus_dir=CORPUS_DIR, host='127.0.0.1', port=0, latency=0.0):
+        self.pages_dir = os.path.join(corpus_dir, 'pages')
+        self.host = host
+        self.port = port  # 0 picks a free port
+        self.latency = latency  # seconds added to every response, roughly a network round trip
+        self.requests = 0
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def make_app(self):
+        app = web.Application()
+        app.add_routes([web.get('/{path:.*}', self._serve)])
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Replaying {self.pages_dir} on {self.base_url}")
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def file_for(self, path):
+        """Return the corpus file for a request path, or None"""
+        full_path = os.path.normpath(os.path.join(self.pages_dir, page_path(path)))
+        if not full_path.startswith(self.pages_dir + os.sep) or not os.path.isfile(full_path):
+            return None
+        return full_path
+
+    def render(self, text):
+        text = text.replace('{{ORIGIN}}', self.base_url)
+        return PADDING_PATTERN.sub(lambda match: padding_script(int(match.group(1))), text)
+
+    async def _serve(self, request):
+        self.requests += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        path = request.match_info['path']
+        extension = os.path.splitext(page_path(path))[1].lower()
+        content_type = CONTENT_TYPES.get(extension, 'application/octet-stream')
+
+        file_path = self.file_for(path)
+        if file_path is not None:
+            if content_type.startswith('text/') or extension in ('.js', '.json', '.m3u8'):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    return web.Response(text=self.render(f.read()), content_type=content_type)
+            return web.FileResponse(file_path)
+
+        if extension == '.m3u8':
+            return web.Response(text=SYNTHETIC_PLAYLIST, content_type=content_type)
+        if extension in ('.mp4', '.mp3', '.ts'):
+            body = random.Random(path).randbytes(SYNTHETIC_MEDIA_BYTES)
+            range_header = request.headers.get('Range', '')
+            match = re.match(r'bytes=(\d+)-(\d*)$', range_header)
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else len(body) - 1
+                return web.Response(body=body[start:end + 1], status=206, content_type=content_type, headers={
+                    'Content-Range': f'bytes {start}-{min(end, len(body) - 1)}/{len(body)}',
+                })
+            return web.Response(body=body, content_type=content_type)
+        raise web.HTTPNotFound()
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = await ReplayServer(args.corpus, port=args.port, latency=args.latency).start()
+    # The extraction benchmark reads this line to find the server
+    print(READY_LINE_PREFIX + server.base_url, flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the recorded extraction corpus")
+    parser.add_argument('--corpus', default=CORPUS_DIR, help="corpus directory (with pages/ inside)")
+    parser.add_argument('--port', type=int, default=8767, help="HTTP port (0 picks a free one)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,199 @@
+"""
+Startup benchmark for the bot entry points.
+
+Starts each entry point in a fresh Python process against a local FakeDiscord
+server and measures:
+  - import time of each of its direct dependencies (from python -X importtime)
+  - construction time: running the entry module's own top-level code
+  - time until the gateway READY arrives (on_connect) and until on_ready
+  - wall time from spawning the process to on_ready
+
+Usage:
+    python benchmarks/startup_benchmark.py                      # all entry points, 3 runs each
+    python benchmarks/startup_benchmark.py direct_stream_bot --runs 5
+    python benchmarks/startup_benchmark.py --save baseline.json
+    python benchmarks/startup_benchmark.py --compare baseline.json --tolerance 0.2
+
+With --compare the exit code is 1 if any entry point got slower than the
+baseline by more than the tolerance, so it can gate a deploy.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+from fake_discord import FakeDiscord, write_bot_config
+from startup_child import RESULT_PREFIX
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINTS = ['direct_stream_bot', 'final_solution', 'fixed_bot', 'improved_bot', 'bot']
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+# Metrics compared against a baseline
+METRICS = ['import_seconds', 'construct_seconds', 'connect_seconds', 'ready_seconds', 'wall_seconds']
+
+
+def parse_import_times(stderr, entry):
+    """Return (seconds in the entry module's own code, {direct dependency: cumulative seconds})"""
+    lines = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            lines.append((len(indent) // 2, name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+
+    # -X importtime prints a module after everything it imported, one level deeper
+    for index, (depth, name, self_seconds, _) in enumerate(lines):
+        if name == entry:
+            dependencies = {}
+            for child_depth, child, _, cumulative in reversed(lines[:index]):
+                if child_depth <= depth:
+                    break
+                if child_depth == depth + 1:
+                    dependencies[child] = cumulative
+            return self_seconds, dependencies
+    return None, {}
+
+
+async def run_once(entry, server, config_dir, timeout):
+    spawned_wall = time.time()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-X', 'importtime', os.path.join(BENCHMARKS_DIR, 'startup_child.py'),
+        entry, server.base_url, config_dir,
+        cwd=config_dir,  # cache and stats files the bots write go to the temporary directory
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return {'entry': entry, 'error': f"timed out after {timeout} seconds"}
+
+    result = None
+    for line in stdout.decode(errors='replace').splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+    if result is None:
+        tail = stderr.decode(errors='replace').strip().splitlines()[-3:]
+        return {'entry': entry, 'error': f"exited with code {process.returncode}: {' / '.join(tail)}"}
+
+    result['construct_seconds'], result['dependencies'] = parse_import_times(stderr.decode(errors='replace'), entry)
+    if 'ready_wall' in result:
+        result['wall_seconds'] = result['ready_wall'] - spawned_wall
+        result['interpreter_seconds'] = result['started_wall'] - spawned_wall
+    return result
+
+
+def summarize(runs):
+    """Median of each metric over the successful runs"""
+    good = [run for run in runs if 'error' not in run and 'ready_seconds' in run]
+    summary = {'runs': len(runs), 'failures': len(runs) - len(good)}
+    if not good:
+        summary['error'] = runs[-1].get('error', 'never became ready')
+        return summary
+    for metric in METRICS + ['interpreter_seconds']:
+        values = [run[metric] for run in good if run.get(metric) is not None]
+        if values:
+            summary[metric] = statistics.median(values)
+    dependencies = {}
+    for run in good:
+        for name, seconds in run['dependencies'].items():
+            dependencies.setdefault(name, []).append(seconds)
+    summary['dependencies'] = {name: statistics.median(values) for name, values in dependencies.items()}
+    return summary
+
+
+def print_report(results, top_dependencies):
+    print()
+    print(f"{'entry point':<20} {'import':>8} {'construct':>10} {'READY':>8} {'on_ready':>9} {'wall':>8}")
+    for entry, summary in results.items():
+        if 'error' in summary:
+            print(f"{entry:<20} failed: {summary['error']}")
+            continue
+        print(f"{entry:<20} {summary['import_seconds']:>7.2f}s {summary.get('construct_seconds', 0):>9.3f}s "
+              f"{summary['connect_seconds']:>7.2f}s {summary['ready_seconds']:>8.2f}s {summary['wall_seconds']:>7.2f}s")
+    print("\n(READY and on_ready are measured from process start; on_ready includes discord.py's wait for guilds)")
+
+    for entry, summary in results.items():
+        dependencies = sorted(summary.get('dependencies', {}).items(), key=lambda item: item[1], reverse=True)
+        if dependencies:
+            slowest = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in dependencies[:top_dependencies])
+            print(f"  {entry} slowest imports: {slowest}")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a saved baseline; returns the regressions"""
+    regressions = []
+    print(f"\nCompared with baseline (tolerance {tolerance:.0%}):")
+    for entry, summary in results.items():
+        before = baseline.get(entry)
+        if not before or 'error' in before or 'error' in summary:
+            continue
+        for metric in METRICS:
+            if metric not in before or metric not in summary:
+                continue
+            old, new = before[metric], summary[metric]
+            change = (new - old) / old if old else 0
+            flag = ''
+            # Ignore tiny absolute changes, they are noise
+            if change > tolerance and new - old > 0.05:
+                flag = '  <-- regression'
+                regressions.append((entry, metric, old, new))
+            print(f"  {entry:<20} {metric:<18} {old:>7.3f}s -> {new:>7.3f}s ({change:+.0%}){flag}")
+    return regressions
+
+
+async def run_benchmark(entries, runs, timeout):
+    server = await FakeDiscord().start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix='startup-bench-') as config_dir:
+            write_bot_config(config_dir, STREAM_URL=f'{server.base_url}/stream')
+            for entry in entries:
+                entry_runs = []
+                for attempt in range(runs):
+                    result = await run_once(entry, server, config_dir, timeout)
+                    entry_runs.append(result)
+                    status = result.get('error') or f"ready in {result['wall_seconds']:.2f}s"
+                    print(f"{entry} run {attempt + 1}/{runs}: {status}")
+                results[entry] = summarize(entry_runs)
+    finally:
+        await server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long each bot entry point takes to start")
+    parser.add_argument('entries', nargs='*', default=ENTRY_POINTS, help="entry point modules to benchmark")
+    parser.add_argument('--runs', type=int, default=3, help="runs per entry point; the median is reported")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds before a run is abandoned")
+    parser.add_argument('--top', type=int, default=5, help="slowest dependencies to list per entry point")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file from an earlier --save")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args.entries, args.runs, args.timeout))
+    print_report(results, args.top)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Child process for startup_benchmark.py: imports one bot entry point, logs it
+in to a FakeDiscord server and prints its timings as one JSON line.
+
+Only the standard library is imported before the entry point, so the entry
+point pays for all of its own dependencies, as it would when started for real.
+"""
+
+import time
+PROCESS_STARTED = time.perf_counter()
+
+import json
+import os
+import sys
+
+RESULT_PREFIX = 'STARTUP_RESULT '
+
+
+def main(entry, discord_url, config_dir):
+    benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [config_dir, os.path.dirname(benchmarks_dir), benchmarks_dir]
+    result = {'entry': entry, 'started_wall': time.time() - (time.perf_counter() - PROCESS_STARTED)}
+
+    import_started = time.perf_counter()
+    # __import__ goes through the import machinery that -X importtime reports on, importlib doesn't
+    module = __import__(entry)
+    result['import_seconds'] = time.perf_counter() - import_started
+
+    from fake_discord import patch_discord
+    patch_discord(discord_url)
+    bot = module.bot
+
+    async def on_connect():
+        result.setdefault('connect_seconds', time.perf_counter() - PROCESS_STARTED)
+
+    async def on_ready():
+        if 'ready_seconds' not in result:
+            result['ready_seconds'] = time.perf_counter() - PROCESS_STARTED
+            result['ready_wall'] = time.time()
+            await bot.close()
+
+    bot.add_listener(on_connect, 'on_connect')
+    bot.add_listener(on_ready, 'on_ready')
+    try:
+        bot.run(module.BOT_TOKEN, log_handler=None)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:4])
@@ -0,0 +1,232 @@
+"""
+Streaming benchmark for the Direct Stream Bot, against a synthetic HLS origin.
+
+Starts benchmarks/fake_hls.py and benchmarks/fake_voice.py (one guild) in
+their own processes, then runs direct_stream_bot in this process with
+STREAM_URL set to the origin's stream page. For each scenario the origin is
+reconfigured to misbehave in one way, the bot's cached stream URL is dropped,
+and the bot extracts and plays the stream exactly as !join does while the
+audio it delivers is sampled every 50 ms. For each scenario this reports:
+  - time to first audio, from starting the stream (extraction included)
+  - rebuffers: gaps in the audio longer than --rebuffer-threshold once it had started
+  - recovery time: how long each of those gaps lasted before audio came back
+  - the bot's own recoveries and jitter buffer underruns, and what the origin served
+
+Usage:
+    python benchmarks/streaming_benchmark.py                    # every scenario, 60 seconds each
+    python benchmarks/streaming_benchmark.py lossy expiring-urls --duration 90
+    python benchmarks/streaming_benchmark.py --segment-duration 6 --save results.json
+
+FFmpeg must be installed.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+
+from fake_hls import DEFAULT_SETTINGS, READY_LINE_PREFIX
+from voice_load_test import control, distribution, spawn_server, start_bot, start_fake_server, stop_bot
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.05  # seconds between audio samples
+
+# Origin settings for each scenario, on top of DEFAULT_SETTINGS
+SCENARIOS = {
+    'clean': {},
+    'slow-origin': {'latency': 0.8, 'latency_jitter': 0.8},
+    'lossy': {'loss': 0.1},
+    'stalls': {'stall_every': 20, 'stall_seconds': 8},
+    'expiring-urls': {'url_ttl': 30},
+}
+
+
+class AudioMonitor:
+    """Samples a session's audio delivery: when audio first arrived and every gap after that"""
+
+    def __init__(self, session, threshold):
+        self.session = session
+        self.threshold = threshold  # seconds without audio that count as a rebuffer
+        self.started_at = time.monotonic()
+        self.first_audio_at = None
+        self.last_audio_at = None
+        self.gap_started_at = None
+        self.gaps = []  # seconds each rebuffer lasted until audio came back
+
+    def sample(self, now=None):
+        now = time.monotonic() if now is None else now
+        # The playback (and so the instrumented source) is replaced whenever the bot recovers
+        source = self.session.audio_source
+        if source is None or source.created_at < self.started_at:
+            # Still the previous scenario's playback
+            return
+        last_audio = source.last_audio_at
+        if last_audio is not None and (self.last_audio_at is None or last_audio > self.last_audio_at):
+            if self.first_audio_at is None:
+                self.first_audio_at = source.first_audio_at
+            elif self.gap_started_at is not None:
+                self.gaps.append(now - self.gap_started_at)
+                self.gap_started_at = None
+            self.last_audio_at = last_audio
+        elif self.gap_started_at is None and self.last_audio_at is not None:
+            if now - self.last_audio_at > self.threshold:
+                self.gap_started_at = self.last_audio_at
+
+    def unrecovered_seconds(self, now=None):
+        """How long the audio had been gone at the end, if it never came back"""
+        if self.gap_started_at is None:
+            return None
+        return (time.monotonic() if now is None else now) - self.gap_started_at
+
+
+async def run_scenario(module, session, origin_url, name, args):
+    settings = {
+        **DEFAULT_SETTINGS,
+        'segment_duration': args.segment_duration,
+        'bitrate': args.bitrate,
+        **SCENARIOS[name],
+    }
+    await control(origin_url, 'POST', 'config', **settings)
+    # Every scenario starts from a cold extraction of a new stream
+    module.sessions.url_cache.invalidate(module.STREAM_URL)
+
+    extractions = []
+    extract = session.extract_direct_stream_url
+
+    async def timed_extract(page_url, force_refresh=False):
+        started = time.monotonic()
+        try:
+            return await extract(page_url, force_refresh=force_refresh)
+        finally:
+            extractions.append(time.monotonic() - started)
+
+    session.extract_direct_stream_url = timed_extract
+    recoveries_before = session.recovery_count
+
+    async def start():
+        async with session.lock:
+            return await session.start_streaming()
+
+    monitor = AudioMonitor(session, args.rebuffer_threshold)
+    started = monitor.started_at
+    start_task = asyncio.create_task(start())
+    try:
+        while time.monotonic() - started < args.duration:
+            monitor.sample()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+        streaming = await start_task
+        jitter_buffer = session._jitter_buffer()
+        underruns = jitter_buffer.underruns if jitter_buffer else None
+        async with session.lock:
+            await session.stop_streaming()
+    finally:
+        del session.extract_direct_stream_url
+
+    return {
+        'scenario': name,
+        'settings': settings,
+        'started': streaming,
+        'first_audio_seconds': monitor.first_audio_at - started if monitor.first_audio_at else None,
+        'extraction_seconds': extractions,
+        'rebuffers': len(monitor.gaps) + (1 if monitor.gap_started_at is not None else 0),
+        'recovery_seconds': monitor.gaps,
+        'unrecovered_seconds': monitor.unrecovered_seconds(),
+        'bot_recoveries': session.recovery_count - recoveries_before,
+        'jitter_underruns': underruns,
+        'origin': await control(origin_url, 'GET', 'stats'),
+    }
+
+
+def print_report(results):
+    print()
+    print(f"{'scenario':<15} {'first audio':>11} {'rebuffers':>9} {'rebuffered':>10} {'recoveries':>10} "
+          f"{'403s':>5} {'cut':>4}")
+    for result in results:
+        first_audio = result['first_audio_seconds']
+        rebuffered = sum(result['recovery_seconds']) + (result['unrecovered_seconds'] or 0)
+        origin = result['origin']
+        print(f"{result['scenario']:<15} {f'{first_audio:.2f}s' if first_audio is not None else 'never':>11} "
+              f"{result['rebuffers']:>9} {rebuffered:>9.1f}s {result['bot_recoveries']:>10} "
+              f"{origin['forbidden']:>5} {origin['segments_cut']:>4}")
+
+    for result in results:
+        details = []
+        if result['extraction_seconds']:
+            details.append(f"extraction {distribution(result['extraction_seconds'], 's')}")
+        if result['recovery_seconds']:
+            details.append(f"recovery {distribution(result['recovery_seconds'], 's')}")
+        if result['unrecovered_seconds'] is not None:
+            details.append(f"silent for the last {result['unrecovered_seconds']:.1f}s")
+        if result['jitter_underruns']:
+            details.append(f"{result['jitter_underruns']} jitter buffer underrun(s)")
+        if not result['started']:
+            details.append("start_streaming failed")
+        if details:
+            print(f"  {result['scenario']}: {', '.join(details)}")
+
+
+async def run_benchmark(args):
+    origin, origin_url = await spawn_server('fake_hls.py', READY_LINE_PREFIX, '--port', '0', verbose=args.verbose)
+    fake, base_url = await start_fake_server(1, args.verbose)
+    module = runner = None
+    results = []
+    try:
+        module, runner = await start_bot(base_url, tempfile.mkdtemp(prefix='streaming-bench-'),
+                                         STREAM_URL=f'{origin_url}/watch', STARTUP_BUDGET=60,
+                                         STREAM_URL_CACHE_FILE=None)
+        guild = module.bot.guilds[0]
+        session = module.sessions.get(guild)
+        if not await session.connect_to_voice_with_retry(guild.voice_channels[0]):
+            raise RuntimeError("Couldn't connect to the fake voice server")
+
+        for name in args.scenarios:
+            logger.info(f"Scenario {name}: {args.duration:.0f} seconds")
+            result = await run_scenario(module, session, origin_url, name, args)
+            results.append(result)
+            first_audio = result['first_audio_seconds']
+            logger.info(f"Scenario {name}: first audio "
+                        f"{f'after {first_audio:.2f}s' if first_audio is not None else 'never arrived'}, "
+                        f"{result['rebuffers']} rebuffer(s)")
+    finally:
+        if runner is not None:
+            await stop_bot(module, runner)
+        for process in (fake, origin):
+            process.terminate()
+            await process.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DirectStreamBot's extraction and playback against a synthetic HLS origin")
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS),
+                        help=f"scenarios to run, in order (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to play each scenario")
+    parser.add_argument('--segment-duration', type=float, default=DEFAULT_SETTINGS['segment_duration'],
+                        help="HLS segment length in seconds")
+    parser.add_argument('--bitrate', type=int, default=DEFAULT_SETTINGS['bitrate'], help="segment audio bitrate, kbps")
+    parser.add_argument('--rebuffer-threshold', type=float, default=0.25,
+                        help="seconds without audio that count as a rebuffer")
+    parser.add_argument('--save', help="write the full results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's and the servers' log output")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
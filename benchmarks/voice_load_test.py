@@ -0,0 +1,261 @@
+"""
+Voice load test for the Direct Stream Bot, against a local fake Discord.
+
+Starts benchmarks/fake_voice.py in its own process with the requested number
+of guilds, then runs direct_stream_bot in this process, pointed at it. The
+bot joins the voice channel of every guild and streams, exactly as !join
+does. Partway through, some voice connections are dropped so the bot has to
+reconnect. At the end this reports:
+  - join time per guild (voice connect plus stream start)
+  - CPU used by the bot and its FFmpeg processes, in total and per stream
+  - packets per second, jitter, inter-packet gaps and losses as the voice
+    server received them
+  - voice reconnect times
+
+Usage, with the synthetic origin from benchmarks/fake_hls.py (python benchmarks/fake_hls.py):
+    python benchmarks/voice_load_test.py --stream-url http://127.0.0.1:8766/live/1/index.m3u8 --guilds 100
+    python benchmarks/voice_load_test.py --stream-url http://127.0.0.1:8766/watch --guilds 20
+or with a local file:
+    python benchmarks/voice_load_test.py --stream-url ./sample.mp3 --guilds 20 --duration 60 --drop 5
+
+FFmpeg must be installed, and the stream URL must be reachable from this machine.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aiohttp
+import psutil
+
+from fake_discord import REPO_DIR, patch_discord, write_bot_config
+from fake_voice import READY_LINE_PREFIX
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+
+async def spawn_server(script, ready_prefix, *args, verbose=False):
+    """Start one of the benchmark servers in its own process; returns (process, the URL it printed)"""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(BENCHMARKS_DIR, script), *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=None if verbose else asyncio.subprocess.DEVNULL
+    )
+    line = await asyncio.wait_for(process.stdout.readline(), timeout=30)
+    line = line.decode().strip()
+    if not line.startswith(ready_prefix):
+        process.kill()
+        raise RuntimeError(f"{script} didn't start: {line!r}")
+    return process, line[len(ready_prefix):]
+
+
+async def start_fake_server(guilds, verbose=False):
+    """Start fake_voice.py in its own process; returns (process, base URL)"""
+    return await spawn_server('fake_voice.py', READY_LINE_PREFIX, '--guilds', str(guilds), '--port', '0',
+                              verbose=verbose)
+
+
+def cpu_seconds_by_process():
+    """CPU seconds used so far by this process and each of its child processes (FFmpeg), keyed by pid"""
+    this = psutil.Process()
+    usage = {}
+    for process in [this] + this.children(recursive=True):
+        try:
+            times = process.cpu_times()
+            usage[process.pid] = times.user + times.system
+        except psutil.Error:
+            pass
+    return usage
+
+
+async def join_guild(module, guild):
+    """Join the guild's voice channel and start streaming, as !join does; returns (success, seconds)"""
+    session = module.sessions.get(guild)
+    channel = guild.voice_channels[0]
+    started = time.perf_counter()
+    async with session.lock:
+        ok = await session.connect_to_voice_with_retry(channel) and await session.start_streaming()
+    return ok, time.perf_counter() - started
+
+
+async def join_all(module, guilds, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def join(guild):
+        async with semaphore:
+            try:
+                return await join_guild(module, guild)
+            except Exception as e:
+                logger.error(f"Joining guild {guild.id} failed: {e}")
+                return False, None
+
+    return await asyncio.gather(*(join(guild) for guild in guilds))
+
+
+async def control(base_url, method, path, **params):
+    async with aiohttp.ClientSession() as session:
+        async with session.request(method, f'{base_url}/control/{path}', params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+
+def distribution(values, unit='', scale=1.0):
+    values = sorted(value * scale for value in values if value is not None)
+    if not values:
+        return "n/a"
+    p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+    return f"median {statistics.median(values):.1f}{unit}, p95 {p95:.1f}{unit}, max {values[-1]:.1f}{unit}"
+
+
+def print_report(result):
+    joins, streams = result['joins'], result['stats']['guilds']
+    print()
+    print(f"Guilds: {result['guilds']}, joined and streaming: {joins['succeeded']}, failed: {joins['failed']}")
+    print(f"Join time (connect + start): {distribution(joins['seconds'], 's')}")
+    print(f"Voice handshake (server side): {distribution([s['connect_seconds'] for s in streams], 'ms', 1000)}")
+    cpu = result['cpu']
+    print(f"CPU over {result['duration']:.0f}s: bot {cpu['bot_percent']:.1f}% of a core, "
+          f"FFmpeg {cpu['ffmpeg_percent']:.1f}%, {cpu['per_stream_percent']:.2f}% per stream")
+    # A stalled stream keeps sending the jitter buffer's or the shared ingest's silence frames; that isn't audio
+    sending = [s for s in streams if s['audio_packets'] > 1]
+    print(f"Streams sending audio: {len(sending)} "
+          f"({sum(s['silent_packets'] for s in streams)} silence packets across all streams)")
+    if sending:
+        print(f"  packets/s: {distribution([s['packets_per_second'] for s in sending])}")
+        print(f"  jitter: {distribution([s['jitter_ms'] for s in sending], 'ms')}")
+        print(f"  p99 packet interval: {distribution([s['interval_p99_ms'] for s in sending], 'ms')}")
+        print(f"  longest gap: {distribution([s['max_gap_ms'] for s in sending], 'ms')}")
+        print(f"  packets lost: {sum(s['lost'] for s in sending)} of {sum(s['packets'] for s in sending)}")
+    reconnects = [seconds for s in streams for seconds in s['reconnect_seconds']]
+    if result['dropped']:
+        still = sum(1 for s in streams if s['still_reconnecting'])
+        print(f"Reconnects after {result['dropped']} dropped connection(s): {distribution(reconnects, 'ms', 1000)}"
+              f"{f', {still} never reconnected' if still else ''}")
+
+
+async def start_bot(base_url, config_dir, **settings):
+    """Run direct_stream_bot in this process against the fake server; returns (module, runner task) once it is ready"""
+    write_bot_config(config_dir, **settings)
+    # Cache and stats files the bot writes go to the temporary directory
+    os.chdir(config_dir)
+    sys.path[:0] = [config_dir, REPO_DIR]
+    import direct_stream_bot
+    patch_discord(base_url)
+    bot = direct_stream_bot.bot
+
+    ready = asyncio.Event()
+
+    async def on_ready():
+        ready.set()
+
+    bot.add_listener(on_ready, 'on_ready')
+    runner = asyncio.create_task(bot.start(direct_stream_bot.BOT_TOKEN))
+    ready_task = asyncio.create_task(ready.wait())
+    await asyncio.wait([ready_task, runner], timeout=60, return_when=asyncio.FIRST_COMPLETED)
+    if runner.done():
+        ready_task.cancel()
+        runner.result()  # raises whatever stopped the bot
+        raise RuntimeError("Bot stopped before it was ready")
+    if not ready.is_set():
+        ready_task.cancel()
+        await stop_bot(direct_stream_bot, runner)
+        raise RuntimeError("Bot didn't become ready within 60 seconds")
+    return direct_stream_bot, runner
+
+
+async def stop_bot(module, runner):
+    """Close the bot; call it before stopping the fake server, or the bot sees Discord vanish and reconnects"""
+    await module.bot.close()
+    try:
+        await runner
+    except Exception as e:
+        logger.warning(f"Bot stopped with an error: {e}")
+
+
+async def run_load_test(args):
+    fake, base_url = await start_fake_server(args.guilds, args.verbose)
+    module = runner = None
+    try:
+        stream_url = args.stream_url
+        if os.path.exists(stream_url):
+            stream_url = os.path.abspath(stream_url)
+        module, runner = await start_bot(base_url, tempfile.mkdtemp(prefix='voice-load-'),
+                                         STREAM_URL=stream_url, STARTUP_BUDGET=60)
+        bot = module.bot
+        logger.info(f"Bot ready with {len(bot.guilds)} guild(s), joining voice")
+
+        results = await join_all(module, bot.guilds, args.join_concurrency)
+        join_seconds = [seconds for ok, seconds in results if ok]
+        streaming = len(join_seconds)
+        logger.info(f"{streaming} of {len(results)} guild(s) streaming, measuring for {args.duration} seconds")
+
+        cpu_before = cpu_seconds_by_process()
+        measure_started = time.perf_counter()
+        await asyncio.sleep(args.duration / 2)
+        dropped = 0
+        if args.drop:
+            dropped = (await control(base_url, 'POST', 'drop', count=args.drop, code=args.drop_code))['dropped']
+        await asyncio.sleep(args.duration / 2)
+        cpu_after = cpu_seconds_by_process()
+        duration = time.perf_counter() - measure_started
+
+        this_pid = os.getpid()
+        bot_cpu = cpu_after.get(this_pid, 0) - cpu_before.get(this_pid, 0)
+        ffmpeg_cpu = sum(seconds - cpu_before.get(pid, 0) for pid, seconds in cpu_after.items() if pid != this_pid)
+        stats = await control(base_url, 'GET', 'stats')
+    finally:
+        if runner is not None:
+            await stop_bot(module, runner)
+        fake.terminate()
+        await fake.wait()
+
+    return {
+        'guilds': args.guilds,
+        'duration': duration,
+        'dropped': dropped,
+        'joins': {'succeeded': streaming, 'failed': len(results) - streaming, 'seconds': join_seconds},
+        'cpu': {
+            'bot_percent': bot_cpu / duration * 100,
+            'ffmpeg_percent': ffmpeg_cpu / duration * 100,
+            'per_stream_percent': (bot_cpu + ffmpeg_cpu) / duration * 100 / max(streaming, 1),
+        },
+        'stats': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test DirectStreamBot against a local fake Discord voice server")
+    parser.add_argument('--stream-url', required=True, help="stream the bot plays in every guild (URL or local file)")
+    parser.add_argument('--guilds', type=int, default=10, help="simulated guilds, each streaming")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to measure once every guild has joined")
+    parser.add_argument('--join-concurrency', type=int, default=10, help="guilds joining voice at the same time")
+    parser.add_argument('--drop', type=int, default=1, help="voice connections to drop halfway through")
+    parser.add_argument('--drop-code', type=int, default=4015,
+                        help="websocket close code for dropped connections (4015 resumes, 4006 reconnects)")
+    parser.add_argument('--save', help="write the full results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's own log output")
+    args = parser.parse_args()
+
+    # With many guilds the bot's own INFO logging drowns everything else out
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    result = asyncio.run(run_load_test(args))
+    print_report(result)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
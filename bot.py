@@ -1,19 +1,9 @@
 import discord
 from discord.ext import commands
 import asyncio
-import cv2
-import numpy as np
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-import pyautogui
 import threading
 import time
 import os
-from PIL import Image
-import io
 import subprocess
 import sys
 
@@ -41,6 +31,11 @@ class StreamBot:
         
     def setup_browser(self):
         """Setup Chrome browser with the embed"""
+        # Selenium is only needed once a stream starts, so it isn't imported at startup
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
         chrome_options = Options()
         chrome_options.add_argument('--no-sandbox')
         chrome_options.add_argument('--disable-dev-shm-usage')
@@ -110,6 +105,10 @@ class StreamBot:
             window_rect = self.driver.get_window_rect()
             x, y, width, height = window_rect['x'], window_rect['y'], window_rect['width'], window_rect['height']
             
+            import cv2
+            import numpy as np
+            import pyautogui
+
             # Capture the screen area
             screenshot = pyautogui.screenshot(region=(x, y, width, height))
             
@@ -9,6 +9,8 @@
 
 # Bot Settings
 COMMAND_PREFIX = '!'
+FAST_START = True  # Check FFmpeg and load yt-dlp in the background so the bot comes online sooner
+STARTUP_BUDGET = 5  # Seconds the bot may take to come online before a warning is logged
 
 # Stream Settings
 STREAM_FPS = 30
@@ -17,4 +19,44 @@ STREAM_QUALITY = 'high'  # high, medium, low
 # Browser Settings
 BROWSER_WIDTH = 1920
 BROWSER_HEIGHT = 1080
-HEADLESS_MODE = False  # Set to True to run browser in background
\ No newline at end of file
+HEADLESS_MODE = False  # Set to True to run browser in background
+# Stream Extraction Settings
+EXTRACTION_WORKERS = 2  # Worker threads for yt-dlp (extraction never blocks the bot)
+EXTRACTION_TIMEOUT = 90  # Max seconds for a whole stream URL extraction
+YTDLP_TIMEOUT = 45  # Max seconds for the yt-dlp stage
+YTDLP_REUSE = True  # Keep yt-dlp warm between extractions (cookies and connections carry over)
+YTDLP_ISOLATION = 'thread'  # 'process' runs yt-dlp in worker processes, so extraction never disturbs the audio timing
+HTTP_TIMEOUT = 10  # Max seconds for each HTTP request during extraction
+STREAM_URL_TTL = 600  # Seconds to cache an extracted URL when it has no expiry of its own
+STREAM_URL_REFRESH_MARGIN = 60  # Re-extract this many seconds before a cached URL expires
+STREAM_URL_CACHE_FILE = 'stream_url_cache.sqlite3'  # Keeps extracted URLs across restarts (None to disable)
+IFRAME_MAX_DEPTH = 3  # How many nested iframes (embedded players) to follow when looking for the stream
+IFRAME_FAN_OUT = 4  # Iframes followed from each page; they are fetched at the same time
+IFRAME_MAX_PAGES = 12  # Most pages fetched for one extraction
+RANK_CANDIDATES = True  # Probe every candidate stream URL found and use the fastest one that works
+MAX_CANDIDATES = 4  # Candidate URLs probed at the same time
+CANDIDATE_PROBE_BYTES = 65536  # Bytes fetched from each candidate to measure its speed
+EXTRACTION_RACE = True  # Run yt-dlp and the page scanner at the same time and use whichever finds a working URL first
+EXTRACTION_MERGE_WAIT = 0  # Extra seconds the race waits for the slower stage so its URLs are ranked as well (adds latency)
+
+# Playback Settings
+PLAYBACK_MODE = 'opus'  # 'opus' = FFmpeg outputs Opus (low CPU), 'pcm' = legacy decode + Python volume
+STREAM_VOLUME = 0.8  # 1.0 lets Opus sources be passed through without re-encoding
+OPUS_BITRATE = 128  # kbps
+SHARED_INGEST = True  # One FFmpeg process per stream shared by every voice connection (opus mode only)
+HUB_BUFFER_SECONDS = 5  # Seconds of audio kept in the shared ingest buffer
+
+# Monitoring Settings
+HEALTH_POLL_INTERVAL = 30  # Seconds between fallback health checks (failures are normally detected instantly)
+STALL_WINDOW = 5  # Seconds of missing audio before the stream is treated as stalled
+STALL_MIN_RATE = 0.5  # Minimum fraction of real-time audio output that counts as healthy
+STALL_STARTUP_TIMEOUT = 30  # Seconds to wait for the first audio after starting playback
+STANDBY_MODE = 'off'  # 'on_trouble' warms a spare FFmpeg when audio falters, 'hot' always keeps one (double ingest cost)
+HLS_INGEST = True  # Fetch HLS playlists and segments in the bot and pipe them into FFmpeg (False: FFmpeg fetches them)
+HLS_PREFETCH_SEGMENTS = 3  # HLS segments to download ahead of playback
+JITTER_BUFFER_FRAMES = 25  # 20 ms audio frames buffered before playback starts (25 = 0.5 s, 0 disables the buffer)
+JITTER_BUFFER_MAX_FRAMES = 150  # Skip ahead to the target when this many frames pile up, so latency stays bounded
+
+# FFmpeg Profile Settings
+ADAPTIVE_FFMPEG_PROFILES = True  # Try the FFmpeg options that have started audio fastest for this host first
+FFMPEG_PROFILE_STATS_FILE = 'ffmpeg_profile_stats.json'  # Where startup times and failures are remembered
@@ -1,61 +1,212 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # the startup budget is measured from here
+
 import discord
 from discord.ext import commands
 import asyncio
 import logging
 import os
 import sys
-import time
-import yt_dlp
-import ffmpeg
-import re
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+import threading
+from enum import Enum
+from stream_extractor import StreamExtractor
+from stream_cache import StreamURLCache
+from audio_sources import create_audio_source, probe_source_codec, InstrumentedAudioSource, JitterBufferSource, FFmpegErrorLog
+from audio_hub import BroadcastHub, HubAudioSource
+from profile_selector import ProfileSelector
+from standby import StandbyIngest, STANDBY_OFF, STANDBY_ON_TROUBLE, STANDBY_HOT
+from health_monitor import HealthMonitor
+from http_client import SharedHTTPClient
+from hls_ingest import HLSIngest, PipedAudioSource, is_hls_url, unsupported_urls
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+logger.info(f"Modules imported in {time.perf_counter() - STARTUP_STARTED:.2f} seconds")
 
 # Import configuration
 try:
+    import config
     from config import BOT_TOKEN, STREAM_URL, COMMAND_PREFIX
 except ImportError:
     print("Error: config.py not found or missing required variables.")
     print("Please check your config.py file and ensure all required variables are set.")
     sys.exit(1)
 
+# Optional extraction settings (defaults are used if they are missing from config.py)
+EXTRACTION_WORKERS = getattr(config, 'EXTRACTION_WORKERS', 2)
+EXTRACTION_TIMEOUT = getattr(config, 'EXTRACTION_TIMEOUT', 90)
+YTDLP_TIMEOUT = getattr(config, 'YTDLP_TIMEOUT', 45)
+YTDLP_REUSE = getattr(config, 'YTDLP_REUSE', True)  # one long-lived YoutubeDL per worker thread
+YTDLP_ISOLATION = getattr(config, 'YTDLP_ISOLATION', 'thread')  # 'thread' or 'process'
+HTTP_TIMEOUT = getattr(config, 'HTTP_TIMEOUT', 10)
+STREAM_URL_TTL = getattr(config, 'STREAM_URL_TTL', 600)
+STREAM_URL_REFRESH_MARGIN = getattr(config, 'STREAM_URL_REFRESH_MARGIN', 60)
+STREAM_URL_CACHE_FILE = getattr(config, 'STREAM_URL_CACHE_FILE', 'stream_url_cache.sqlite3')  # None disables
+IFRAME_MAX_DEPTH = getattr(config, 'IFRAME_MAX_DEPTH', 3)
+IFRAME_FAN_OUT = getattr(config, 'IFRAME_FAN_OUT', 4)
+IFRAME_MAX_PAGES = getattr(config, 'IFRAME_MAX_PAGES', 12)
+RANK_CANDIDATES = getattr(config, 'RANK_CANDIDATES', True)  # probe candidate URLs and use the fastest
+MAX_CANDIDATES = getattr(config, 'MAX_CANDIDATES', 4)
+CANDIDATE_PROBE_BYTES = getattr(config, 'CANDIDATE_PROBE_BYTES', 64 * 1024)
+EXTRACTION_RACE = getattr(config, 'EXTRACTION_RACE', True)  # run yt-dlp and the HTML scanner concurrently
+EXTRACTION_MERGE_WAIT = getattr(config, 'EXTRACTION_MERGE_WAIT', 0)  # seconds to wait for the race's loser
+
+# Optional playback settings
+PLAYBACK_MODE = getattr(config, 'PLAYBACK_MODE', 'opus')  # 'opus' (FFmpeg encodes) or 'pcm' (Python scales volume)
+STREAM_VOLUME = getattr(config, 'STREAM_VOLUME', 0.8)
+OPUS_BITRATE = getattr(config, 'OPUS_BITRATE', 128)  # kbps
+SHARED_INGEST = getattr(config, 'SHARED_INGEST', True)  # one FFmpeg per stream for all guilds (opus mode only)
+HUB_BUFFER_SECONDS = getattr(config, 'HUB_BUFFER_SECONDS', 5)
+HLS_INGEST = getattr(config, 'HLS_INGEST', True)  # fetch HLS segments in-process and pipe them into FFmpeg
+HLS_PREFETCH_SEGMENTS = getattr(config, 'HLS_PREFETCH_SEGMENTS', 3)
+JITTER_BUFFER_FRAMES = getattr(config, 'JITTER_BUFFER_FRAMES', 25)  # 20 ms frames buffered before playing (0 disables)
+JITTER_BUFFER_MAX_FRAMES = getattr(config, 'JITTER_BUFFER_MAX_FRAMES', 150)  # skip ahead when the buffer grows past this
+STANDBY_MODE = getattr(config, 'STANDBY_MODE', STANDBY_OFF)  # 'off', 'on_trouble' or 'hot' warm standby FFmpeg
+ADAPTIVE_FFMPEG_PROFILES = getattr(config, 'ADAPTIVE_FFMPEG_PROFILES', True)  # try the historically fastest profile first
+FFMPEG_PROFILE_STATS_FILE = getattr(config, 'FFMPEG_PROFILE_STATS_FILE', 'ffmpeg_profile_stats.json')
+
+# Optional monitoring settings
+HEALTH_POLL_INTERVAL = getattr(config, 'HEALTH_POLL_INTERVAL', 30)  # seconds between fallback health checks
+STALL_WINDOW = getattr(config, 'STALL_WINDOW', 5)  # seconds of low audio output before it counts as a stall
+STALL_MIN_RATE = getattr(config, 'STALL_MIN_RATE', 0.5)  # fraction of real-time output that counts as healthy
+STALL_STARTUP_TIMEOUT = getattr(config, 'STALL_STARTUP_TIMEOUT', 30)  # seconds to wait for the first audio
+
+# Optional startup settings
+FAST_START = getattr(config, 'FAST_START', True)  # probe FFmpeg and load yt-dlp in the background
+STARTUP_BUDGET = getattr(config, 'STARTUP_BUDGET', 5)  # seconds to on_ready before a warning is logged
+
 # Setup Discord bot
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 intents.guilds = True
 
+class StreamBot(commands.Bot):
+    startup_seconds = None  # time from process start to the first on_ready
+
+    async def close(self):
+        """Shut the sessions and the shared HTTP session down on the bot's own event loop"""
+        try:
+            await sessions.close_all()
+        except Exception as e:
+            logger.error(f"Error closing stream sessions: {e}")
+        await super().close()
+
 # Set permissions integer for voice connection (3238400)
 # This includes permissions for Connect (0x100000), Speak (0x200000), Use Voice Activity (0x2000000),
 # and other necessary voice permissions
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
+bot = StreamBot(command_prefix=COMMAND_PREFIX, intents=intents)
 
 # Store the permissions integer for use in voice connections
 BOT_PERMISSIONS = 3238400
 
+# FFmpeg option sets, from the most robust to the most basic
+FFMPEG_PROFILES = {
+    'enhanced': {
+        'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10 -analyzeduration 10000000 -probesize 10000000 -fflags nobuffer+discardcorrupt+fastseek',
+        'options': '-vn -af "volume=1.0" -b:a 128k -ar 48000 -ac 2'
+    },
+    'alternative': {
+        'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 15 -timeout 10000000',
+        'options': '-vn -ar 44100 -ac 2'
+    },
+    'moderate': {
+        'before_options': '-reconnect 1 -reconnect_streamed 1',
+        'options': '-vn -ar 44100'
+    },
+    'minimal': {
+        'before_options': '-reconnect 1',
+        'options': '-vn'
+    },
+}
+FFMPEG_PROFILE_ORDER = ['enhanced', 'alternative', 'moderate', 'minimal']
+
+# Seconds to wait before each recovery attempt (the last value repeats)
+RECOVERY_DELAYS = [2, 5, 10, 20, 30]
+
+# Health event for a change to the bot's own voice state; only a failure if it broke the connection or the player
+VOICE_STATE_CHANGED = 'voice state changed'
+
+# !status text for FFmpeg availability; None while the background probe is still running
+FFMPEG_STATUS = {True: '✅ Available', False: '❌ Not found', None: '⏳ Checking...'}
+
+class StreamState(Enum):
+    IDLE = 'idle'
+    CONNECTING = 'connecting'
+    RESOLVING = 'resolving'
+    PLAYING = 'playing'
+    RECOVERING = 'recovering'
+    STOPPING = 'stopping'
+
 class DirectStreamBot:
-    def __init__(self):
+    def __init__(self, guild_id=None, extractor=None, url_cache=None, ffmpeg_available=None, health_monitor=None,
+                 profile_selector=None):
+        self.guild_id = guild_id
+        # Serializes join/leave/restart for this guild
+        self.lock = asyncio.Lock()
         self.voice_client = None
         self.current_channel = None
         self.connection_attempts = 0
         self.max_connection_attempts = 5
         self.reconnect_delay = 10  # seconds
-        self.stream_task = None
         self.is_streaming = False
         self.stream_url = None
         self.stream_start_time = None
-        self.ffmpeg_available = self._check_ffmpeg_available()
+        self.playback_start_time = None
+        # Stream lifecycle; all restarts go through one recovery task
+        self.state = StreamState.IDLE
+        self._recovery_task = None
+        self._playback_id = 0
+        self._failure_streak = 0
+        self.max_recovery_attempts = 15
+        self.stable_playback_time = 60  # seconds of playback before a failure counts as new
+        self.recovery_count = 0
+        self.ffmpeg_profile = None
+        self.audio_source = None
+        self.source_codec = None
+        self._probed_stream_url = None
+        self.standby = None  # warm standby pipeline (when not using the shared ingest)
+        self.failovers = 0
+        self._profile_outcome = None  # (stream URL, profile, seconds to first audio) awaiting a stable verdict
+        self.ffmpeg_available = self._check_ffmpeg_available() if ffmpeg_available is None else ffmpeg_available
+        # Sessions share one extractor and URL cache, so a stream is only extracted once for all guilds
+        self.extractor = extractor or StreamExtractor(
+            max_workers=EXTRACTION_WORKERS,
+            ytdlp_timeout=YTDLP_TIMEOUT,
+            reuse_ytdlp=YTDLP_REUSE,
+            isolation=YTDLP_ISOLATION,
+            http_timeout=HTTP_TIMEOUT,
+            total_timeout=EXTRACTION_TIMEOUT,
+            iframe_depth=IFRAME_MAX_DEPTH,
+            iframe_fan_out=IFRAME_FAN_OUT,
+            max_pages=IFRAME_MAX_PAGES,
+            rank_candidates=RANK_CANDIDATES,
+            max_candidates=MAX_CANDIDATES,
+            probe_bytes=CANDIDATE_PROBE_BYTES,
+            race=EXTRACTION_RACE,
+            merge_wait=EXTRACTION_MERGE_WAIT
+        )
+        # Resolved URLs are cached per page URL and re-resolved in the background before they expire
+        self.url_cache = url_cache or StreamURLCache(
+            self.extractor.extract,
+            default_ttl=STREAM_URL_TTL,
+            refresh_margin=STREAM_URL_REFRESH_MARGIN
+        )
+        # Failures are reported to the health monitor as events; it also runs a slow fallback check
+        self.health_monitor = health_monitor or HealthMonitor(
+            lambda: [self] if self.is_streaming else [],
+            poll_interval=HEALTH_POLL_INTERVAL
+        )
+        # Learns which FFmpeg profile starts fastest for each stream host
+        self.profile_selector = profile_selector or create_profile_selector()
         self.ffmpeg_options = {
             'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
             'options': '-vn'
         }
         
-    def _check_ffmpeg_available(self):
+    @staticmethod
+    def _check_ffmpeg_available():
         """Check if FFmpeg is available on the system"""
         try:
             # Try to run ffmpeg -version
@@ -66,137 +217,21 @@ class DirectStreamBot:
             logger.warning("FFmpeg not found or not working properly")
             return False
         
-    async def extract_direct_stream_url(self, page_url):
-        """Extract the direct stream URL from the South Park stream page"""
-        try:
-            logger.info(f"Extracting direct stream URL from {page_url}")
-            
-            # First try using yt-dlp to extract the URL with more options
-            try:
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extract_flat': False,  # Full extraction
-                    'skip_download': True,
-                    'no_check_certificate': True,
-                    'force_generic_extractor': False,
-                    'geo_bypass': True,
-                    'geo_bypass_country': 'US',
-                    'http_headers': {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.5',
-                        'Referer': 'https://southpark.cc.com/',
-                        'Origin': 'https://southpark.cc.com',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
-                        'Sec-Fetch-Dest': 'document',
-                        'Sec-Fetch-Mode': 'navigate',
-                        'Sec-Fetch-Site': 'cross-site',
-                        'Pragma': 'no-cache',
-                        'Cache-Control': 'no-cache',
-                    }
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    logger.info("Attempting to extract stream URL with yt-dlp...")
-                    info = ydl.extract_info(page_url, download=False)
-                    if info:
-                        if 'url' in info:
-                            logger.info("Successfully extracted stream URL using yt-dlp (direct)")
-                            return info['url']
-                        elif 'formats' in info and info['formats']:
-                            # Get the best audio format
-                            formats = sorted(info['formats'], key=lambda x: (
-                                x.get('acodec', 'none') != 'none',  # Prefer formats with audio
-                                x.get('abr', 0),  # Higher audio bitrate
-                                x.get('filesize', 0) if x.get('filesize') else float('inf')  # Smaller file size if available
-                            ), reverse=True)
-                            
-                            for format in formats:
-                                if format.get('acodec') != 'none' and format.get('url'):
-                                    logger.info(f"Successfully extracted stream URL using yt-dlp (format: {format.get('format_id')}, audio bitrate: {format.get('abr')})")
-                                    return format['url']
-            except Exception as e:
-                logger.warning(f"yt-dlp extraction failed: {e}, trying alternative method")
-            
-            # If yt-dlp fails, try using requests and BeautifulSoup with improved headers
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Referer': 'https://southpark.cc.com/',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Cache-Control': 'max-age=0',
-            }
-            
-            response = requests.get(page_url, headers=headers, timeout=10)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Look for video sources
-            video_tags = soup.find_all('video')
-            for video in video_tags:
-                # Check for source tags
-                sources = video.find_all('source')
-                for source in sources:
-                    if source.has_attr('src'):
-                        src = source['src']
-                        if src.endswith('.m3u8') or 'playlist' in src:
-                            logger.info(f"Found m3u8 playlist in video source: {src}")
-                            return src
-                        return source['src']
-                
-                # Check for src attribute directly on video tag
-                if video.has_attr('src'):
-                    return video['src']
-            
-            # Look for iframe sources
-            iframe_tags = soup.find_all('iframe')
-            for iframe in iframe_tags:
-                if iframe.has_attr('src'):
-                    iframe_url = iframe['src']
-                    # If it's a relative URL, make it absolute
-                    if not iframe_url.startswith('http'):
-                        parsed_url = urlparse(page_url)
-                        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-                        iframe_url = base_url + iframe_url
-                    
-                    logger.info(f"Found iframe, recursively extracting from: {iframe_url}")
-                    # Recursively extract from iframe source
-                    return await self.extract_direct_stream_url(iframe_url)
-            
-            # Look for m3u8 URLs in the page source
-            m3u8_pattern = r'(https?://[^\s\'\"]+\.m3u8[^\s\'\"]*)'
-            m3u8_matches = re.findall(m3u8_pattern, response.text)
-            if m3u8_matches:
-                logger.info(f"Found m3u8 URL using regex: {m3u8_matches[0]}")
-                return m3u8_matches[0]
-            
-            # Look for JSON data that might contain stream URLs
-            json_pattern = r'"(https?://[^\s\'\"]+\.(m3u8|mp4|mp3)[^\s\'\"]*)"'
-            json_matches = re.findall(json_pattern, response.text)
-            if json_matches:
-                logger.info(f"Found media URL in JSON: {json_matches[0][0]}")
-                return json_matches[0][0]
-            
-            # Look for any media URLs
-            media_pattern = r'(https?://[^\s\'\"]+\.(mp4|mp3)[^\s\'\"]*)'
-            media_matches = re.findall(media_pattern, response.text)
-            if media_matches:
-                logger.info(f"Found media URL: {media_matches[0][0]}")
-                return media_matches[0][0]
-            
-            # If all else fails, return the original URL
-            logger.warning("Could not extract direct stream URL, using original URL")
-            return page_url
-            
-        except Exception as e:
-            logger.error(f"Error extracting stream URL: {e}")
-            return page_url
+    async def extract_direct_stream_url(self, page_url, force_refresh=False):
+        """Get the direct stream URL for a page, from the cache when it is still fresh"""
+        return await self.url_cache.get(page_url, force_refresh=force_refresh)
     
     async def connect_to_voice_with_retry(self, channel):
+        """Connect to voice channel, tracking the CONNECTING state unless a recovery is doing the reconnect"""
+        recovering = self.state == StreamState.RECOVERING
+        if not recovering:
+            self._set_state(StreamState.CONNECTING)
+        connected = await self._connect_to_voice(channel)
+        if not recovering and not connected:
+            self._set_state(StreamState.IDLE)
+        return connected
+    
+    async def _connect_to_voice(self, channel):
         """Connect to voice channel with retry logic and enhanced error handling for Discord 4006 errors"""
         self.connection_attempts = 0
         self.max_connection_attempts = 12  # Further increased max attempts
@@ -513,7 +548,13 @@ class DirectStreamBot:
             logger.error("Not connected to a voice channel")
             return False
         
+        # Stop any existing stream
+        if self.is_streaming:
+            await self.stop_streaming()
+        
         try:
+            self._set_state(StreamState.RESOLVING)
+            
             # Extract the direct stream URL
             self.stream_url = await self.extract_direct_stream_url(STREAM_URL)
             logger.info(f"Using stream URL: {self.stream_url}")
@@ -524,20 +565,11 @@ class DirectStreamBot:
                 # Try to extract again with a different approach
                 try:
                     logger.info("Attempting to extract stream URL with alternative method...")
-                    # Try direct access to the stream URL
-                    response = requests.get(STREAM_URL, headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept': '*/*',
-                        'Origin': 'https://southpark.cc.com',
-                        'Referer': 'https://southpark.cc.com/'
-                    })
-                    
-                    # Look for m3u8 URLs in the response
-                    m3u8_pattern = r'(https?://[^\s"\']+\.m3u8[^\s"\']*)'
-                    m3u8_urls = re.findall(m3u8_pattern, response.text)
+                    # Try direct access to the stream URL and look for m3u8 URLs in the response
+                    m3u8_url = await self.extractor.find_m3u8_url(STREAM_URL)
                     
-                    if m3u8_urls:
-                        self.stream_url = m3u8_urls[0]
+                    if m3u8_url:
+                        self.stream_url = m3u8_url
                         logger.info(f"Found alternative stream URL: {self.stream_url}")
                     else:
                         # If no m3u8 found, try using the original URL directly
@@ -548,68 +580,13 @@ class DirectStreamBot:
                     self.stream_url = STREAM_URL
                     logger.info(f"Falling back to original URL: {self.stream_url}")
             
-            # Stop any existing stream
-            if self.is_streaming:
-                await self.stop_streaming()
-            
             # Wait a moment to ensure voice connection is stable
             await asyncio.sleep(2)
+            await self._probe_stream_codec(self.stream_url)
             
-            # Enhanced FFmpeg options for better stability and audio quality
-            self.ffmpeg_options = {
-                'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10 -analyzeduration 10000000 -probesize 10000000 -fflags nobuffer+discardcorrupt+fastseek',
-                'options': '-vn -af "volume=1.0" -b:a 128k -ar 48000 -ac 2'
-            }
-            
-            # Create an audio source with error handling
-            try:
-                logger.info(f"Creating audio source with enhanced options: {self.ffmpeg_options}")
-                audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-                # Add a volume transformer to prevent audio clipping
-                audio_source = discord.PCMVolumeTransformer(audio_source, volume=0.8)
-            except Exception as audio_error:
-                logger.error(f"Error creating audio source with enhanced options: {audio_error}")
-                # Try with alternative options as fallback
-                logger.info("Trying alternative FFmpeg options...")
-                self.ffmpeg_options = {
-                    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 15 -timeout 10000000',
-                    'options': '-vn -ar 44100 -ac 2'
-                }
-                try:
-                    audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-                    audio_source = discord.PCMVolumeTransformer(audio_source, volume=0.8)
-                except Exception as alt_audio_error:
-                    logger.error(f"Error with alternative options: {alt_audio_error}")
-                    # Last resort: minimal options
-                    logger.info("Using minimal FFmpeg options as last resort")
-                    self.ffmpeg_options = {
-                        'before_options': '-reconnect 1',
-                        'options': '-vn'
-                    }
-                    audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-            
-            # Start playing with better error handling
-            def after_playing(error):
-                if error:
-                    logger.error(f"Player error: {error}")
-                    # Schedule a restart of the stream
-                    asyncio.create_task(self._handle_playback_error())
-                else:
-                    logger.info("Stream ended without error, scheduling restart")
-                    # If the stream ends normally, also restart it
-                    asyncio.create_task(self._handle_playback_error())
-            
-            # Log that we're about to start playing
-            logger.info(f"Starting playback with stream URL: {self.stream_url}")
-            self.voice_client.play(audio_source, after=after_playing)
-            self.is_streaming = True
-            self.stream_start_time = time.time()
-            
-            # Start monitoring task
-            self.stream_task = asyncio.create_task(self._monitor_stream())
-            
-            logger.info("Streaming started successfully")
-            return True
+            # Start with the profile that has historically started fastest and fall back to the others
+            if not self._start_playback(self.stream_url, self.profile_selector.order(self.stream_url)):
+                raise Exception("Could not create an audio source with any FFmpeg options")
             
         except Exception as e:
             logger.error(f"Error starting stream: {e}")
@@ -617,558 +594,478 @@ class DirectStreamBot:
             try:
                 logger.info("Attempting emergency stream start with direct URL")
                 self.stream_url = STREAM_URL
-                self.ffmpeg_options = {
-                    'before_options': '-reconnect 1',
-                    'options': '-vn'
-                }
-                audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-                self.voice_client.play(audio_source, after=lambda e: asyncio.create_task(self._handle_playback_error()) if e else None)
-                self.is_streaming = True
-                self.stream_start_time = time.time()
-                self.stream_task = asyncio.create_task(self._monitor_stream())
+                if not self._start_playback(self.stream_url, ['minimal']):
+                    raise Exception("Could not create an audio source")
                 logger.info("Emergency stream start successful")
-                return True
             except Exception as emergency_error:
                 logger.error(f"Emergency stream start failed: {emergency_error}")
+                self._set_state(StreamState.IDLE)
                 return False
+        
+        self.is_streaming = True
+        self.stream_start_time = time.time()
+        self._failure_streak = 0
+        self._set_state(StreamState.PLAYING)
+        
+        # Make sure failures are being watched for
+        self.health_monitor.ensure_running()
+        
+        logger.info("Streaming started successfully")
+        return True
+    
+    def _set_state(self, new_state):
+        """Move the stream lifecycle to a new state"""
+        if new_state != self.state:
+            logger.info(f"Stream state: {self.state.value} -> {new_state.value}")
+            self.state = new_state
+    
+    def _ffmpeg_source_factory(self, stream_url, ffmpeg_options):
+        """Return a function that creates an FFmpeg audio source, at reduced volume to prevent audio clipping"""
+        source_codec = self.source_codec if stream_url == self._probed_stream_url else None
+        loop = asyncio.get_running_loop()
+        
+        def make_ffmpeg_source():
+            # Tells an FFmpeg failure apart from its input failing, for the profile stats
+            error_log = FFmpegErrorLog()
+            if HLS_INGEST and is_hls_url(stream_url) and stream_url not in unsupported_urls:
+                # Segments are fetched ahead on the event loop and FFmpeg only decodes what we pipe in
+                ingest = HLSIngest(
+                    stream_url,
+                    loop,
+                    prefetch=HLS_PREFETCH_SEGMENTS,
+                    http_timeout=HTTP_TIMEOUT,
+                    http_client=self.extractor.http_client
+                )
+                try:
+                    audio_source = create_audio_source(
+                        ingest.start(),
+                        ffmpeg_options,
+                        playback_mode=PLAYBACK_MODE,
+                        volume=STREAM_VOLUME,
+                        source_codec=source_codec,
+                        bitrate=OPUS_BITRATE,
+                        pipe=True,
+                        error_log=error_log
+                    )
+                except Exception:
+                    ingest.close()
+                    raise
+                audio_source = PipedAudioSource(audio_source, ingest)
+            else:
+                audio_source = create_audio_source(
+                    stream_url,
+                    ffmpeg_options,
+                    playback_mode=PLAYBACK_MODE,
+                    volume=STREAM_VOLUME,
+                    source_codec=source_codec,
+                    bitrate=OPUS_BITRATE,
+                    error_log=error_log
+                )
             
-    async def _handle_playback_error(self):
-        """Handle errors that occur during playback with enhanced recovery"""
-        if not self.is_streaming:
+            if JITTER_BUFFER_FRAMES > 0:
+                # Smooth out FFmpeg's bursty output so gaps between segments don't become dropouts
+                audio_source = JitterBufferSource(
+                    audio_source,
+                    target_frames=JITTER_BUFFER_FRAMES,
+                    max_frames=JITTER_BUFFER_MAX_FRAMES
+                )
+            audio_source.ffmpeg_error_log = error_log
+            return audio_source
+        
+        return make_ffmpeg_source
+    
+    def _create_audio_source(self, stream_url, ffmpeg_options):
+        """Create the audio source for stream_url"""
+        make_ffmpeg_source = self._ffmpeg_source_factory(stream_url, ffmpeg_options)
+        if SHARED_INGEST and PLAYBACK_MODE == 'opus':
+            # Every voice client playing this URL reads from one shared FFmpeg ingest
+            return audio_hub.create_source(stream_url, make_ffmpeg_source)
+        return make_ffmpeg_source()
+    
+    async def _probe_stream_codec(self, stream_url):
+        """Probe the source codec so Opus sources can be stream-copied; only useful at full volume"""
+        if PLAYBACK_MODE != 'opus' or STREAM_VOLUME != 1.0 or stream_url == self._probed_stream_url:
             return
+        self.source_codec = await probe_source_codec(stream_url)
+        self._probed_stream_url = stream_url
+        logger.info(f"Source audio codec: {self.source_codec}")
+    
+    def _start_playback(self, stream_url, profile_names):
+        """Start playing stream_url with the first FFmpeg profile that works, returns True on success"""
+        for profile_name in profile_names:
+            ffmpeg_options = FFMPEG_PROFILES[profile_name]
+            try:
+                logger.info(f"Creating audio source with {profile_name} options: {ffmpeg_options}")
+                audio_source = self._create_audio_source(stream_url, ffmpeg_options)
+            except Exception as audio_error:
+                logger.error(f"Error creating audio source with {profile_name} options: {audio_error}")
+                self.profile_selector.record_failure(stream_url, profile_name)
+                continue
+            
+            # Any playback that is still running is replaced, not treated as a failure
+            self._playback_id += 1
+            self._profile_outcome = None
+            
+            # Joining a running shared ingest says nothing about how fast this profile starts
+            on_first_audio = None
+            if not getattr(audio_source, 'joined_existing', False):
+                on_first_audio = self._make_first_audio_callback(self._playback_id, stream_url, profile_name)
+            
+            # Count delivered frames so a silent but "playing" stream is detected as a stall
+            audio_source = InstrumentedAudioSource(
+                audio_source,
+                stall_window=STALL_WINDOW,
+                min_rate=STALL_MIN_RATE,
+                startup_timeout=STALL_STARTUP_TIMEOUT,
+                on_first_audio=on_first_audio
+            )
             
-        logger.info("Handling playback error, attempting to restart stream...")
-        await asyncio.sleep(2)  # Wait a moment before restarting
+            if isinstance(audio_source.source, HubAudioSource):
+                # The shared ingest dying is reported straight away, not only when this player runs dry
+                playback_id = self._playback_id
+                audio_source.source.on_ingest_ended = (
+                    lambda: self._notify_from_thread(playback_id, "shared ingest ended")
+                )
+            
+            if self.voice_client.is_playing() or self.voice_client.is_paused():
+                self.voice_client.stop()
+            
+            logger.info(f"Starting playback with stream URL: {stream_url}")
+            self.voice_client.play(audio_source, after=self._make_after_callback(self._playback_id))
+            self.ffmpeg_options = ffmpeg_options
+            self.ffmpeg_profile = profile_name
+            self.audio_source = audio_source
+            self.playback_start_time = time.time()
+            self.health_monitor.watch(self, audio_source)
+            
+            # A standby for the previous pipeline may be for an old URL or options
+            self._drop_standby()
+            if STANDBY_MODE == STANDBY_HOT:
+                self._prepare_standby()
+            return True
+        return False
+    
+    def _make_first_audio_callback(self, playback_id, stream_url, profile_name):
+        """Build the callback that reports the time to first audio; it runs on the player thread"""
+        loop = asyncio.get_running_loop()
         
-        # Check if we're still connected to voice
-        if not self.voice_client or not self.voice_client.is_connected():
-            logger.warning("Voice client disconnected during playback, attempting to reconnect...")
+        def first_audio(seconds):
             try:
-                # Try to reconnect to the voice channel
-                if self.current_channel:
-                    logger.info(f"Reconnecting to channel {self.current_channel.name}")
-                    await self.connect_to_voice_with_retry(self.current_channel)
-                    await asyncio.sleep(3)  # Wait for connection to stabilize
-                else:
-                    logger.error("No current channel to reconnect to")
-                    return
-            except Exception as reconnect_error:
-                logger.error(f"Failed to reconnect to voice channel: {reconnect_error}")
-                # If we can't reconnect, schedule a delayed attempt
-                if self.is_streaming:
-                    asyncio.create_task(self._delayed_restart_attempt())
-                return
+                loop.call_soon_threadsafe(self._on_first_audio, playback_id, stream_url, profile_name, seconds)
+            except RuntimeError:
+                pass
         
-        # Check if we need to refresh the stream URL
-        current_time = time.time()
-        time_since_start = current_time - self.stream_start_time
+        return first_audio
+    
+    def _on_first_audio(self, playback_id, stream_url, profile_name, seconds):
+        if playback_id == self._playback_id:
+            # Only counted as a success once playback has stayed up for stable_playback_time
+            self._profile_outcome = (stream_url, profile_name, seconds)
+    
+    def _settle_profile_outcome(self, failed):
+        """Record the current profile's startup outcome with the profile selector"""
+        outcome, self._profile_outcome = self._profile_outcome, None
+        if failed:
+            if outcome or (self.audio_source and self.audio_source.on_first_audio):
+                self.profile_selector.record_failure(self.stream_url, self.ffmpeg_profile)
+        elif outcome:
+            self.profile_selector.record_success(*outcome)
+    
+    def _ffmpeg_source(self):
+        """Return the source made by the FFmpeg source factory for the current playback, or None"""
+        inner = self.audio_source.source if self.audio_source else None
+        if isinstance(inner, HubAudioSource):
+            inner = inner.broadcast.source
+        return inner
+    
+    def _jitter_buffer(self):
+        """Return the jitter buffer of the current playback, or None"""
+        inner = self._ffmpeg_source()
+        return inner if isinstance(inner, JitterBufferSource) else None
+    
+    def _ffmpeg_failure(self):
+        """Describe how the current playback's FFmpeg failed, or None if it didn't (or its input was to blame)"""
+        error_log = getattr(self._ffmpeg_source(), 'ffmpeg_error_log', None)
+        return error_log.failure() if error_log else None
+    
+    def _current_broadcast(self):
+        """Return the shared ingest the current playback reads from, or None"""
+        inner = self.audio_source.source if self.audio_source else None
+        return inner.broadcast if isinstance(inner, HubAudioSource) else None
+    
+    def _prepare_standby(self):
+        """Start warming a standby FFmpeg pipeline for the current stream"""
+        broadcast = self._current_broadcast()
+        if broadcast is not None:
+            broadcast.prepare_standby()
+            return
+        if self.standby and not self.standby.failed:
+            return
+        if not self.stream_url or not self.ffmpeg_profile:
+            return
+        logger.info("Warming standby FFmpeg pipeline")
+        self.standby = StandbyIngest(self._ffmpeg_source_factory(self.stream_url, self.ffmpeg_options))
+    
+    def _drop_standby(self):
+        if self.standby:
+            self.standby.stop()
+            self.standby = None
+    
+    async def _fail_over_to_standby(self):
+        """Hand playback to a warm standby pipeline, returns True if audio can keep flowing"""
+        if not self.voice_client or not self.voice_client.is_connected():
+            return False
         
-        # If it's been more than 30 minutes, refresh the stream URL
-        if time_since_start > 1800:  # 30 minutes
-            logger.info("Stream has been running for over 30 minutes, refreshing stream URL")
-            try:
-                new_stream_url = await self.extract_direct_stream_url(STREAM_URL)
-                if new_stream_url and new_stream_url.startswith('http'):
-                    self.stream_url = new_stream_url
-                    logger.info(f"Refreshed stream URL: {self.stream_url}")
-                    self.stream_start_time = current_time  # Reset the timer
-            except Exception as refresh_error:
-                logger.warning(f"Failed to refresh stream URL: {refresh_error}")
+        broadcast = self._current_broadcast()
+        if broadcast is not None:
+            # The shared ingest swaps pipelines under every listener at once
+            failovers = broadcast.failovers
+            if not broadcast.fail_over() or not self.voice_client.is_playing():
+                return False
+            self.audio_source.reset()
+            if broadcast.failovers == failovers:
+                # Nothing was swapped: real audio is arriving again on its own (or after another listener's failover)
+                logger.info("Shared ingest is delivering audio again")
+                self.health_monitor.watch(self, self.audio_source)
+                return True
+            logger.info("Shared ingest failed over to its standby pipeline")
+        else:
+            source = self.standby.take() if self.standby else None
+            if source is None:
+                return False
+            self.standby = None
+            if self.voice_client.is_playing() or self.voice_client.is_paused():
+                # Swap inside the running player so there is no new player to start
+                old_source = self.audio_source.swap_source(source)
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, old_source.cleanup)
+            else:
+                audio_source = InstrumentedAudioSource(
+                    source,
+                    stall_window=STALL_WINDOW,
+                    min_rate=STALL_MIN_RATE,
+                    startup_timeout=STALL_STARTUP_TIMEOUT
+                )
+                self._playback_id += 1
+                self.voice_client.play(audio_source, after=self._make_after_callback(self._playback_id))
+                self.audio_source = audio_source
+            logger.info("Stream failed over to the standby pipeline")
         
-        try:
-            # Try with enhanced options first
-            enhanced_ffmpeg_options = {
-                'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10 -analyzeduration 10000000 -probesize 10000000 -fflags nobuffer+discardcorrupt+fastseek',
-                'options': '-vn -af "volume=1.0" -b:a 128k -ar 48000 -ac 2'
-            }
-            
-            logger.info("Attempting to restart stream with enhanced options")
-            audio_source = discord.FFmpegPCMAudio(self.stream_url, **enhanced_ffmpeg_options)
-            audio_source = discord.PCMVolumeTransformer(audio_source, volume=0.8)
-            
-            # Start playing again if still connected and not already playing
-            if self.voice_client and self.voice_client.is_connected() and not self.voice_client.is_playing():
-                self.voice_client.play(audio_source, after=lambda e: 
-                    asyncio.create_task(self._handle_playback_error()) if e else None)
-                logger.info("Stream restarted after playback error with enhanced options")
-                self.ffmpeg_options = enhanced_ffmpeg_options  # Update the options for future restarts
-                return
-        except Exception as enhanced_error:
-            logger.warning(f"Failed to restart with enhanced options: {enhanced_error}")
+        self.failovers += 1
+        self.playback_start_time = time.time()
+        self.health_monitor.watch(self, self.audio_source)
+        if STANDBY_MODE == STANDBY_HOT:
+            self._prepare_standby()
+        return True
+    
+    def _make_after_callback(self, playback_id):
+        """Build the player's after callback; it runs on the player thread and reports to the health monitor"""
         
-        try:
-            # Fall back to current options
-            logger.info("Attempting to restart stream with current options")
-            audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-            audio_source = discord.PCMVolumeTransformer(audio_source, volume=0.8)
-            
-            # Start playing again if still connected and not already playing
-            if self.voice_client and self.voice_client.is_connected() and not self.voice_client.is_playing():
-                self.voice_client.play(audio_source, after=lambda e: 
-                    asyncio.create_task(self._handle_playback_error()) if e else None)
-                logger.info("Stream restarted after playback error with current options")
-                return
-        except Exception as current_error:
-            logger.warning(f"Failed to restart with current options: {current_error}")
+        def after_playing(error):
+            if error:
+                logger.error(f"Player error: {error}")
+            else:
+                logger.info("Stream ended without error")
+            self._notify_from_thread(playback_id, "player error" if error else "stream ended")
         
-        try:
-            # Last resort: minimal options
-            minimal_ffmpeg_options = {
-                'before_options': '-reconnect 1',
-                'options': '-vn'
-            }
-            
-            logger.info("Attempting to restart stream with minimal options")
-            audio_source = discord.FFmpegPCMAudio(self.stream_url, **minimal_ffmpeg_options)
-            
-            # Start playing again if still connected and not already playing
-            if self.voice_client and self.voice_client.is_connected() and not self.voice_client.is_playing():
-                self.voice_client.play(audio_source, after=lambda e: 
-                    asyncio.create_task(self._handle_playback_error()) if e else None)
-                logger.info("Stream restarted after playback error with minimal options")
-                self.ffmpeg_options = minimal_ffmpeg_options  # Update the options for future restarts
-                return
-        except Exception as minimal_error:
-            logger.error(f"All restart attempts failed: {minimal_error}")
-            # If we can't restart with any options, schedule a delayed attempt
-            if self.is_streaming:
-                asyncio.create_task(self._delayed_restart_attempt())
+        return after_playing
     
-    async def _monitor_stream(self):
-        """Monitor the stream and restart if it stops, with enhanced reconnection logic"""
-        check_interval = 5  # Check every 5 seconds initially
-        consecutive_failures = 0
-        max_consecutive_failures = 7  # Increased tolerance further
-        reconnect_attempts = 0
-        max_reconnect_attempts = 15
-        last_reconnect_time = 0
-        reconnect_cooldown = 30  # Reduced cooldown to recover faster
-        discord_error_cooldown = 120  # Longer cooldown specifically for Discord errors
+    def _notify_from_thread(self, playback_id, reason):
+        """Report a failure from the player or ingest thread, unless its playback was replaced or stopped on purpose"""
+        # The playback id is bumped on the event loop before a player is stopped, so a stale report is dropped here
+        if playback_id == self._playback_id:
+            self.health_monitor.notify_threadsafe(self, reason)
+    
+    def request_recovery(self, reason):
+        """Ask the recovery coordinator to restore the stream; duplicate requests are ignored"""
+        if not self.is_streaming or self.state in (StreamState.STOPPING, StreamState.IDLE):
+            return None
         
-        # Track Discord-specific errors
-        discord_error_count = 0
-        last_discord_error_time = 0
-        in_discord_error_recovery = False
+        if self._recovery_task and not self._recovery_task.done():
+            logger.info(f"Recovery already in progress, ignoring duplicate trigger ({reason})")
+            return self._recovery_task
         
-        while self.is_streaming:
-            try:
-                current_time = time.time()
+        # Playback that dies soon after a restart counts towards the same failure,
+        # so the coordinator escalates instead of repeating the quick fix
+        if self.playback_start_time and time.time() - self.playback_start_time < self.stable_playback_time:
+            self._failure_streak += 1
+            # Only FFmpeg itself failing is the profile's fault, not a stalled or refusing origin or a lost voice connection
+            ffmpeg_failure = self._ffmpeg_failure()
+            if ffmpeg_failure:
+                logger.warning(f"{ffmpeg_failure} (options: {self.ffmpeg_profile})")
+                self._settle_profile_outcome(failed=True)
+            else:
+                self._profile_outcome = None
+        else:
+            self._failure_streak = 0
+            self._settle_profile_outcome(failed=False)
+        
+        self._set_state(StreamState.RECOVERING)
+        self._recovery_task = asyncio.create_task(self._recover(reason))
+        return self._recovery_task
+    
+    async def _recover(self, reason):
+        """The single recovery pipeline: reconnect voice if needed, refresh the URL, restart playback"""
+        logger.info(f"Starting stream recovery ({reason})")
+        attempt = self._failure_streak
+        
+        # A warm standby restores audio without any delay, extraction or probing
+        # (for a stalled shared ingest with no standby, this stops it so the restart gets a fresh one)
+        try:
+            if await self._fail_over_to_standby():
+                logger.info("Audio restored without restarting playback")
+                self._set_state(StreamState.PLAYING)
+                return True
+        except Exception as e:
+            logger.error(f"Standby failover failed: {e}")
+        
+        try:
+            while self.is_streaming:
+                attempt += 1
+                if attempt > self.max_recovery_attempts:
+                    logger.error(f"Exceeded maximum recovery attempts ({self.max_recovery_attempts}), stopping stream")
+                    self.is_streaming = False
+                    self._set_state(StreamState.IDLE)
+                    return False
+                
+                delay = RECOVERY_DELAYS[min(attempt - 1, len(RECOVERY_DELAYS) - 1)]
+                logger.info(f"Recovery attempt {attempt}/{self.max_recovery_attempts} in {delay} seconds...")
+                await asyncio.sleep(delay)
+                if not self.is_streaming:
+                    break
                 
-                # Check if we're still connected to voice
-                if not self.voice_client or not self.voice_client.is_connected():
-                    logger.warning("Voice client disconnected, attempting to reconnect...")
+                try:
+                    # Escalate to a full voice reset once quick restarts have failed a few times
+                    if attempt % 4 == 0 and self.voice_client:
+                        logger.warning("Repeated failures, resetting the voice connection")
+                        await self._reset_voice_connection()
+                        await asyncio.sleep(5)  # Let Discord process the disconnect
                     
-                    # Check if we're in reconnect cooldown
-                    if current_time - last_reconnect_time < reconnect_cooldown and reconnect_attempts > 0:
-                        logger.info(f"In reconnect cooldown, waiting {reconnect_cooldown - (current_time - last_reconnect_time):.1f} seconds...")
-                        await asyncio.sleep(5)
-                        continue
+                    # Make sure we're still connected to voice
+                    if not self.voice_client or not self.voice_client.is_connected():
+                        if not self.current_channel:
+                            logger.error("No channel to reconnect to, stopping stream")
+                            self.is_streaming = False
+                            self._set_state(StreamState.IDLE)
+                            return False
                         
-                    # Check if we're in Discord error cooldown (longer cooldown)
-                    if in_discord_error_recovery and current_time - last_discord_error_time < discord_error_cooldown:
-                        logger.info(f"In Discord error recovery cooldown, waiting {discord_error_cooldown - (current_time - last_discord_error_time):.1f} seconds...")
-                        await asyncio.sleep(10)
-                        continue
+                        logger.warning(f"Voice client disconnected, reconnecting to {self.current_channel.name}")
+                        if not await self.connect_to_voice_with_retry(self.current_channel):
+                            logger.warning("Failed to reconnect to voice channel")
+                            continue
                     
-                    if self.current_channel:
-                        try:
-                            reconnect_attempts += 1
-                            last_reconnect_time = current_time
-                            
-                            if reconnect_attempts > max_reconnect_attempts:
-                                logger.error(f"Exceeded maximum reconnect attempts ({max_reconnect_attempts}), stopping stream monitor")
-                                self.is_streaming = False
-                                break
-                                
-                            logger.info(f"Reconnect attempt {reconnect_attempts}/{max_reconnect_attempts}")
-                            
-                            # If we're in Discord error recovery mode, use a different approach
-                            if in_discord_error_recovery:
-                                logger.info("Using Discord error recovery strategy...")
-                                # Complete cleanup first
-                                await self.cleanup()
-                                await asyncio.sleep(3)  # Give Discord some time
-                                
-                                # Try to reconnect with minimal settings first
-                                try:
-                                    logger.info("Attempting minimal connection to reset Discord state...")
-                                    self.voice_client = await self.current_channel.connect(
-                                        timeout=60, 
-                                        reconnect=True, 
-                                        self_deaf=True,
-                                        cls=discord.VoiceClient
-                                    )
-                                    
-                                    # Set the voice client's permissions
-                                    if hasattr(self.voice_client, 'permissions'):
-                                        self.voice_client.permissions = BOT_PERMISSIONS
-                                        logger.info(f"Set voice client permissions to {BOT_PERMISSIONS}")
-                                    else:
-                                        logger.warning("Could not set voice client permissions directly")
-                                        
-                                    await asyncio.sleep(2)  # Stabilization period
-                                except Exception as minimal_error:
-                                    logger.warning(f"Minimal connection attempt failed: {minimal_error}")
-                            
-                            # Try to reconnect to the voice channel with normal settings
-                            connected = await self.connect_to_voice_with_retry(self.current_channel)
-                            if connected:
-                                # Restart the stream
-                                stream_restarted = await self.start_streaming()
-                                if stream_restarted:
-                                    logger.info("Successfully reconnected and restarted stream")
-                                    consecutive_failures = 0
-                                    # Reset Discord error recovery if successful
-                                    if in_discord_error_recovery:
-                                        logger.info("Discord error recovery successful")
-                                        in_discord_error_recovery = False
-                                        discord_error_count = 0
-                                else:
-                                    logger.warning("Reconnected to voice but failed to restart stream")
-                                    consecutive_failures += 1
-                            else:
-                                logger.warning("Failed to reconnect to voice channel")
-                                consecutive_failures += 1
-                        except discord.errors.ConnectionClosed as dc_error:
-                            # Handle Discord-specific connection errors
-                            error_code = getattr(dc_error, 'code', None)
-                            logger.error(f"Discord connection closed with code {error_code}: {dc_error}")
-                            
-                            # Special handling for 4006 (session no longer valid)
-                            if error_code == 4006:
-                                logger.warning("Detected Discord error 4006 - session no longer valid")
-                                discord_error_count += 1
-                                last_discord_error_time = current_time
-                                in_discord_error_recovery = True
-                                
-                                # Force a longer cooldown period
-                                await asyncio.sleep(5)
-                            
-                            consecutive_failures += 1
-                        except Exception as e:
-                            logger.error(f"Error during reconnection process: {e}")
-                            consecutive_failures += 1
-                    else:
-                        logger.error("No channel to reconnect to, stopping stream monitor")
-                        self.is_streaming = False
-                        break
-                        
-                # Check if the stream is still playing
-                elif not self.voice_client.is_playing() and not self.voice_client.is_paused():
-                    logger.warning("Stream stopped but voice connected, attempting to restart audio only...")
-                    try:
-                        # Check if we need to refresh the stream URL
-                        if consecutive_failures >= 2:
-                            try:
-                                logger.info("Refreshing stream URL before restart attempt...")
-                                new_url = await self.extract_direct_stream_url(STREAM_URL)
-                                if new_url and new_url != self.stream_url:
-                                    logger.info("Stream URL refreshed successfully")
-                                    self.stream_url = new_url
-                            except Exception as url_error:
-                                logger.error(f"Error refreshing URL: {url_error}")
-                        
-                        # Create a new audio source
-                        audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-                        audio_source = discord.PCMVolumeTransformer(audio_source, volume=0.8)
-                        
-                        # Start playing again
-                        self.voice_client.play(audio_source, after=lambda e: 
-                            asyncio.create_task(self._handle_playback_error()) if e else None)
-                        logger.info("Stream audio restarted successfully")
-                        consecutive_failures = 0
-                        # Reset stream start time
-                        self.stream_start_time = time.time()
-                    except Exception as e:
-                        logger.error(f"Error restarting stream audio: {e}")
-                        consecutive_failures += 1
-                else:
-                    # Stream is playing normally, reset failure counter and reduce reconnect attempts
-                    consecutive_failures = 0
-                    if reconnect_attempts > 0 and current_time - last_reconnect_time > 300:  # 5 minutes of stability
-                        reconnect_attempts = max(0, reconnect_attempts - 1)
-                
-                # If we've had too many consecutive failures, take a longer break and try more aggressive recovery
-                if consecutive_failures >= max_consecutive_failures:
-                    logger.warning(f"Too many consecutive failures ({consecutive_failures}), attempting full recovery")
+                    # The cached URL is normally warm; only force a new extraction
+                    # once restarting with it has already failed
+                    new_stream_url = await self.extract_direct_stream_url(STREAM_URL, force_refresh=attempt >= 3)
+                    if new_stream_url and new_stream_url.startswith('http'):
+                        if new_stream_url != self.stream_url:
+                            logger.info(f"Refreshed stream URL: {new_stream_url}")
+                        self.stream_url = new_stream_url
                     
-                    # Try to fully clean up and reconnect
-                    try:
-                        # Complete cleanup
-                        await self.cleanup()
-                        await asyncio.sleep(7)  # Longer delay for Discord to fully reset
-                        
-                        # Check if Discord error recovery is needed
-                        if discord_error_count >= 3:
-                            logger.warning(f"Multiple Discord errors detected ({discord_error_count}), performing deep recovery")
-                            # Reset the bot's Discord connection state completely
-                            try:
-                                # Force disconnect any lingering connections
-                                if self.voice_client:
-                                    try:
-                                        await self.voice_client.disconnect(force=True)
-                                    except:
-                                        pass
-                                self.voice_client = None
-                                
-                                # Wait longer for Discord to fully reset the session
-                                await asyncio.sleep(10)
-                                
-                                # Reset error tracking
-                                in_discord_error_recovery = True
-                                last_discord_error_time = time.time()
-                                logger.info("Deep recovery: Discord connection state reset")
-                            except Exception as deep_error:
-                                logger.error(f"Error during deep recovery: {deep_error}")
-                        
-                        if self.current_channel:
-                            logger.info("Attempting full reconnection after cleanup")
-                            
-                            # Try a minimal connection first if we've had Discord errors
-                            if in_discord_error_recovery:
-                                try:
-                                    logger.info("Recovery: Attempting minimal connection to reset Discord state...")
-                                    # Use a very basic connection attempt
-                                    self.voice_client = await self.current_channel.connect(timeout=60, reconnect=True, self_deaf=True)
-                                    await asyncio.sleep(3)  # Stabilization period
-                                    logger.info("Minimal connection successful, proceeding with full connection")
-                                except Exception as minimal_error:
-                                    logger.warning(f"Minimal connection attempt failed: {minimal_error}")
-                                    # Continue anyway to try the normal connection
-                            
-                            # Try normal connection with retry
-                            connected = await self.connect_to_voice_with_retry(self.current_channel)
-                            if connected:
-                                # Try to refresh the stream URL
-                                try:
-                                    logger.info("Refreshing stream URL for recovery...")
-                                    new_url = await self.extract_direct_stream_url(STREAM_URL)
-                                    if new_url:
-                                        self.stream_url = new_url
-                                        logger.info(f"Refreshed stream URL for recovery: {self.stream_url}")
-                                    else:
-                                        logger.warning("Could not get new stream URL, using existing one if available")
-                                except Exception as e:
-                                    logger.error(f"Error refreshing stream URL during recovery: {e}")
-                                
-                                # Restart streaming
-                                await asyncio.sleep(2)  # Short delay before starting stream
-                                stream_restarted = await self.start_streaming()
-                                if stream_restarted:
-                                    logger.info("Full recovery successful")
-                                    consecutive_failures = 0
-                                    # Reset Discord error recovery if successful
-                                    if in_discord_error_recovery:
-                                        in_discord_error_recovery = False
-                                        discord_error_count = 0
-                                        logger.info("Discord error recovery completed successfully")
-                                else:
-                                    logger.error("Failed to restart stream after full recovery")
-                            else:
-                                logger.error("Failed to reconnect after full recovery")
-                                
-                                # If we're in Discord error recovery and still failing, increase cooldown
-                                if in_discord_error_recovery:
-                                    logger.warning("Discord error recovery failed, increasing cooldown")
-                                    last_discord_error_time = time.time()  # Reset the timer for a longer wait
-                    except Exception as e:
-                        logger.error(f"Error during full recovery: {e}")
+                    await self._probe_stream_codec(self.stream_url)
                     
-                    # Reset consecutive failures counter but not Discord error count
-                    consecutive_failures = 0
-                
-                # Adjust check interval based on stability and error conditions
-                if in_discord_error_recovery:
-                    # More frequent checks during Discord error recovery
-                    check_interval = 2
-                elif consecutive_failures > 0:
-                    # More frequent checks when there are failures
-                    check_interval = 3
-                else:
-                    # Normal operation - less frequent checks
-                    check_interval = 10
-                
-            except discord.errors.ConnectionClosed as dc_error:
-                # Handle Discord-specific connection errors in the main loop
-                error_code = getattr(dc_error, 'code', None)
-                logger.error(f"Discord connection closed in monitor loop with code {error_code}: {dc_error}")
-                
-                # Special handling for 4006 (session no longer valid)
-                if error_code == 4006:
-                    logger.warning("Detected Discord error 4006 in monitor loop - session no longer valid")
-                    discord_error_count += 1
-                    last_discord_error_time = time.time()
-                    in_discord_error_recovery = True
+                    # Each further attempt starts further down the profile order
+                    profile_order = self.profile_selector.order(self.stream_url)
+                    start_index = min(attempt - 1, len(profile_order) - 1)
+                    if self._start_playback(self.stream_url, profile_order[start_index:]):
+                        logger.info(f"Stream recovered on attempt {attempt} with {self.ffmpeg_profile} options")
+                        self.recovery_count += 1
+                        self._set_state(StreamState.PLAYING)
+                        return True
                     
-                    # Force a longer cooldown period
-                    await asyncio.sleep(5)
-                
-                consecutive_failures += 1
+                except discord.errors.ConnectionClosed as dc_error:
+                    error_code = getattr(dc_error, 'code', None)
+                    logger.error(f"Discord connection closed during recovery with code {error_code}: {dc_error}")
+                    if error_code == 4006:
+                        # Session no longer valid, give Discord time to reset it
+                        logger.warning("Detected Discord error 4006 - session no longer valid")
+                        await self._reset_voice_connection()
+                        await asyncio.sleep(20)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Recovery attempt {attempt} failed: {e}")
+            return False
+        finally:
+            self._failure_streak = max(self._failure_streak, attempt - 1)
+    
+    async def _reset_voice_connection(self):
+        """Drop the voice connection without leaving the streaming state (used during recovery)"""
+        self._playback_id += 1
+        self.health_monitor.unwatch(self)
+        self._drop_standby()
+        if self.voice_client:
+            try:
+                await self.voice_client.disconnect(force=True)
             except Exception as e:
-                logger.error(f"Error in stream monitor: {e}")
-                consecutive_failures += 1
-                
-                # Check if this might be a Discord-related error
-                error_str = str(e).lower()
-                if "discord" in error_str or "voice" in error_str or "connection" in error_str or "websocket" in error_str:
-                    logger.warning("Possible Discord-related error detected in general exception")
-                    discord_error_count += 1
-                    if discord_error_count >= 2:
-                        in_discord_error_recovery = True
-                        last_discord_error_time = time.time()
-            
-            await asyncio.sleep(check_interval)
-        
-        logger.info("Stream monitor stopped")
-        
-    async def _delayed_restart_attempt(self):
-        """Make a delayed attempt to restart the stream with enhanced recovery"""
-        # Use a longer delay for delayed restart to avoid rapid reconnection attempts
-        delay = 10  # Start with a 10-second delay
-        logger.info(f"Scheduling delayed restart attempt in {delay} seconds...")
-        await asyncio.sleep(delay)
-        
-        if not self.is_streaming:
+                logger.warning(f"Error disconnecting voice client during recovery: {e}")
+            self.voice_client = None
+    
+    def handle_health_event(self, reason):
+        """Called by the health monitor when a failure event is reported for this session"""
+        if self.state != StreamState.PLAYING:
             return
-            
-        logger.info("Making delayed restart attempt with enhanced recovery...")
-        
-        # First, check if we need to refresh the stream URL
-        try:
-            logger.info("Attempting to refresh stream URL for delayed restart")
-            new_stream_url = await self.extract_direct_stream_url(STREAM_URL)
-            if new_stream_url and new_stream_url.startswith('http'):
-                self.stream_url = new_stream_url
-                logger.info(f"Refreshed stream URL for delayed restart: {self.stream_url}")
-            else:
-                logger.warning("Could not get valid stream URL, using existing one if available")
-        except Exception as refresh_error:
-            logger.warning(f"Failed to refresh stream URL for delayed restart: {refresh_error}")
-        
+        if self.voice_client and self.voice_client.is_paused():
+            # A paused player is expected to be silent
+            return
+        if reason == VOICE_STATE_CHANGED:
+            # Check straight away instead of at the next poll whether the change broke anything
+            self.check_health()
+            return
+        logger.warning(f"Health event: {reason}")
+        self.request_recovery(reason)
+    
+    def handle_health_warning(self, reason):
+        """Called by the health monitor at the first sign of trouble, before it becomes a stall"""
+        if self.state != StreamState.PLAYING or STANDBY_MODE != STANDBY_ON_TROUBLE:
+            return
+        if self.voice_client and self.voice_client.is_paused():
+            return
+        logger.info(f"Health warning: {reason}, preparing standby")
+        self._prepare_standby()
+    
+    def check_health(self):
+        """Fallback check for failures that didn't produce an event"""
+        if self.state != StreamState.PLAYING:
+            return
+        if self._profile_outcome and time.time() - self.playback_start_time >= self.stable_playback_time:
+            self._settle_profile_outcome(failed=False)
         # Check if we're still connected to voice
         if not self.voice_client or not self.voice_client.is_connected():
-            logger.warning("Voice client disconnected, attempting to reconnect before delayed restart")
-            try:
-                # Try to reconnect to the voice channel
-                if self.current_channel:
-                    logger.info(f"Reconnecting to channel {self.current_channel.name}")
-                    connected = await self.connect_to_voice_with_retry(self.current_channel)
-                    if not connected:
-                        logger.error("Failed to reconnect to voice channel for delayed restart")
-                        # Try one more time with a longer delay
-                        await asyncio.sleep(15)
-                        connected = await self.connect_to_voice_with_retry(self.current_channel)
-                        if not connected:
-                            logger.error("Second reconnection attempt failed, aborting delayed restart")
-                            return
-                else:
-                    logger.error("No channel to reconnect to for delayed restart")
-                    return
-            except Exception as reconnect_error:
-                logger.error(f"Failed to reconnect to voice channel: {reconnect_error}")
-                # Schedule another attempt with longer delay if still streaming
-                if self.is_streaming:
-                    logger.info("Scheduling another delayed restart with longer delay")
-                    await asyncio.sleep(20)  # Wait even longer before next attempt
-                    asyncio.create_task(self._delayed_restart_attempt())
-                return
-        
-        # Try to restart the stream with progressive options
-        restart_attempts = 0
-        max_restart_attempts = 3
-        
-        while restart_attempts < max_restart_attempts and self.is_streaming:
-            restart_attempts += 1
-            
-            try:
-                logger.info(f"Delayed restart attempt {restart_attempts}/{max_restart_attempts}")
-                
-                # Use different options based on attempt number
-                if restart_attempts == 1:
-                    # First attempt: Try with enhanced options
-                    self.ffmpeg_options = {
-                        'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 15 -analyzeduration 10000000 -probesize 10000000',
-                        'options': '-vn -af "volume=1.0" -ar 48000 -ac 2'
-                    }
-                elif restart_attempts == 2:
-                    # Second attempt: Try with moderate options
-                    self.ffmpeg_options = {
-                        'before_options': '-reconnect 1 -reconnect_streamed 1',
-                        'options': '-vn -ar 44100'
-                    }
-                else:
-                    # Last attempt: Try with minimal options
-                    self.ffmpeg_options = {
-                        'before_options': '-reconnect 1',
-                        'options': '-vn'
-                    }
-                
-                # Create a new audio source with current options
-                logger.info(f"Creating audio source with options: {self.ffmpeg_options}")
-                audio_source = discord.FFmpegPCMAudio(self.stream_url, **self.ffmpeg_options)
-                audio_source = discord.PCMVolumeTransformer(audio_source, volume=0.8)
-                
-                # Start playing again if not already playing
-                if self.voice_client and self.voice_client.is_connected() and not self.voice_client.is_playing() and not self.voice_client.is_paused():
-                    self.voice_client.play(audio_source, after=lambda e: 
-                        asyncio.create_task(self._handle_playback_error()) if e else None)
-                    logger.info(f"Stream restarted in delayed attempt {restart_attempts}")
-                    return  # Success, exit the loop
-                else:
-                    logger.warning("Voice client not ready for playback during delayed restart")
-                    await asyncio.sleep(5)  # Wait before next attempt
-            except Exception as attempt_error:
-                logger.warning(f"Delayed restart attempt {restart_attempts} failed: {attempt_error}")
-                await asyncio.sleep(5)  # Wait before next attempt
-        
-        # If all restart attempts failed, try a full reconnect and restart
-        if self.is_streaming and self.current_channel:
-            try:
-                logger.info("All delayed restart attempts failed, attempting full reconnect and restart")
-                await self.cleanup()
-                await asyncio.sleep(5)  # Wait longer after cleanup
-                
-                # Try to reconnect with special handling for 4006 errors
-                connected = await self.connect_to_voice_with_retry(self.current_channel)
-                if connected:
-                    logger.info("Full reconnect successful, restarting stream")
-                    await asyncio.sleep(5)  # Wait longer for connection to stabilize
-                    await self.start_streaming()
-                else:
-                    logger.error("Full reconnect failed, giving up on delayed restart")
-            except Exception as full_reconnect_error:
-                logger.error(f"Full reconnect and restart failed: {full_reconnect_error}")
-                # One final attempt to restart the bot's voice connection completely
-                if self.is_streaming:
-                    logger.info("Scheduling emergency voice reconnect")
-                    await asyncio.sleep(30)  # Wait much longer before emergency attempt
-                    try:
-                        await self.cleanup()
-                        await asyncio.sleep(10)
-                        if self.current_channel:
-                            await self.connect_to_voice_with_retry(self.current_channel)
-                            await self.start_streaming()
-                    except Exception as emergency_error:
-                        logger.error(f"Emergency reconnect failed: {emergency_error}")
+            logger.warning("Voice client disconnected")
+            self.request_recovery("voice disconnected")
+        # Check if the stream is still playing
+        elif not self.voice_client.is_playing() and not self.voice_client.is_paused():
+            logger.warning("Stream stopped but voice connected")
+            self.request_recovery("playback stopped")
     
     async def stop_streaming(self):
         """Stop streaming"""
+        self._set_state(StreamState.STOPPING)
         self.is_streaming = False
         self.stream_start_time = None
+        self.playback_start_time = None
+        # Any player that finishes from here on was stopped on purpose
+        self._playback_id += 1
+        self._profile_outcome = None
+        self.health_monitor.unwatch(self)
+        self._drop_standby()
         
-        # Cancel the monitoring task
-        if self.stream_task:
+        # Cancel any running recovery
+        task = self._recovery_task
+        if task and task is not asyncio.current_task() and not task.done():
             try:
-                self.stream_task.cancel()
-                await asyncio.sleep(1)
+                task.cancel()
             except Exception as e:
-                logger.error(f"Error cancelling stream task: {e}")
-            self.stream_task = None
+                logger.error(f"Error cancelling recovery task: {e}")
+        self._recovery_task = None
+        await asyncio.sleep(1)
         
         # Stop the voice client
         if self.voice_client and self.voice_client.is_playing():
             self.voice_client.stop()
         
+        self._set_state(StreamState.IDLE)
         logger.info("Streaming stopped")
     
     async def cleanup(self):
@@ -1191,19 +1088,152 @@ class DirectStreamBot:
         self.connection_attempts = 0
         self.reconnect_delay = 10
         self.stream_url = None
+        self._set_state(StreamState.IDLE)
 
-# Create bot instance
-stream_bot = DirectStreamBot()
+def create_profile_selector():
+    """Create the FFmpeg profile selector, which orders FFMPEG_PROFILE_ORDER by past startup times"""
+    return ProfileSelector(
+        FFMPEG_PROFILE_ORDER,
+        stats_path=FFMPEG_PROFILE_STATS_FILE,
+        enabled=ADAPTIVE_FFMPEG_PROFILES
+    )
+
+class StreamSessionManager:
+    """Registry of per-guild streaming sessions, so one process can stream to many servers"""
+    
+    def __init__(self):
+        self._sessions = {}
+        # One pooled keep-alive HTTP session for extraction and HLS ingest in every guild
+        self.http_client = SharedHTTPClient()
+        self.extractor = StreamExtractor(
+            max_workers=EXTRACTION_WORKERS,
+            ytdlp_timeout=YTDLP_TIMEOUT,
+            reuse_ytdlp=YTDLP_REUSE,
+            isolation=YTDLP_ISOLATION,
+            http_timeout=HTTP_TIMEOUT,
+            total_timeout=EXTRACTION_TIMEOUT,
+            http_client=self.http_client,
+            iframe_depth=IFRAME_MAX_DEPTH,
+            iframe_fan_out=IFRAME_FAN_OUT,
+            max_pages=IFRAME_MAX_PAGES,
+            rank_candidates=RANK_CANDIDATES,
+            max_candidates=MAX_CANDIDATES,
+            probe_bytes=CANDIDATE_PROBE_BYTES,
+            race=EXTRACTION_RACE,
+            merge_wait=EXTRACTION_MERGE_WAIT
+        )
+        # Resolved URLs are also kept on disk, so the first !join after a restart skips extraction
+        self.url_cache = StreamURLCache(
+            self.extractor.extract,
+            default_ttl=STREAM_URL_TTL,
+            refresh_margin=STREAM_URL_REFRESH_MARGIN,
+            store_path=STREAM_URL_CACHE_FILE,
+            validator=self.extractor.probe_url,
+            details=self.extractor.resolution_details
+        )
+        self._ffmpeg_lock = threading.Lock()  # orders the probe's result against sessions being created
+        if FAST_START:
+            # Capability probes run in the background, so the bot connects to Discord without waiting on them
+            self.ffmpeg_available = None  # unknown until the probe finishes
+            self._ffmpeg_probe = threading.Thread(target=self._probe_ffmpeg, name='ffmpeg-probe', daemon=True)
+            self._ffmpeg_probe.start()
+        else:
+            self._ffmpeg_probe = None
+            self.ffmpeg_available = DirectStreamBot._check_ffmpeg_available()
+            self.extractor.warm_up().result()
+        self.profile_selector = create_profile_selector()
+        # One monitor task watches every session
+        self.health_monitor = HealthMonitor(
+            lambda: [session for session in self._sessions.values() if session.is_streaming],
+            poll_interval=HEALTH_POLL_INTERVAL
+        )
+    
+    def _probe_ffmpeg(self):
+        started = time.perf_counter()
+        available = DirectStreamBot._check_ffmpeg_available()
+        with self._ffmpeg_lock:
+            self.ffmpeg_available = available
+            # Sessions created while the probe ran don't know yet
+            for session in self._sessions.values():
+                session.ffmpeg_available = available
+        logger.info(f"FFmpeg probe finished in {time.perf_counter() - started:.2f} seconds")
+
+    def get(self, guild):
+        """Return the session for a guild, creating it on first use"""
+        session = self._sessions.get(guild.id)
+        if session is None:
+            # Any bool skips the session's own blocking FFmpeg check; the shared result is filled in below
+            session = DirectStreamBot(
+                guild_id=guild.id,
+                extractor=self.extractor,
+                url_cache=self.url_cache,
+                ffmpeg_available=bool(self.ffmpeg_available),
+                health_monitor=self.health_monitor,
+                profile_selector=self.profile_selector
+            )
+            with self._ffmpeg_lock:
+                # Still None while the background probe runs, which then sets it on every session
+                session.ffmpeg_available = self.ffmpeg_available
+                self._sessions[guild.id] = session
+            logger.info(f"Created stream session for guild {guild.id} ({len(self._sessions)} active)")
+        return session
+    
+    def find(self, guild_id):
+        """Return the session for a guild id, or None if there isn't one"""
+        return self._sessions.get(guild_id)
+    
+    def discard_if_idle(self, guild_id):
+        """Forget a guild's session once it has fully stopped"""
+        session = self._sessions.get(guild_id)
+        if session and session.state == StreamState.IDLE and not session.voice_client and not session.lock.locked():
+            del self._sessions[guild_id]
+            logger.info(f"Removed stream session for guild {guild_id} ({len(self._sessions)} active)")
+    
+    def all(self):
+        return list(self._sessions.values())
+    
+    def streaming_count(self):
+        return sum(1 for session in self._sessions.values() if session.is_streaming)
+    
+    async def close_all(self):
+        """Clean up every session and the shared HTTP session"""
+        self.health_monitor.stop()
+        await asyncio.gather(*(session.cleanup() for session in self.all()), return_exceptions=True)
+        self._sessions.clear()
+        self.url_cache.close()
+        await self.http_client.close()
+
+# Shared FFmpeg ingests, one per unique stream URL
+audio_hub = BroadcastHub(buffer_seconds=HUB_BUFFER_SECONDS, standby_mode=STANDBY_MODE)
+
+# One streaming session per guild
+sessions = StreamSessionManager()
 
 @bot.event
 async def on_ready():
+    if bot.startup_seconds is None:
+        bot.startup_seconds = time.perf_counter() - STARTUP_STARTED
+        if bot.startup_seconds > STARTUP_BUDGET:
+            logger.warning(f"Startup took {bot.startup_seconds:.2f} seconds, over the {STARTUP_BUDGET} second budget")
+        else:
+            logger.info(f"Startup took {bot.startup_seconds:.2f} seconds")
+        if FAST_START:
+            # Load yt-dlp now that we're connected, rather than on the first !join
+            sessions.extractor.warm_up()
     logger.info(f'{bot.user} is now online!')
     print(f'🤖 {bot.user} is now online!')
     print(f'📺 Ready to stream South Park directly in Discord!')
     print(f'💬 Type {COMMAND_PREFIX}join in a Discord server to start streaming')
 
 @bot.command(name='join', help='Join voice channel and start streaming South Park')
+@commands.guild_only()
 async def join_voice(ctx):
+    stream_bot = sessions.get(ctx.guild)
+    async with stream_bot.lock:
+        await _join_voice(ctx, stream_bot)
+    sessions.discard_if_idle(ctx.guild.id)
+
+async def _join_voice(ctx, stream_bot):
     # Check if user is in a voice channel
     if not ctx.author.voice:
         await ctx.send("❌ You need to be in a voice channel to use this command!")
@@ -1287,7 +1317,14 @@ async def join_voice(ctx):
         await stream_bot.cleanup()
 
 @bot.command(name='leave', help='Leave voice channel and stop streaming')
+@commands.guild_only()
 async def leave_voice(ctx):
+    stream_bot = sessions.get(ctx.guild)
+    async with stream_bot.lock:
+        await _leave_voice(ctx, stream_bot)
+    sessions.discard_if_idle(ctx.guild.id)
+
+async def _leave_voice(ctx, stream_bot):
     if not stream_bot.voice_client or not stream_bot.voice_client.is_connected():
         await ctx.send("❌ I'm not in a voice channel!")
         return
@@ -1310,7 +1347,9 @@ async def leave_voice(ctx):
         await stream_bot.cleanup()
 
 @bot.command(name='status', help='Check bot streaming status and health')
+@commands.guild_only()
 async def status(ctx):
+    stream_bot = sessions.get(ctx.guild)
     status_embed = discord.Embed(
         title="South Park Stream Bot Status",
         color=discord.Color.blue(),
@@ -1341,9 +1380,22 @@ async def status(ctx):
             else:
                 uptime_str = "Unknown"
                 
+            jitter_buffer = stream_bot._jitter_buffer()
+            # Expected seconds to stable audio per FFmpeg profile, failures included; lowest is tried first
+            profile_scores = ", ".join(
+                f"{name} {score:.1f}s" for name, score, _attempts in stream_bot.profile_selector.summary(stream_bot.stream_url)
+            )
             status_embed.add_field(
                 name="Streaming",
-                value=f"✅ Active\n⏱️ Uptime: {uptime_str}",
+                value=f"✅ Active\n⏱️ Uptime: {uptime_str}\n" +
+                      f"🔁 State: {stream_bot.state.value} (recoveries: {stream_bot.recovery_count}, "
+                      f"standby failovers: {stream_bot.failovers})" +
+                      (f"\n🎚️ Audio: {stream_bot.audio_source.frames_per_second:.0f} frames/s, "
+                       f"{stream_bot.audio_source.bytes_per_second / 1024:.1f} KB/s" if stream_bot.audio_source else "") +
+                      (f"\n🎛️ FFmpeg options: {stream_bot.ffmpeg_profile}" if stream_bot.ffmpeg_profile else "") +
+                      (f"\n📊 Option scores: {profile_scores}" if profile_scores else "") +
+                      (f"\n🪣 Buffer: {jitter_buffer.depth}/{jitter_buffer.target_frames} frames, "
+                       f"{jitter_buffer.underruns} underruns, {jitter_buffer.overruns} overruns" if jitter_buffer else ""),
                 inline=True
             )
         else:
@@ -1360,11 +1412,31 @@ async def status(ctx):
         )
     
     # Add stream URL and extraction info
-    if hasattr(stream_bot, 'stream_url') and stream_bot.stream_url != STREAM_URL:
+    if hasattr(stream_bot, 'stream_url') and stream_bot.stream_url and stream_bot.stream_url != STREAM_URL:
+        cached = stream_bot.url_cache.peek(STREAM_URL)
+        cache_info = f"⏳ Cached URL expires in {int(cached.ttl_remaining // 60)}m" if cached else "⏳ Cached URL: none"
+        url_cache = stream_bot.url_cache
+        cache_info += (f"\n📦 Cache: {url_cache.hits} hits ({url_cache.disk_hits} from disk), "
+                       f"{url_cache.misses} extractions")
+        if cached and cached.extractor:
+            # Only for a URL this process's last extraction raced for, not one resolved earlier or loaded from disk
+            won_race = cached.stream_url == stream_bot.extractor.last_race_url
+            cache_info += f"\n🔎 Found by: {cached.extractor}" + (" (won the race)" if won_race else "")
+        ranking_info = ""
+        for probe in stream_bot.extractor.last_ranking[:3]:
+            host = ProfileSelector.host_of(probe.url)
+            marker = "✅" if probe.url == stream_bot.stream_url else "▫️"
+            if probe.ok:
+                ranking_info += (f"\n{marker} {host}: TTFB {probe.ttfb * 1000:.0f}ms, "
+                                 f"{probe.throughput / 1024:.0f} KB/s")
+            else:
+                ranking_info += f"\n❌ {host}: {probe.error[:40]}"
         status_embed.add_field(
             name="Stream Source",
             value=f"🔗 Original: `{STREAM_URL}`\n" +
-                  f"📡 Extracted: `{stream_bot.stream_url[:50]}...`",
+                  f"📡 Extracted: `{stream_bot.stream_url[:50]}...`\n" +
+                  cache_info +
+                  (f"\n🏁 Candidate sources:{ranking_info}" if ranking_info else ""),
             inline=False
         )
     else:
@@ -1376,11 +1448,15 @@ async def status(ctx):
         )
     
     # Add bot info
+    ingests = audio_hub.stats()
     status_embed.add_field(
         name="Bot Info",
         value=f"🤖 Version: 1.0\n" +
               f"🔄 Prefix: {COMMAND_PREFIX}\n" +
-              f"⚙️ FFmpeg: {'✅ Available' if stream_bot.ffmpeg_available else '❌ Not found'}",
+              f"⚙️ FFmpeg: {FFMPEG_STATUS[stream_bot.ffmpeg_available]}\n" +
+              (f"🚀 Startup: {bot.startup_seconds:.1f}s\n" if bot.startup_seconds is not None else "") +
+              f"📡 Shared ingests: {len(ingests)} ({sum(listeners for _, listeners, _ in ingests)} listeners)\n" +
+              f"🌐 Streaming in {sessions.streaming_count()} server(s)",
         inline=True
     )
     
@@ -1397,9 +1473,17 @@ async def status(ctx):
     status_embed.set_footer(text=f"South Park Stream Bot | Use {COMMAND_PREFIX}help for all commands")
     
     await ctx.send(embed=status_embed)
+    sessions.discard_if_idle(ctx.guild.id)
 
 @bot.command(name='restart', help='Restart the stream if it stopped')
+@commands.guild_only()
 async def restart_stream(ctx):
+    stream_bot = sessions.get(ctx.guild)
+    async with stream_bot.lock:
+        await _restart_stream(ctx, stream_bot)
+    sessions.discard_if_idle(ctx.guild.id)
+
+async def _restart_stream(ctx, stream_bot):
     if not stream_bot.voice_client or not stream_bot.voice_client.is_connected():
         await ctx.send("❌ I'm not in a voice channel! Use !join first.")
         return
@@ -1452,13 +1536,29 @@ async def restart_stream(ctx):
 
 @bot.event
 async def on_voice_state_update(member, before, after):
+    stream_bot = sessions.find(member.guild.id)
+    if stream_bot is None:
+        return
+    
     # If the bot was disconnected from a voice channel
     if member.id == bot.user.id and before.channel and not after.channel:
+        if stream_bot.state in (StreamState.CONNECTING, StreamState.RECOVERING):
+            # We dropped the connection ourselves and are reconnecting
+            return
         logger.info("Bot was disconnected from voice channel")
         # Clean up resources
         await stream_bot.stop_streaming()
         stream_bot.voice_client = None
         stream_bot.current_channel = None
+        sessions.discard_if_idle(member.guild.id)
+    
+    elif member.id == bot.user.id and after.channel:
+        # If the bot was moved to another channel, follow it
+        if before.channel != after.channel and stream_bot.current_channel and stream_bot.current_channel != after.channel:
+            logger.info(f"Bot was moved to {after.channel.name}")
+            stream_bot.current_channel = after.channel
+        # A move or a voice server change can drop the connection or stop the player
+        stream_bot.health_monitor.notify(stream_bot, VOICE_STATE_CHANGED)
     
     # If the bot is alone in the channel, leave
     elif stream_bot.current_channel and member.id != bot.user.id:
@@ -1467,7 +1567,9 @@ async def on_voice_state_update(member, before, after):
             members = stream_bot.current_channel.members
             if len([m for m in members if not m.bot]) == 0:
                 logger.info("No users left in voice channel, leaving...")
-                await stream_bot.cleanup()
+                async with stream_bot.lock:
+                    await stream_bot.cleanup()
+                sessions.discard_if_idle(member.guild.id)
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -1481,6 +1583,8 @@ async def on_command_error(ctx, error):
         await ctx.send(f"⏳ Command on cooldown. Try again in {error.retry_after:.2f} seconds.")
     elif isinstance(error, commands.MissingPermissions):
         await ctx.send("❌ You don't have permission to use this command.")
+    elif isinstance(error, commands.NoPrivateMessage):
+        await ctx.send("❌ This command can only be used in a server.")
     elif isinstance(error, commands.BotMissingPermissions):
         await ctx.send(f"❌ I don't have the required permissions: {', '.join(error.missing_perms)}")
     else:
@@ -1498,7 +1602,7 @@ if __name__ == '__main__':
         print("🚀 Starting Direct Stream South Park Bot...")
         print(f"📺 Stream URL: {STREAM_URL}")
         print(f"🎮 Command prefix: {COMMAND_PREFIX}")
-        print(f"🔧 Max connection attempts: {stream_bot.max_connection_attempts}")
+        print(f"🔧 Shared ingest: {'on' if SHARED_INGEST and PLAYBACK_MODE == 'opus' else 'off'} (one session per server)")
         print("-" * 50)
         print("This bot streams South Park directly in Discord voice channels!")
         print(f"Type {COMMAND_PREFIX}join in Discord to start streaming.")
@@ -1514,8 +1618,6 @@ if __name__ == '__main__':
         logger.error(f"Error starting bot: {e}")
         print(f"❌ Error starting bot: {e}")
     finally:
-        try:
-            asyncio.run(stream_bot.cleanup())
-        except:
-            pass
+        # Sessions and the HTTP session were closed by bot.close()
+        sessions.extractor.shutdown()
         print("🧹 Cleanup complete")
\ No newline at end of file
@@ -1,19 +1,9 @@
 import discord
 from discord.ext import commands
 import asyncio
-import cv2
-import numpy as np
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-import pyautogui
 import threading
 import time
 import os
-from PIL import Image
-import io
 import subprocess
 import sys
 import logging
@@ -91,6 +81,12 @@ class FinalSolutionBot:
     def setup_browser(self):
         """Setup Chrome browser with enhanced error handling and sandboxing fixes"""
         try:
+            # Selenium is only needed once a stream starts, so it isn't imported at startup
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+            from selenium.webdriver.chrome.service import Service
+            from webdriver_manager.chrome import ChromeDriverManager
+
             # First check if Chrome is installed
             if not self.check_chrome_installed():
                 logger.error("Chrome is not installed. Please install Google Chrome and try again.")
@@ -0,0 +1,113 @@
+"""
+Event-driven stream health monitor for the Direct Stream Bot.
+
+Failures are reported as events (player ended, stall detected, voice state
+changed, ...) and handled as soon as they arrive. A single task serves every
+session, and the periodic health check is only a cheap fallback for failures
+that don't produce an event, so idle guilds cost no wakeups of their own.
+While audio is playing, the same task samples each source's frame rate once a
+second to catch stalls that leave the player "playing" but silent.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    def __init__(self, sessions_provider, poll_interval=30, stall_check_interval=1.0):
+        self.sessions_provider = sessions_provider  # callable returning the sessions to check
+        self.poll_interval = poll_interval  # seconds between fallback health checks
+        self.stall_check_interval = stall_check_interval  # seconds between frame-rate samples
+        self._pending = {}
+        self._watched = {}
+        self._event = None
+        self._task = None
+        self._loop = None
+        self.events_handled = 0
+
+    def ensure_running(self):
+        """Start the monitor task on the running event loop if it isn't running yet"""
+        if self._task and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def notify(self, session, reason):
+        """Report a health event for a session (must be called on the event loop)"""
+        if self._event is None:
+            return
+        # Keep the first reason if several events arrive before the monitor wakes up
+        self._pending.setdefault(session, reason)
+        self._event.set()
+
+    def notify_threadsafe(self, session, reason):
+        """Report a health event from another thread (player, ingest, ...)"""
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self.notify, session, reason)
+        except RuntimeError:
+            # The event loop is already closed (bot shutting down)
+            pass
+
+    def watch(self, session, source):
+        """Watch an InstrumentedAudioSource for stalls; replaces the session's previous source"""
+        self._watched[session] = source
+        if self._event is not None:
+            # Wake up so the stall check interval takes effect straight away
+            self._event.set()
+
+    def unwatch(self, session):
+        self._watched.pop(session, None)
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        logger.info("Stream health monitor started")
+        loop = asyncio.get_running_loop()
+        last_poll = loop.time()
+        while True:
+            # Sampling frame rates needs a short tick, but only while something is playing
+            timeout = self.stall_check_interval if self._watched else self.poll_interval
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+
+            pending, self._pending = self._pending, {}
+            for session, reason in pending.items():
+                self.events_handled += 1
+                try:
+                    session.handle_health_event(reason)
+                except Exception as e:
+                    logger.error(f"Error handling health event ({reason}): {e}")
+
+            for session, source in list(self._watched.items()):
+                stall = source.check()
+                warning = source.pop_warning()
+                if warning and not stall:
+                    try:
+                        session.handle_health_warning(warning)
+                    except Exception as e:
+                        logger.error(f"Error handling health warning ({warning}): {e}")
+                if stall:
+                    self.events_handled += 1
+                    try:
+                        session.handle_health_event(stall)
+                    except Exception as e:
+                        logger.error(f"Error handling stall ({stall}): {e}")
+
+            if loop.time() - last_poll >= self.poll_interval:
+                last_poll = loop.time()
+                for session in self.sessions_provider():
+                    try:
+                        session.check_health()
+                    except Exception as e:
+                        logger.error(f"Error in stream health check: {e}")
@@ -0,0 +1,326 @@
+"""
+In-process HLS ingest for the Direct Stream Bot.
+
+FFmpeg reads HLS one request at a time: playlist, segment, playlist, segment,
+so a single slow segment download turns straight into an audio underrun. This
+module does the HLS part itself on the bot's event loop. It polls the media
+playlist on its target-duration cadence (with conditional requests, so an
+unchanged playlist costs a 304), keeps the next few segments downloading
+concurrently over one pooled connection, and writes the segment bytes, in
+order, into FFmpeg's stdin. FFmpeg then only has to decode.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+from collections import deque
+from urllib.parse import urljoin
+
+import aiohttp
+import discord
+
+from stream_extractor import DIRECT_HEADERS
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+# HLS URLs that turned out not to be usable by the ingest (e.g. encrypted), so FFmpeg reads them directly
+unsupported_urls = set()
+
+
+class UnsupportedPlaylist(Exception):
+    pass
+
+
+def is_hls_url(url):
+    return bool(url) and '.m3u8' in url.split('?', 1)[0].lower()
+
+
+def parse_attributes(text):
+    return {key: value.strip('"') for key, value in ATTRIBUTE_PATTERN.findall(text)}
+
+
+class MediaPlaylist:
+    def __init__(self, base_url, text):
+        self.target_duration = 6.0
+        self.media_sequence = 0
+        self.segments = []  # (sequence number, absolute URL)
+        self.init_url = None  # EXT-X-MAP initialization segment (fragmented MP4 streams)
+        self.ended = False
+
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if not lines or not lines[0].startswith('#EXTM3U'):
+            raise UnsupportedPlaylist("not an HLS playlist")
+
+        sequence = None
+        for line in lines:
+            if line.startswith('#EXT-X-TARGETDURATION:'):
+                self.target_duration = float(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                self.media_sequence = int(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-KEY:'):
+                if parse_attributes(line.split(':', 1)[1]).get('METHOD', 'NONE') != 'NONE':
+                    raise UnsupportedPlaylist("encrypted segments")
+            elif line.startswith('#EXT-X-MAP:'):
+                uri = parse_attributes(line.split(':', 1)[1]).get('URI')
+                if uri:
+                    self.init_url = urljoin(base_url, uri)
+            elif line.startswith('#EXT-X-ENDLIST'):
+                self.ended = True
+            elif not line.startswith('#'):
+                if sequence is None:
+                    sequence = self.media_sequence
+                self.segments.append((sequence, urljoin(base_url, line)))
+                sequence += 1
+
+
+def select_variant(base_url, text):
+    """Return the media playlist URL to use from a master playlist, or None if text is already a media playlist"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    variants = []
+    for index, line in enumerate(lines):
+        if line.startswith('#EXT-X-MEDIA:'):
+            attributes = parse_attributes(line.split(':', 1)[1])
+            # A separate audio rendition is all we need, and far smaller than any video variant
+            if attributes.get('TYPE') == 'AUDIO' and attributes.get('URI'):
+                return urljoin(base_url, attributes['URI'])
+        elif line.startswith('#EXT-X-STREAM-INF:') and index + 1 < len(lines):
+            attributes = parse_attributes(line.split(':', 1)[1])
+            codecs = attributes.get('CODECS', '')
+            audio_only = codecs and not any(video in codecs for video in ('avc', 'hvc', 'hev', 'vp0', 'av01'))
+            bandwidth = int(attributes.get('BANDWIDTH', '0') or 0)
+            variants.append((not audio_only, bandwidth, urljoin(base_url, lines[index + 1])))
+    if not variants:
+        return None
+    # Variants usually share the same audio track, so the smallest one saves bandwidth for nothing lost
+    return min(variants)[2]
+
+
+class HLSPipeReader:
+    """Blocking file-like object that FFmpeg's stdin writer thread reads segment bytes from"""
+
+    def __init__(self, max_buffered=8 * 1024 * 1024):
+        self._chunks = deque()
+        self._buffered = 0
+        self.max_buffered = max_buffered  # bytes; the producer waits while more than this is queued
+        self._cond = threading.Condition()
+        self._closed = False
+
+    @property
+    def buffered(self):
+        return self._buffered
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def feed(self, data):
+        with self._cond:
+            if self._closed:
+                return
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def read(self, size=-1):
+        with self._cond:
+            while not self._chunks:
+                if self._closed:
+                    return b''
+                self._cond.wait()
+            chunk = self._chunks.popleft()
+            if 0 <= size < len(chunk):
+                self._chunks.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            self._buffered -= len(chunk)
+            return chunk
+
+
+class HLSIngest:
+    def __init__(self, playlist_url, loop, prefetch=3, live_edge_segments=3, http_timeout=10, headers=None,
+                 http_client=None):
+        self.playlist_url = playlist_url
+        self.loop = loop  # the bot's event loop; the ingest may be created from other threads
+        self.prefetch = prefetch  # segments downloaded ahead of the one being written
+        self.live_edge_segments = live_edge_segments  # start this many segments behind the live edge
+        self.http_timeout = http_timeout
+        self.headers = headers or DIRECT_HEADERS
+        self.http_client = http_client  # SharedHTTPClient to reuse pooled connections, or None for a private session
+        self.reader = HLSPipeReader()
+        self.segments_fetched = 0
+        self.segments_skipped = 0
+        self._future = None
+        self._etag = None
+        self._last_modified = None
+        self._playlist_text = None
+
+    def start(self):
+        """Start ingesting on the bot's event loop; returns the reader to give FFmpeg"""
+        self._future = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+        return self.reader
+
+    def close(self):
+        self.reader.close()
+        if self._future and not self._future.done():
+            self.loop.call_soon_threadsafe(self._future.cancel)
+
+    async def _run(self):
+        try:
+            if self.http_client is not None:
+                await self._ingest(await self.http_client.session())
+            else:
+                connector = aiohttp.TCPConnector(limit_per_host=self.prefetch + 1)
+                async with aiohttp.ClientSession(connector=connector) as session:
+                    await self._ingest(session)
+        except asyncio.CancelledError:
+            pass
+        except UnsupportedPlaylist as e:
+            logger.warning(f"HLS ingest can't handle this stream ({e}), FFmpeg will read it directly")
+            unsupported_urls.add(self.playlist_url)
+        except Exception as e:
+            logger.error(f"HLS ingest failed: {e}")
+        finally:
+            # FFmpeg sees end of input and the player's normal failure handling takes over
+            self.reader.close()
+
+    async def _ingest(self, session):
+        text, base_url = await self._fetch_playlist(session, self.playlist_url)
+        variant_url = select_variant(base_url, text)
+        media_url = self.playlist_url
+        if variant_url:
+            logger.info(f"HLS ingest using variant {variant_url[:80]}")
+            media_url = variant_url
+            text, base_url = await self._fetch_playlist(session, media_url)
+        playlist = MediaPlaylist(base_url, text)
+
+        next_sequence = None
+        pending = {}  # sequence number -> download task
+        init_written = None
+        delay = playlist.target_duration
+        try:
+            while not self.reader.closed:
+                if next_sequence is None:
+                    # Start a few segments behind the live edge (or at the start of a finished playlist)
+                    start = 0 if playlist.ended else max(len(playlist.segments) - self.live_edge_segments, 0)
+                    next_sequence = playlist.segments[start][0] if playlist.segments else playlist.media_sequence
+
+                if playlist.init_url and playlist.init_url != init_written:
+                    self.reader.feed(await self._fetch_segment(session, playlist.init_url, retries=1))
+                    init_written = playlist.init_url
+
+                available = [(seq, url) for seq, url in playlist.segments if seq >= next_sequence]
+                if available and available[0][0] > next_sequence:
+                    # We fell behind the playlist window; jump to what is still available
+                    skipped = available[0][0] - next_sequence
+                    self.segments_skipped += skipped
+                    logger.warning(f"HLS ingest fell behind, skipping {skipped} segment(s)")
+                    next_sequence = available[0][0]
+
+                # Write the segments in order while keeping the next few downloading
+                self._fill_prefetch(session, pending, available, next_sequence)
+                while next_sequence in pending:
+                    data = await pending.pop(next_sequence)
+                    if data:
+                        self.reader.feed(data)
+                        self.segments_fetched += 1
+                    else:
+                        self.segments_skipped += 1
+                    next_sequence += 1
+                    self._fill_prefetch(session, pending, available, next_sequence)
+
+                    # Don't run far ahead of FFmpeg (matters for finished playlists)
+                    while self.reader.buffered > self.reader.max_buffered and not self.reader.closed:
+                        await asyncio.sleep(0.5)
+
+                if playlist.ended:
+                    logger.info("HLS playlist ended")
+                    return
+
+                # Reload after a target duration, or half of one if nothing new was published (RFC 8216 6.3.4)
+                await asyncio.sleep(delay)
+                reloaded = await self._reload(session, media_url)
+                if reloaded is not None:
+                    playlist = reloaded
+                    delay = playlist.target_duration
+                else:
+                    delay = playlist.target_duration / 2
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    def _fill_prefetch(self, session, pending, available, next_sequence):
+        for seq, url in available:
+            if len(pending) >= self.prefetch:
+                break
+            if seq >= next_sequence and seq not in pending:
+                pending[seq] = asyncio.ensure_future(self._fetch_segment(session, url, retries=1))
+
+    async def _reload(self, session, media_url):
+        """Return the reloaded playlist, or None if it hasn't changed"""
+        text, base_url = await self._fetch_playlist(session, media_url, conditional=True)
+        if text is None:
+            return None
+        return MediaPlaylist(base_url, text)
+
+    def _timeout(self):
+        return aiohttp.ClientTimeout(total=self.http_timeout * 3, sock_read=self.http_timeout)
+
+    async def _fetch_playlist(self, session, url, conditional=False):
+        """Fetch a playlist; with conditional=True returns (None, None) if it hasn't changed"""
+        headers = {}
+        if conditional and self._etag:
+            headers['If-None-Match'] = self._etag
+        if conditional and self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        async with session.get(url, headers={**self.headers, **headers}, timeout=self._timeout()) as response:
+            if response.status == 304:
+                return None, None
+            response.raise_for_status()
+            text = await response.text()
+            self._etag = response.headers.get('ETag')
+            self._last_modified = response.headers.get('Last-Modified')
+            if conditional and text == self._playlist_text:
+                return None, None
+            self._playlist_text = text
+            return text, str(response.url)
+
+    async def _fetch_segment(self, session, url, retries=0):
+        """Download one segment; returns b'' if it can't be fetched so the ingest skips it"""
+        for attempt in range(retries + 1):
+            try:
+                async with session.get(url, headers=self.headers, timeout=self._timeout()) as response:
+                    response.raise_for_status()
+                    return await response.read()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"HLS segment fetch failed (attempt {attempt + 1}): {e}")
+        return b''
+
+
+class PipedAudioSource(discord.AudioSource):
+    """Ties an HLS ingest's lifetime to the FFmpeg audio source reading from it"""
+
+    def __init__(self, source, ingest):
+        self._source = source
+        self._ingest = ingest
+
+    def is_opus(self):
+        return self._source.is_opus()
+
+    def read(self):
+        return self._source.read()
+
+    def cleanup(self):
+        self._ingest.close()
+        self._source.cleanup()
+
+    def __getattr__(self, name):
+        return getattr(self._source, name)
@@ -0,0 +1,49 @@
+"""
+Shared HTTP client for the Direct Stream Bot.
+
+Extraction, the direct-page fallback and the HLS ingest all talk to the same
+few hosts over and over. They share one aiohttp session here, so connections
+are kept alive and pooled and DNS answers are cached, and a repeated request
+to a known host skips the DNS lookup and the TCP and TLS handshakes.
+"""
+
+import asyncio
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class SharedHTTPClient:
+    def __init__(self, limit=20, limit_per_host=6, dns_cache_ttl=300, keepalive_timeout=60):
+        self.limit = limit  # total pooled connections
+        self.limit_per_host = limit_per_host  # pooled connections per host
+        self.dns_cache_ttl = dns_cache_ttl  # seconds to cache DNS answers
+        self.keepalive_timeout = keepalive_timeout  # seconds an idle connection is kept open
+        self._session = None
+        self._lock = None
+
+    async def session(self):
+        """Return the shared session, creating it on the running event loop on first use"""
+        if self._session is not None and not self._session.closed:
+            return self._session
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    keepalive_timeout=self.keepalive_timeout
+                )
+                self._session = aiohttp.ClientSession(connector=connector)
+                logger.info("Created shared HTTP session")
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Closed shared HTTP session")
+        self._session = None
@@ -0,0 +1,101 @@
+"""
+Single-pass media URL scanner for stream page HTML.
+
+Player pages can be several megabytes of inline script. Instead of building a
+full parse tree and then running separate regex passes over the whole text,
+the scanner is fed the page chunk by chunk as it downloads. One precompiled
+pattern finds <video>/<audio>/<source>/<iframe> tags and media URLs in a
+single pass, and scanning stops at the first high-confidence hit, so the rest
+of the page is never downloaded.
+"""
+
+import re
+from urllib.parse import urljoin
+
+# Tags we care about, or an absolute media URL anywhere in the text (markup, script or JSON)
+SCAN_PATTERN = re.compile(
+    r'<(?P<close>/)?(?P<tag>video|audio|source|iframe)\b(?P<attrs>[^>]*)>'
+    r'|(?P<url>https?://[^\s\'"<>]+?\.(?P<ext>m3u8|mp4|mp3)\b[^\s\'"<>]*)',
+    re.IGNORECASE
+)
+SRC_PATTERN = re.compile(r'\bsrc\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+
+# Text kept between chunks so a tag or URL split across two chunks is still found
+OVERLAP = 4096
+
+
+def tag_src(attrs):
+    match = SRC_PATTERN.search(attrs)
+    if not match:
+        return None
+    return next(group for group in match.groups() if group is not None) or None
+
+
+class MediaScanner:
+    def __init__(self, page_url, playlists_only=False, max_iframes=4):
+        self.page_url = page_url  # base for relative src attributes
+        self.playlists_only = playlists_only  # only report .m3u8 URLs
+        self.max_iframes = max_iframes  # iframe URLs to collect
+        self.done = False  # a high-confidence result was found, stop feeding
+        self.chars_scanned = 0
+        self.best = None  # high-confidence media URL
+        self.candidates = []  # every lower-confidence media URL, in page order
+        self.iframes = []  # iframe URLs in page order, without duplicates
+        self._tail = ''
+        self._media_depth = 0  # how many <video>/<audio> elements we are inside
+
+    def feed(self, text, final=False):
+        """Scan the next chunk of the page; pass final=True with the last chunk"""
+        if self.done:
+            return
+        self.chars_scanned += len(text)
+        buffer = self._tail + text
+        cutoff = len(buffer) if final else max(len(buffer) - OVERLAP, 0)
+        resume = cutoff
+        for match in SCAN_PATTERN.finditer(buffer):
+            if not final and match.end() >= len(buffer):
+                # May be cut off by the end of this chunk; scan it again with the next one
+                resume = match.start()
+                break
+            self._handle(match)
+            if self.done:
+                return
+            resume = max(match.end(), cutoff)
+        self._tail = buffer[resume:]
+
+    def _handle(self, match):
+        url = match.group('url')
+        if url:
+            if match.group('ext').lower() == 'm3u8':
+                self._found(url)
+            elif not self.playlists_only:
+                if url not in self.candidates and len(self.candidates) < 8:
+                    self.candidates.append(url)
+            return
+
+        tag = match.group('tag').lower()
+        if tag in ('video', 'audio'):
+            if match.group('close'):
+                self._media_depth = max(self._media_depth - 1, 0)
+                return
+            self._media_depth += 1
+            src = tag_src(match.group('attrs'))
+            if src and self._wanted(src):
+                self._found(urljoin(self.page_url, src))
+        elif tag == 'source' and self._media_depth:
+            src = tag_src(match.group('attrs'))
+            if src and self._wanted(src):
+                self._found(urljoin(self.page_url, src))
+        elif tag == 'iframe' and len(self.iframes) < self.max_iframes and not match.group('close'):
+            src = tag_src(match.group('attrs'))
+            if src and not src.startswith(('about:', 'javascript:', 'data:')):
+                iframe_url = urljoin(self.page_url, src)
+                if iframe_url not in self.iframes:
+                    self.iframes.append(iframe_url)
+
+    def _wanted(self, src):
+        return not self.playlists_only or '.m3u8' in src.lower()
+
+    def _found(self, url):
+        self.best = url
+        self.done = True
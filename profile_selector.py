@@ -0,0 +1,136 @@
+"""
+Adaptive FFmpeg profile ordering for the Direct Stream Bot.
+
+Records how long each FFmpeg option profile takes to produce the first audio
+and how often it fails, per source host and overall, and orders the profiles
+so the one with the fastest stable startup is tried first. Stats are kept in
+a small JSON file so what was learned survives restarts.
+"""
+
+import json
+import logging
+import os
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+ALL_HOSTS = '*'
+
+
+class ProfileSelector:
+    def __init__(self, profile_order, stats_path=None, min_samples=3, prior_seconds=8.0,
+                 failure_penalty=30.0, decay=0.95, enabled=True):
+        self.profile_order = list(profile_order)  # default order, used until there is data
+        self.enabled = enabled  # when disabled, the default order is always used and nothing is recorded
+        self.stats_path = stats_path  # JSON file to persist stats in, or None to keep them in memory
+        self.min_samples = min_samples  # attempts needed before a host's own stats are trusted
+        self.prior_seconds = prior_seconds  # assumed startup time for profiles without data
+        self.failure_penalty = failure_penalty  # seconds a failure costs in the score
+        self.decay = decay  # older outcomes count for less, so the order follows changes at the source
+        self._stats = {}
+        if enabled:
+            self._load()
+
+    @staticmethod
+    def host_of(url):
+        try:
+            return urlparse(url).hostname or ALL_HOSTS
+        except Exception:
+            return ALL_HOSTS
+
+    def order(self, stream_url):
+        """Return the profile names for stream_url, best expected startup first"""
+        if not self.enabled:
+            return list(self.profile_order)
+        host = self.host_of(stream_url)
+
+        def score(index_and_name):
+            index, name = index_and_name
+            stats = self._profile_stats(host, name)
+            if stats is None:
+                # Untried profiles keep their default relative order
+                return self.prior_seconds + index * 0.01
+            return self._score(stats)
+
+        ranked = [name for _, name in sorted(enumerate(self.profile_order), key=score)]
+        if ranked != self.profile_order:
+            logger.info(f"FFmpeg profile order for {host}: {', '.join(ranked)}")
+        return ranked
+
+    def record_success(self, stream_url, profile, time_to_audio):
+        """Record that a profile produced audio after time_to_audio seconds"""
+        self._record(stream_url, profile, time_to_audio=time_to_audio)
+
+    def record_failure(self, stream_url, profile):
+        """Record that a profile failed to start or died before playback was stable"""
+        self._record(stream_url, profile, failed=True)
+
+    def summary(self, stream_url):
+        """Return (profile, score, attempts) for the profiles that have stats for stream_url's host"""
+        host = self.host_of(stream_url)
+        result = []
+        for name in self.profile_order:
+            stats = self._profile_stats(host, name)
+            if stats:
+                result.append((name, self._score(stats), stats['attempts']))
+        return sorted(result, key=lambda item: item[1])
+
+    def _score(self, stats):
+        attempts = stats['attempts']
+        failure_rate = stats['failures'] / attempts if attempts else 0
+        successes = attempts - stats['failures']
+        average = stats['total_time'] / successes if successes > 0 else self.failure_penalty
+        return average + failure_rate * self.failure_penalty
+
+    def _profile_stats(self, host, name):
+        """Use the host's own stats once there are enough of them, otherwise the overall stats"""
+        stats = self._stats.get(host, {}).get(name)
+        if stats and stats['attempts'] >= self.min_samples:
+            return stats
+        stats = self._stats.get(ALL_HOSTS, {}).get(name)
+        if stats and stats['attempts'] > 0:
+            return stats
+        return None
+
+    def _record(self, stream_url, profile, time_to_audio=None, failed=False):
+        if not self.enabled or profile not in self.profile_order:
+            return
+        for host in {self.host_of(stream_url), ALL_HOSTS}:
+            stats = self._stats.setdefault(host, {}).setdefault(
+                profile, {'attempts': 0.0, 'failures': 0.0, 'total_time': 0.0}
+            )
+            for key in stats:
+                stats[key] *= self.decay
+            stats['attempts'] += 1
+            if failed:
+                stats['failures'] += 1
+            else:
+                stats['total_time'] += time_to_audio
+        if failed:
+            logger.info(f"FFmpeg profile {profile} failed")
+        else:
+            logger.info(f"FFmpeg profile {profile} started audio in {time_to_audio:.2f} seconds")
+        self._save()
+
+    def _load(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r') as f:
+                self._stats = json.load(f)
+            logger.info(f"Loaded FFmpeg profile stats from {self.stats_path}")
+        except Exception as e:
+            logger.warning(f"Could not load FFmpeg profile stats: {e}")
+            self._stats = {}
+
+    def _save(self):
+        if not self.stats_path:
+            return
+        try:
+            # Write to a temporary file first so a crash never leaves a half-written file
+            temp_path = self.stats_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self._stats, f, indent=2)
+            os.replace(temp_path, self.stats_path)
+        except Exception as e:
+            logger.warning(f"Could not save FFmpeg profile stats: {e}")
@@ -0,0 +1,127 @@
+"""
+Warm standby ingest for the Direct Stream Bot.
+
+A StandbyIngest starts a second FFmpeg pipeline ahead of time and keeps it
+drained, holding only the last few packets, so it is already probed and at the
+live edge. When the active pipeline fails, take() hands it over as an audio
+source and audio resumes within a frame or two instead of waiting for a fresh
+FFmpeg to probe the stream for several seconds.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import discord
+
+from audio_sources import FRAME_DURATION, OPUS_SILENCE_FRAME, JitterBufferSource
+
+logger = logging.getLogger(__name__)
+
+STANDBY_OFF = 'off'
+STANDBY_ON_TROUBLE = 'on_trouble'  # start the standby at the first sign of trouble
+STANDBY_HOT = 'hot'  # always keep a standby running (doubles ingest cost)
+
+
+class StandbyIngest:
+    def __init__(self, source_factory, keep_packets=10):
+        self._source_factory = source_factory
+        self._source = None
+        self._recent = deque(maxlen=keep_packets)  # newest audio packets, so a takeover starts near live
+        self._lock = threading.Lock()
+        self._handed_over = False
+        self._stopped = False
+        self.ready = threading.Event()
+        self.failed = False
+        self.created_at = time.monotonic()
+        self.ready_after = None
+        self._thread = threading.Thread(target=self._drain_loop, name='standby-ingest', daemon=True)
+        self._thread.start()
+
+    def _drain_loop(self):
+        """Start the pipeline and keep reading it so it stays at the live edge"""
+        try:
+            self._source = self._source_factory()
+            # A jitter buffer only blocks while it refills, so reading it flat out would empty it into
+            # underruns; read it at the frame rate instead and it stays at its target depth for the takeover.
+            # FFmpeg on its own is drained as fast as it delivers, so its pipe never backs up behind live
+            paced = isinstance(self._source, JitterBufferSource)
+            next_time = time.perf_counter()
+            while not self._stopped:
+                packet = self._source.read()
+                if not packet:
+                    break
+                # A jitter buffer in the pipeline pads with silence until real audio arrives
+                filler = getattr(self._source, 'is_filler', False) or packet == OPUS_SILENCE_FRAME
+                with self._lock:
+                    if not filler:
+                        self._recent.append(packet)
+                    if self._handed_over:
+                        return
+                if not self.ready.is_set() and not filler:
+                    self.ready_after = time.monotonic() - self.created_at
+                    logger.info(f"Standby ingest ready after {self.ready_after:.2f} seconds")
+                    self.ready.set()
+                if paced:
+                    next_time += FRAME_DURATION
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        # Never burst to catch up; that would only drain the buffer again
+                        next_time = time.perf_counter()
+        except Exception as e:
+            logger.warning(f"Standby ingest failed: {e}")
+        self.failed = True
+        self.ready.clear()
+        if not self._handed_over:
+            self.stop()
+
+    def is_ready(self):
+        return self.ready.is_set() and not self.failed and not self._stopped
+
+    def take(self):
+        """Hand the warm pipeline over as an AudioSource, or return None if it isn't ready"""
+        with self._lock:
+            if not self.is_ready() or self._handed_over:
+                return None
+            self._handed_over = True
+        return StandbySource(self)
+
+    def stop(self):
+        """Throw the standby away"""
+        self._stopped = True
+        if self._source is not None:
+            try:
+                self._source.cleanup()
+            except Exception as e:
+                logger.warning(f"Error stopping standby ingest: {e}")
+
+
+class StandbySource(discord.AudioSource):
+    """Plays the packets a StandbyIngest buffered, then reads its pipeline directly"""
+
+    def __init__(self, standby):
+        self._standby = standby
+        self._joined = False
+        self.is_filler = False  # whether the last read() returned padding silence rather than audio
+
+    def is_opus(self):
+        return self._standby._source.is_opus()
+
+    def read(self):
+        if not self._joined:
+            # Wait for the drain thread to finish its current read so only one thread reads the pipe
+            self._standby._thread.join(timeout=0.5)
+            self._joined = True
+        with self._standby._lock:
+            if self._standby._recent:
+                self.is_filler = False
+                return self._standby._recent.popleft()
+        packet = self._standby._source.read()
+        self.is_filler = getattr(self._standby._source, 'is_filler', False)
+        return packet
+
+    def cleanup(self):
+        self._standby.stop()
@@ -0,0 +1,290 @@
+"""
+Resolved stream URL cache for the Direct Stream Bot.
+
+Maps a stream page URL to the direct media URL extracted from it. Entries live
+until the expiry encoded in the signed media URL (or a default TTL), concurrent
+lookups for the same page share one extraction, and a background task
+re-resolves each entry shortly before it expires so restarts find a warm URL.
+Entries can also be kept in a small SQLite file, so the first lookup after a
+restart only needs a quick reachability probe instead of a full extraction.
+"""
+
+import asyncio
+import calendar
+import json
+import logging
+import re
+import sqlite3
+import time
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that carry an absolute expiry time (unix seconds)
+EXPIRY_PARAMS = ('expires', 'expire', 'expiry', 'exp', 'e', 'validto', 'valid_to', 'deadline')
+
+# Expiry embedded in the path, e.g. /expire/1700000000/ or in an Akamai token like exp=1700000000
+PATH_EXPIRY_PATTERN = re.compile(r'(?:expires?|exp)[/=~](\d{10})(?!\d)', re.IGNORECASE)
+
+
+def parse_url_expiry(url):
+    """Return the absolute expiry time (unix seconds) encoded in a signed URL, or None"""
+    try:
+        parsed = urlparse(url)
+        params = {key.lower(): values for key, values in parse_qs(parsed.query).items()}
+    except Exception:
+        return None
+
+    # AWS style signatures: X-Amz-Date + X-Amz-Expires (relative seconds)
+    if 'x-amz-date' in params and 'x-amz-expires' in params:
+        try:
+            signed_at = calendar.timegm(time.strptime(params['x-amz-date'][0], '%Y%m%dT%H%M%SZ'))
+            return signed_at + int(params['x-amz-expires'][0])
+        except (ValueError, OverflowError):
+            pass
+
+    for name in EXPIRY_PARAMS:
+        if name in params:
+            value = params[name][0]
+            if value.isdigit() and len(value) == 10:
+                return int(value)
+
+    match = PATH_EXPIRY_PATTERN.search(parsed.path + '?' + parsed.query)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+class CachedStreamURL:
+    def __init__(self, page_url, stream_url, expires_at, extractor=None, headers=None, validated=True):
+        self.page_url = page_url
+        self.stream_url = stream_url
+        self.resolved_at = time.time()
+        self.expires_at = expires_at
+        self.last_access = self.resolved_at
+        self.extractor = extractor  # which extraction stage produced the URL
+        self.headers = headers or {}  # HTTP headers the media URL needs
+        self.validated = validated  # False for entries loaded from disk until a probe confirms them
+
+    @property
+    def ttl_remaining(self):
+        return self.expires_at - time.time()
+
+    def is_fresh(self):
+        return self.ttl_remaining > 0
+
+
+class PersistentURLStore:
+    """SQLite file holding resolved stream URLs between runs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS resolved_urls ('
+            'page_url TEXT PRIMARY KEY, stream_url TEXT NOT NULL, extractor TEXT, '
+            'headers TEXT, expires_at REAL NOT NULL, resolved_at REAL NOT NULL)'
+        )
+        self._db.commit()
+
+    def load(self):
+        """Return the entries that haven't expired yet, marked as not validated"""
+        self._db.execute('DELETE FROM resolved_urls WHERE expires_at <= ?', (time.time(),))
+        self._db.commit()
+        entries = []
+        rows = self._db.execute(
+            'SELECT page_url, stream_url, extractor, headers, expires_at, resolved_at FROM resolved_urls'
+        )
+        for page_url, stream_url, extractor, headers, expires_at, resolved_at in rows:
+            entry = CachedStreamURL(
+                page_url,
+                stream_url,
+                expires_at,
+                extractor=extractor,
+                headers=json.loads(headers) if headers else {},
+                validated=False
+            )
+            entry.resolved_at = resolved_at
+            entries.append(entry)
+        return entries
+
+    def save(self, entry):
+        self._db.execute(
+            'INSERT OR REPLACE INTO resolved_urls VALUES (?, ?, ?, ?, ?, ?)',
+            (entry.page_url, entry.stream_url, entry.extractor, json.dumps(entry.headers),
+             entry.expires_at, entry.resolved_at)
+        )
+        self._db.commit()
+
+    def delete(self, page_url):
+        self._db.execute('DELETE FROM resolved_urls WHERE page_url = ?', (page_url,))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class StreamURLCache:
+    def __init__(self, resolver, default_ttl=600, refresh_margin=60, min_ttl=30, idle_timeout=1800,
+                 store_path=None, validator=None, details=None):
+        self.resolver = resolver  # async callable: page_url -> stream_url
+        self.default_ttl = default_ttl  # seconds, used when the URL has no expiry
+        self.refresh_margin = refresh_margin  # re-resolve this many seconds before expiry
+        self.min_ttl = min_ttl  # never trust an entry for less than this
+        self.idle_timeout = idle_timeout  # stop pre-refreshing entries nobody has used for this long
+        self.validator = validator  # async callable: (stream_url, headers) -> True if it still works
+        self.details = details  # callable: stream_url -> (extractor, headers), recorded with each entry
+        self._entries = {}
+        self._inflight = {}
+        self._refresh_tasks = {}
+        self.hits = 0  # lookups answered from the cache, shown by !status
+        self.misses = 0  # lookups that needed an extraction
+        self.disk_hits = 0  # hits on entries loaded from the cache file (also counted in hits)
+
+        # Entries from the last run are loaded now and only probed when first used
+        self._store = None
+        if store_path:
+            try:
+                self._store = PersistentURLStore(store_path)
+                for entry in self._store.load():
+                    self._entries[entry.page_url] = entry
+                if self._entries:
+                    logger.info(f"Loaded {len(self._entries)} cached stream URL(s) from {store_path}")
+            except Exception as e:
+                logger.warning(f"Could not open stream URL cache file {store_path}: {e}")
+                self._store = None
+
+    def peek(self, page_url):
+        """Return the cached entry for a page URL if it is still fresh, without resolving"""
+        entry = self._entries.get(page_url)
+        if entry and entry.is_fresh():
+            return entry
+        return None
+
+    async def get(self, page_url, force_refresh=False):
+        """Return the stream URL for a page, resolving it only if there is no fresh entry"""
+        entry = self.peek(page_url)
+        if entry and not entry.validated and not force_refresh:
+            entry = await self._validate(entry)
+        if entry and not force_refresh:
+            self.hits += 1
+            entry.last_access = time.time()
+            logger.info(f"Using cached stream URL ({entry.ttl_remaining:.0f}s left)")
+            return entry.stream_url
+
+        self.misses += 1
+        stream_url = await self._resolve(page_url)
+        entry = self._entries.get(page_url)
+        if entry:
+            entry.last_access = time.time()
+        return stream_url
+
+    def invalidate(self, page_url):
+        """Drop the cached entry for a page URL (e.g. after the origin rejected it)"""
+        self._entries.pop(page_url, None)
+        task = self._refresh_tasks.pop(page_url, None)
+        if task:
+            task.cancel()
+        if self._store:
+            self._store.delete(page_url)
+
+    def close(self):
+        """Cancel all background refresh tasks and close the cache file"""
+        for task in self._refresh_tasks.values():
+            task.cancel()
+        self._refresh_tasks.clear()
+        if self._store:
+            self._store.close()
+            self._store = None
+
+    async def _validate(self, entry):
+        """Probe an entry loaded from disk; returns it if the URL still works, otherwise drops it"""
+        if self.validator is not None:
+            try:
+                ok = await self.validator(entry.stream_url, entry.headers)
+            except Exception as e:
+                logger.warning(f"Could not validate cached stream URL: {e}")
+                ok = False
+            if not ok:
+                logger.info("Stream URL cached on disk no longer works, extracting again")
+                self.invalidate(entry.page_url)
+                return None
+        entry.validated = True
+        self.disk_hits += 1
+        logger.info(f"Using stream URL cached on disk (resolved by {entry.extractor or 'unknown'})")
+        self._schedule_refresh(entry)
+        return entry
+
+    async def _resolve(self, page_url):
+        """Resolve a page URL, sharing one extraction between concurrent callers"""
+        task = self._inflight.get(page_url)
+        if task is None:
+            task = asyncio.create_task(self._resolve_and_store(page_url))
+            self._inflight[page_url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(page_url, None))
+        else:
+            logger.info("Stream URL extraction already in progress, waiting for it")
+        # Shield so one caller being cancelled doesn't cancel everyone else's lookup
+        return await asyncio.shield(task)
+
+    async def _resolve_and_store(self, page_url):
+        stream_url = await self.resolver(page_url)
+
+        # The resolver falls back to the page URL when extraction fails; don't cache that
+        if not stream_url or stream_url == page_url or not stream_url.startswith('http'):
+            return stream_url
+
+        expires_at = parse_url_expiry(stream_url)
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + self.default_ttl
+        else:
+            logger.info(f"Stream URL expires in {expires_at - now:.0f} seconds")
+            expires_at = max(expires_at, now + self.min_ttl)
+
+        extractor, headers = self.details(stream_url) if self.details else (None, None)
+        previous = self._entries.get(page_url)
+        entry = CachedStreamURL(page_url, stream_url, expires_at, extractor=extractor, headers=headers)
+        if previous:
+            entry.last_access = previous.last_access
+        self._entries[page_url] = entry
+        if self._store:
+            try:
+                self._store.save(entry)
+            except Exception as e:
+                logger.warning(f"Could not save stream URL to the cache file: {e}")
+        self._schedule_refresh(entry)
+        return stream_url
+
+    def _schedule_refresh(self, entry):
+        old_task = self._refresh_tasks.get(entry.page_url)
+        if old_task and old_task is not asyncio.current_task():
+            old_task.cancel()
+        self._refresh_tasks[entry.page_url] = asyncio.create_task(self._refresh_before_expiry(entry))
+
+    async def _refresh_before_expiry(self, entry):
+        """Background task: re-resolve an entry shortly before it expires"""
+        delay = max(entry.ttl_remaining - self.refresh_margin, self.min_ttl / 2)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+
+        if self._entries.get(entry.page_url) is not entry:
+            return
+        if time.time() - entry.last_access > self.idle_timeout:
+            logger.info("Cached stream URL is idle, not pre-refreshing it")
+            self._refresh_tasks.pop(entry.page_url, None)
+            return
+
+        logger.info("Pre-refreshing cached stream URL before it expires")
+        try:
+            await self._resolve(entry.page_url)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.warning(f"Background stream URL refresh failed: {e}")
+
+        # If the refresh didn't store a new entry, retry until the old one expires
+        if self._entries.get(entry.page_url) is entry and entry.is_fresh():
+            self._schedule_refresh(entry)
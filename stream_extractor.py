@@ -0,0 +1,588 @@
+"""
+Async stream URL extraction engine for the Direct Stream Bot.
+
+yt-dlp runs in a small, bounded thread pool and the HTML fallbacks use aiohttp,
+so extracting a stream URL never blocks the Discord event loop. Every stage has
+its own timeout and the whole extraction can be cancelled. By default yt-dlp
+and the HTML scanner race each other; once one stage's best URL answers, it
+is ranked with whatever the other stage has found by then and the loser is
+cancelled. Each worker thread keeps one YoutubeDL for its whole life, so
+extractor setup, connections and cookies carry over from one extraction to
+the next. With process isolation each worker thread hands yt-dlp to a worker
+process of its own (see ytdlp_worker.py), so extraction never holds the bot's
+GIL.
+"""
+
+import asyncio
+import codecs
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import aiohttp
+
+from http_client import SharedHTTPClient
+from media_scanner import MediaScanner
+from ytdlp_worker import YtdlpWorkerProcess
+
+logger = logging.getLogger(__name__)
+
+# Headers used by yt-dlp when fetching the stream page
+YTDLP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://southpark.cc.com/',
+    'Origin': 'https://southpark.cc.com',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'cross-site',
+    'Pragma': 'no-cache',
+    'Cache-Control': 'no-cache',
+}
+
+# Headers used for the HTML fallback requests
+PAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://southpark.cc.com/',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Cache-Control': 'max-age=0',
+}
+
+# Headers used when fetching the stream URL directly as a last resort
+DIRECT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+    'Origin': 'https://southpark.cc.com',
+    'Referer': 'https://southpark.cc.com/'
+}
+
+SCAN_CHUNK_SIZE = 64 * 1024  # bytes of page HTML scanned at a time
+MAX_SCAN_BYTES = 8 * 1024 * 1024  # stop scanning pages larger than this
+
+
+def media_score(url, depth):
+    """Score a lower-confidence media URL: playlists over video over audio, shallower pages first"""
+    path = url.split('?', 1)[0].lower()
+    if '.m3u8' in path:
+        kind = 3
+    elif '.mp4' in path:
+        kind = 2
+    else:
+        kind = 1
+    return (kind, -depth)
+
+
+def merge_candidates(*candidate_lists):
+    """Interleave candidate lists (each best first) without duplicates, so every list's best URL gets ranked"""
+    merged = []
+    for group in itertools.zip_longest(*candidate_lists):
+        for url in group:
+            if url and url not in merged:
+                merged.append(url)
+    return merged
+
+
+def load_ytdlp():
+    """Import yt-dlp on first use; it is by far the slowest import the bot has"""
+    import yt_dlp
+    return yt_dlp
+
+
+class CandidateProbe:
+    """Result of probing one candidate media URL"""
+
+    def __init__(self, url, ttfb=None, throughput=None, error=None):
+        self.url = url
+        self.ttfb = ttfb  # seconds until the response headers arrived
+        self.throughput = throughput  # bytes per second while reading the probe
+        self.error = error
+        self.score = float('inf')  # lower is better
+        self.probed_at = time.time()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class StreamExtractor:
+    def __init__(self, max_workers=2, ytdlp_timeout=45, http_timeout=10, total_timeout=90, http_client=None,
+                 iframe_depth=3, iframe_fan_out=4, max_pages=12, rank_candidates=True, max_candidates=4,
+                 probe_bytes=64 * 1024, probe_timeout=5, race=True, reuse_ytdlp=True,
+                 isolation='thread', merge_wait=0.0):
+        self.ytdlp_timeout = ytdlp_timeout  # seconds for the yt-dlp stage
+        self.http_timeout = http_timeout  # seconds for each HTTP request
+        self.total_timeout = total_timeout  # seconds for a whole extraction
+        self.iframe_depth = iframe_depth  # how many iframes deep to follow embedded players
+        self.iframe_fan_out = iframe_fan_out  # iframes followed from each page
+        self.max_pages = max_pages  # pages fetched per extraction, including the first
+        self.rank_candidates = rank_candidates  # probe candidate URLs and use the fastest working one
+        self.max_candidates = max_candidates  # candidates probed per extraction
+        self.probe_bytes = probe_bytes  # bytes fetched from each candidate to measure throughput
+        self.probe_timeout = probe_timeout  # seconds for the whole ranking stage
+        self.race = race  # run yt-dlp and the HTML scanner at the same time instead of one after the other
+        self.merge_wait = merge_wait  # extra seconds the race may wait for the other stage, so its URLs are ranked too
+        self.reuse_ytdlp = reuse_ytdlp  # keep one YoutubeDL per worker thread instead of one per extraction
+        self.isolation = isolation  # 'thread' runs yt-dlp in the worker threads, 'process' in worker processes
+        self.last_winner = None  # stage that produced the last extraction's candidates
+        self.last_race_url = None  # URL the last extraction picked when it was a race won by that URL's stage
+        self.last_ranking = []  # CandidateProbes from the last ranking, best first
+        # Keep-alive connections are reused across extractions, fallbacks and iframe hops
+        self._owns_http_client = http_client is None
+        self.http_client = http_client or SharedHTTPClient()
+        self._details = {}  # stream URL -> (extraction stage, headers it needs)
+        # yt-dlp is blocking, so it gets its own bounded pool of worker threads
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ytdlp')
+        # YoutubeDL isn't thread-safe, so each worker thread gets its own
+        self._thread_state = threading.local()
+        self._extractor_hints = {}  # page host -> yt-dlp extractor that handled it last time
+        self._workers = []  # every YtdlpWorkerProcess started, so shutdown() can stop them
+        self._ytdlp_instances = []  # every thread's YoutubeDL, so shutdown() can close them
+        self._ytdlp_busy = set()  # YoutubeDLs in the middle of an extraction, closed by their own thread
+        self._ytdlp_lock = threading.Lock()
+        self._shut_down = False
+
+    def warm_up(self):
+        """Import yt-dlp (and build a YoutubeDL) on a worker thread, so the first extraction doesn't pay for it"""
+        if self.isolation == 'process':
+            # Start a worker process instead; the bot itself never imports yt-dlp
+            return self._executor.submit(self._worker_process)
+        return self._executor.submit(self._ytdlp if self.reuse_ytdlp else load_ytdlp)
+
+    async def extract(self, page_url):
+        """Extract the direct stream URL, falling back to the page URL on failure"""
+        try:
+            logger.info(f"Extracting direct stream URL from {page_url}")
+            return await asyncio.wait_for(self._extract(page_url), timeout=self.total_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Stream URL extraction timed out after {self.total_timeout} seconds, using original URL")
+            return page_url
+        except asyncio.CancelledError:
+            logger.info("Stream URL extraction cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Error extracting stream URL: {e}")
+            return page_url
+
+    async def _extract(self, page_url):
+        """Run the extraction stages (raced or in order), then pick the best of the candidate URLs"""
+        probes = {}
+        won = False  # whether a stage's URL answered first in a race
+        self.last_race_url = None
+        if self.race:
+            candidates, probes, won = await self._race_stages(page_url)
+        else:
+            candidates = await self._extract_with_ytdlp(page_url)
+            self.last_winner = 'yt-dlp'
+            if not candidates:
+                session = await self.http_client.session()
+                candidates = await self._extract_from_html(session, page_url)
+                self.last_winner = 'html'
+        if not candidates:
+            self.last_winner = None
+            # If all else fails, return the original URL
+            logger.warning("Could not extract direct stream URL, using original URL")
+            return page_url
+        stream_url = await self._pick_candidate(candidates, probes)
+        # Ranking may pick the other stage's URL, which didn't win the race
+        if won and self.resolution_details(stream_url)[0] == self.last_winner:
+            self.last_race_url = stream_url
+        return stream_url
+
+    async def _race_stages(self, page_url):
+        """Run yt-dlp and the HTML scanner concurrently; returns (candidates of both stages, probes already made, won)"""
+        # A generic-extractor miss in yt-dlp can take many seconds, and in order the scanner had to wait for it
+        session = await self.http_client.session()
+        stages = {
+            asyncio.create_task(self._extract_with_ytdlp(page_url)): 'yt-dlp',
+            asyncio.create_task(self._extract_from_html(session, page_url)): 'html',
+        }
+        started = time.perf_counter()
+        results = {}  # stage -> its candidates, in the order the stages finished
+        probes = {}  # URL -> CandidateProbe, handed to the ranking so no URL is probed twice
+        winner = None  # first stage whose best URL answered
+        # The race probe doubles as the ranking measurement, so it fetches as much as the ranking would
+        probe_bytes = None if self.rank_candidates else 1024
+        try:
+            while stages and winner is None:
+                done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = stages.pop(task)
+                    candidates = self._stage_candidates(task, stage)
+                    if not candidates:
+                        continue
+                    results[stage] = candidates
+                    if winner is not None:
+                        continue
+                    url = candidates[0]
+                    probe = probes[url] = await self.measure_url(url, self.resolution_details(url)[1], probe_bytes)
+                    if probe.ok:
+                        logger.info(f"{stage} won the extraction race in {time.perf_counter() - started:.2f} seconds")
+                        winner = stage
+                    else:
+                        logger.info(f"Probe of {url[:80]} failed: {probe.error}")
+
+            if winner is not None and stages and self.rank_candidates:
+                # Rank what the other stage found by now (e.g. while the winner was probed) with the winner's URLs;
+                # waiting longer for it is opt-in, since a slow yt-dlp miss would delay every extraction
+                if self.merge_wait > 0:
+                    await asyncio.wait(stages, timeout=self.merge_wait)
+                for task in [task for task in stages if task.done()]:
+                    stage = stages.pop(task)
+                    candidates = self._stage_candidates(task, stage)
+                    if candidates:
+                        results[stage] = candidates
+        finally:
+            # The loser's yt-dlp worker thread can't be interrupted; it stops at its next socket timeout
+            for task in stages:
+                task.cancel()
+
+        if not results:
+            return [], probes, False
+        won = winner is not None
+        if not won:
+            winner = next(iter(results))
+            logger.warning(f"No extraction stage found a URL that answers, using the {winner} result")
+        self.last_winner = winner
+        others = [candidates for stage, candidates in results.items() if stage != winner]
+        return merge_candidates(results[winner], *others), probes, won
+
+    @staticmethod
+    def _stage_candidates(task, stage):
+        """Return a finished stage's candidates, or [] if it failed"""
+        try:
+            return task.result()
+        except Exception as e:
+            logger.warning(f"{stage} stage failed: {e}")
+            return []
+
+    async def _pick_candidate(self, candidates, probes=None):
+        """Probe the candidates concurrently (reusing probes already made) and return the fastest one that works"""
+        candidates = candidates[:self.max_candidates]
+        if not self.rank_candidates or len(candidates) == 1:
+            return candidates[0]
+
+        probes = dict(probes or {})
+        unprobed = [url for url in candidates if url not in probes]
+        if unprobed:
+            logger.info(f"Probing {len(unprobed)} candidate stream URLs")
+            tasks = [
+                asyncio.create_task(self.measure_url(url, self.resolution_details(url)[1]))
+                for url in unprobed
+            ]
+            done, pending = await asyncio.wait(tasks, timeout=self.probe_timeout)
+            for task in pending:
+                task.cancel()
+            for url, task in zip(unprobed, tasks):
+                if task in done and not task.cancelled() and task.exception() is None:
+                    probes[url] = task.result()
+                else:
+                    probes[url] = CandidateProbe(url, error='timed out')
+
+        ranking = []
+        for index, url in enumerate(candidates):
+            probe = probes[url]
+            if probe.ok:
+                # Time to fetch the probe, with a small bias towards the extractor's own preference order
+                probe.score = probe.ttfb + self.probe_bytes / max(probe.throughput, 1) + index * 0.05
+            ranking.append(probe)
+
+        ranking.sort(key=lambda probe: probe.score)
+        self.last_ranking = ranking
+        best = ranking[0]
+        if not best.ok:
+            logger.warning("No candidate stream URL answered the probe, using the first one")
+            return candidates[0]
+        logger.info(f"Fastest candidate: TTFB {best.ttfb * 1000:.0f} ms, "
+                    f"{best.throughput / 1024:.0f} KB/s ({best.url[:80]})")
+        return best.url
+
+    async def _extract_with_ytdlp(self, page_url):
+        """Run yt-dlp in the worker pool with a stage timeout"""
+        loop = asyncio.get_running_loop()
+        try:
+            logger.info("Attempting to extract stream URL with yt-dlp...")
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self._ytdlp_extract_sync, page_url),
+                timeout=self.ytdlp_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"yt-dlp extraction timed out after {self.ytdlp_timeout} seconds, trying alternative method")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"yt-dlp extraction failed: {e}, trying alternative method")
+        return []
+
+    def _ytdlp_options(self):
+        return {
+            'format': 'bestaudio/best',
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,  # Full extraction
+            'skip_download': True,
+            'no_check_certificate': True,
+            'force_generic_extractor': False,
+            'geo_bypass': True,
+            'geo_bypass_country': 'US',
+            # Keep socket reads bounded so a timed-out worker thread frees up quickly
+            'socket_timeout': self.http_timeout,
+            'http_headers': YTDLP_HEADERS,
+        }
+
+    def _ytdlp(self):
+        """This worker thread's YoutubeDL, created on first use"""
+        ydl = getattr(self._thread_state, 'ydl', None)
+        if ydl is None:
+            ydl = self._thread_state.ydl = load_ytdlp().YoutubeDL(self._ytdlp_options())
+            with self._ytdlp_lock:
+                self._ytdlp_instances.append(ydl)
+        return ydl
+
+    @staticmethod
+    def _close_ytdlp(ydl):
+        """Close a YoutubeDL's cookie jar and keep-alive connections"""
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.warning(f"Error closing YoutubeDL: {e}")
+
+    def _worker_process(self):
+        """This worker thread's yt-dlp process, started on first use and again after it was killed"""
+        worker = getattr(self._thread_state, 'worker', None)
+        if worker is None:
+            worker = self._thread_state.worker = YtdlpWorkerProcess()
+            self._workers.append(worker)
+        if not worker.alive:
+            worker.start()
+        return worker
+
+    def _ytdlp_extract_in_process(self, page_url):
+        """Blocking extraction in this worker thread's yt-dlp process; it is killed if it overruns the stage timeout"""
+        worker = self._worker_process()
+        host = urlparse(page_url).netloc
+        hint = self._extractor_hints.get(host)
+        try:
+            response = worker.extract(page_url, self._ytdlp_options(), hint, timeout=self.ytdlp_timeout)
+        except Exception:
+            self._extractor_hints.pop(host, None)
+            raise
+        if response.get('page_extractor'):
+            self._extractor_hints[host] = response['page_extractor']
+        return self._candidates_from_info(response['info'])
+
+    def _ytdlp_extract_sync(self, page_url):
+        """Blocking yt-dlp extraction, only ever called from the worker pool"""
+        if self.isolation == 'process':
+            return self._ytdlp_extract_in_process(page_url)
+        if not self.reuse_ytdlp:
+            with load_ytdlp().YoutubeDL(self._ytdlp_options()) as ydl:
+                return self._candidates_from_info(ydl.extract_info(page_url, download=False))
+
+        ydl = self._ytdlp()
+        with self._ytdlp_lock:
+            self._ytdlp_busy.add(ydl)
+        try:
+            host = urlparse(page_url).netloc
+            # Go straight to the extractor that worked for this host, instead of testing every one yt-dlp has
+            hint = self._extractor_hints.get(host)
+            try:
+                info = ydl.extract_info(page_url, download=False, ie_key=hint)
+            except Exception:
+                # The page may have moved to another player; select from scratch next time
+                self._extractor_hints.pop(host, None)
+                raise
+            extractor_key = info.get('extractor_key') if info else None
+            # Only remember extractors that take the page itself, not one a page embed was handed on to
+            if extractor_key and extractor_key != hint and ydl.get_info_extractor(extractor_key).suitable(page_url):
+                self._extractor_hints[host] = extractor_key
+            return self._candidates_from_info(info)
+        finally:
+            with self._ytdlp_lock:
+                self._ytdlp_busy.discard(ydl)
+                close = self._shut_down
+            if close:
+                # shutdown() left this one open because it was in use
+                self._thread_state.ydl = None
+                self._close_ytdlp(ydl)
+
+    def _candidates_from_info(self, info):
+        """Return the audio URLs from a yt-dlp info dict, best first"""
+        if not info:
+            return []
+
+        if 'url' in info:
+            logger.info("Successfully extracted stream URL using yt-dlp (direct)")
+            self._remember(info['url'], 'yt-dlp', info.get('http_headers'))
+            return [info['url']]
+
+        if 'formats' in info and info['formats']:
+            # Get the best audio format
+            formats = sorted(info['formats'], key=lambda x: (
+                x.get('acodec', 'none') != 'none',  # Prefer formats with audio
+                x.get('abr') or 0,  # Higher audio bitrate
+                x.get('filesize', 0) if x.get('filesize') else float('inf')  # Smaller file size if available
+            ), reverse=True)
+
+            candidates = []
+            for format in formats:
+                if format.get('acodec') != 'none' and format.get('url') and format['url'] not in candidates:
+                    if not candidates:
+                        logger.info(f"Successfully extracted stream URL using yt-dlp (format: {format.get('format_id')}, audio bitrate: {format.get('abr')})")
+                    self._remember(format['url'], 'yt-dlp', format.get('http_headers'))
+                    candidates.append(format['url'])
+            return candidates
+        return []
+
+    async def scan_page(self, session, url, headers=None, playlists_only=False):
+        """Stream a page through the media scanner and return the scanner once it has an answer"""
+        timeout = aiohttp.ClientTimeout(total=self.http_timeout)
+        scanner = MediaScanner(url, playlists_only=playlists_only, max_iframes=self.iframe_fan_out)
+        async with session.get(url, headers=headers or PAGE_HEADERS, timeout=timeout) as response:
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+            bytes_read = 0
+            async for chunk in response.content.iter_chunked(SCAN_CHUNK_SIZE):
+                scanner.feed(decoder.decode(chunk))
+                bytes_read += len(chunk)
+                if scanner.done:
+                    # High-confidence hit: don't download the rest of the page
+                    logger.info(f"Media scanner stopped after {bytes_read // 1024} KB")
+                    break
+                if bytes_read > MAX_SCAN_BYTES:
+                    logger.warning(f"Page is larger than {MAX_SCAN_BYTES // (1024 * 1024)} MB, scanned the start only")
+                    break
+            scanner.feed(decoder.decode(b'', final=True), final=True)
+        return scanner
+
+    async def _extract_from_html(self, session, page_url):
+        """Fallback: scan the page and its embedded players concurrently for media URLs"""
+        # Pages are scanned as soon as they are discovered; a high-confidence hit on any
+        # of them cancels the rest, otherwise the best lower-confidence URL wins
+        visited = {page_url}
+        pending = {asyncio.create_task(self.scan_page(session, page_url)): (page_url, 0)}
+        found = []  # (score, media URL, page URL) for lower-confidence hits
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url, depth = pending.pop(task)
+                    try:
+                        scanner = task.result()
+                    except Exception as e:
+                        logger.warning(f"Could not scan {url}: {e}")
+                        continue
+
+                    if scanner.best:
+                        logger.info(f"Found media URL at iframe depth {depth}: {scanner.best}")
+                        self._remember(scanner.best, 'html', {'Referer': url})
+                        return [scanner.best]
+                    for media_url in scanner.candidates:
+                        found.append((media_score(media_url, depth), media_url, url))
+
+                    if depth >= self.iframe_depth:
+                        continue
+                    for iframe_url in scanner.iframes:
+                        # The visited set stops players that embed themselves (or each other) from looping
+                        if iframe_url in visited or len(visited) >= self.max_pages:
+                            continue
+                        visited.add(iframe_url)
+                        logger.info(f"Following iframe (depth {depth + 1}): {iframe_url}")
+                        task = asyncio.create_task(self.scan_page(session, iframe_url))
+                        pending[task] = (iframe_url, depth + 1)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        found.sort(key=lambda item: item[0], reverse=True)
+        candidates = []
+        for _, media_url, url in found:
+            if media_url not in candidates:
+                self._remember(media_url, 'html', {'Referer': url})
+                candidates.append(media_url)
+        if candidates:
+            logger.info(f"Found {len(candidates)} media URL(s) in {len(visited)} page(s)")
+        return candidates
+
+    async def find_m3u8_url(self, page_url):
+        """Fetch the page directly and return the first m3u8 URL in it, or None"""
+        try:
+            session = await self.http_client.session()
+            scanner = await asyncio.wait_for(
+                self.scan_page(session, page_url, headers=DIRECT_HEADERS, playlists_only=True),
+                timeout=self.http_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Direct page fetch timed out after {self.http_timeout} seconds")
+            return None
+        return scanner.best
+
+    def _remember(self, stream_url, stage, headers):
+        if len(self._details) > 64:
+            self._details.clear()
+        self._details[stream_url] = (stage, dict(headers or {}))
+
+    def resolution_details(self, stream_url):
+        """Return (extraction stage, headers) for a URL this extractor produced"""
+        return self._details.get(stream_url, (None, None))
+
+    async def measure_url(self, url, headers=None, probe_bytes=None):
+        """Fetch the start of a media URL with a range request, measuring TTFB and throughput"""
+        probe_bytes = probe_bytes or self.probe_bytes
+        timeout = aiohttp.ClientTimeout(total=self.http_timeout)
+        request_headers = {**DIRECT_HEADERS, **(headers or {}), 'Range': f'bytes=0-{probe_bytes - 1}'}
+        try:
+            session = await self.http_client.session()
+            started = time.perf_counter()
+            async with session.get(url, headers=request_headers, timeout=timeout) as response:
+                ttfb = time.perf_counter() - started
+                if response.status >= 400:
+                    return CandidateProbe(url, error=f"HTTP {response.status}")
+                received = 0
+                async for chunk in response.content.iter_chunked(16 * 1024):
+                    received += len(chunk)
+                    if received >= probe_bytes:
+                        break
+                elapsed = time.perf_counter() - started - ttfb
+            return CandidateProbe(url, ttfb=ttfb, throughput=received / max(elapsed, 0.001))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return CandidateProbe(url, error=str(e) or type(e).__name__)
+
+    async def probe_url(self, url, headers=None):
+        """Cheap reachability check: fetch the first KB of a media URL, returns True if it answers"""
+        probe = await self.measure_url(url, headers, probe_bytes=1024)
+        if not probe.ok:
+            logger.info(f"Probe of {url[:80]} failed: {probe.error}")
+        return probe.ok
+
+    async def close(self):
+        """Close the HTTP session if this extractor created it"""
+        if self._owns_http_client:
+            await self.http_client.close()
+
+    def shutdown(self):
+        """Stop the worker pool (and any worker processes) without waiting for running extractions"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Idle YoutubeDLs are closed now; one still extracting is closed by its own thread when it finishes,
+        # so its opener and cookie jar aren't pulled out from under extract_info
+        with self._ytdlp_lock:
+            self._shut_down = True
+            idle = [ydl for ydl in self._ytdlp_instances if ydl not in self._ytdlp_busy]
+            self._ytdlp_instances.clear()
+        for ydl in idle:
+            self._close_ytdlp(ydl)
+        for worker in self._workers:
+            worker.kill()
@@ -0,0 +1,22 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def bot_module():
+    """direct_stream_bot, imported with a test config that keeps its cache and stats files off the disk"""
+    if 'direct_stream_bot' not in sys.modules:
+        config = types.ModuleType('config')
+        config.BOT_TOKEN = 'test-token'
+        config.STREAM_URL = 'http://127.0.0.1:9/watch'
+        config.COMMAND_PREFIX = '!'
+        config.STREAM_URL_CACHE_FILE = None
+        config.FFMPEG_PROFILE_STATS_FILE = None
+        sys.modules['config'] = config
+    import direct_stream_bot
+    return direct_stream_bot
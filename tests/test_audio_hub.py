@@ -0,0 +1,113 @@
+import threading
+import time
+
+from audio_hub import BroadcastHub, OPUS_SILENCE
+
+OPUS_PACKET = b'\x01' * 20
+
+
+class StallingOpusSource:
+    """Opus ingest that stalls after a few packets, padding with flagged silence like a jitter buffer"""
+
+    def __init__(self, packets=5):
+        self.packets = packets
+        self.is_filler = False
+        self.stopped = threading.Event()
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        if self.stopped.is_set():
+            return b''
+        self.is_filler = self.packets <= 0
+        if self.is_filler:
+            return OPUS_SILENCE
+        self.packets -= 1
+        return OPUS_PACKET
+
+    def cleanup(self):
+        self.stopped.set()
+
+
+def test_filler_from_a_stalled_ingest_does_not_count_as_flowing():
+    hub = BroadcastHub(buffer_seconds=5, linger=0)
+    ingest = StallingOpusSource()
+    source = hub.create_source('stream', lambda: ingest)
+    broadcast = source.broadcast
+
+    deadline = time.monotonic() + 2
+    while broadcast.delivering_audio() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not broadcast.delivering_audio()
+
+    # Without a standby the stalled ingest is stopped, so recovery restarts it instead of trusting the filler
+    assert broadcast.fail_over() is False
+    assert ingest.stopped.is_set()
+    source.cleanup()
+
+
+def test_listeners_see_which_packets_are_filler():
+    hub = BroadcastHub(buffer_seconds=5, linger=0)
+    source = hub.create_source('stream', StallingOpusSource)
+    source._cursor = 0
+    packets = []
+    # The listener may also get its own filler while waiting for the paced ingest
+    for _ in range(30):
+        packet = source.read()
+        packets.append((packet, source.is_filler))
+    source.broadcast.stop()
+    source.cleanup()
+
+    assert [packet for packet, filler in packets if not filler] == [OPUS_PACKET] * 5
+    assert all(packet == OPUS_SILENCE for packet, filler in packets if filler)
+
+
+class SlowStartingSource(StallingOpusSource):
+    """Ingest whose creation takes a while, like spawning FFmpeg"""
+
+    created = []
+
+    def __init__(self, started):
+        super().__init__()
+        started.set()
+        time.sleep(0.5)
+        self.created.append(self)
+
+
+def test_starting_an_ingest_does_not_hold_up_other_streams():
+    hub = BroadcastHub(buffer_seconds=5, linger=0)
+    started = threading.Event()
+    slow = threading.Thread(target=hub.create_source, args=('slow', lambda: SlowStartingSource(started)))
+    slow.start()
+    assert started.wait(timeout=2)
+    began = time.perf_counter()
+    other = hub.create_source('other', StallingOpusSource)
+    other.cleanup()
+    assert time.perf_counter() - began < 0.25
+    slow.join()
+    for broadcast in list(hub._broadcasts.values()):
+        broadcast.stop()
+
+
+def test_concurrent_starts_share_one_ingest_and_stop_the_spare():
+    hub = BroadcastHub(buffer_seconds=5, linger=0)
+    SlowStartingSource.created = []
+    sources = []
+    threads = [
+        threading.Thread(target=lambda: sources.append(
+            hub.create_source('stream', lambda: SlowStartingSource(threading.Event()))))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(SlowStartingSource.created) == 2
+    assert sources[0].broadcast is sources[1].broadcast
+    assert sources[0].broadcast.listeners == 2
+    assert sorted(source.joined_existing for source in sources) == [False, True]
+    spare = [ingest for ingest in SlowStartingSource.created if ingest is not sources[0].broadcast.source]
+    assert len(spare) == 1 and spare[0].stopped.is_set()
+    sources[0].broadcast.stop()
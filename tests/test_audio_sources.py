@@ -0,0 +1,80 @@
+import threading
+import time
+
+from audio_sources import FFmpegErrorLog, InstrumentedAudioSource, JitterBufferSource
+
+PCM_FRAME = b'\x01\x02' * 1920
+
+
+class HangingPCMSource:
+    """PCM source that delivers a few frames and then blocks, like FFmpeg waiting on a stalled origin"""
+
+    def __init__(self, frames=5):
+        self.frames = frames
+        self.released = threading.Event()
+
+    def is_opus(self):
+        return False
+
+    def read(self):
+        if self.frames <= 0:
+            self.released.wait()
+            return b''
+        self.frames -= 1
+        return PCM_FRAME
+
+    def cleanup(self):
+        self.released.set()
+
+
+class FakeProcess:
+    def __init__(self, returncode):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+def error_log(returncode, stderr=b''):
+    log = FFmpegErrorLog()
+    log.process = FakeProcess(returncode)
+    log.write(stderr)
+    return log
+
+
+def test_ffmpeg_rejecting_its_options_is_a_failure():
+    log = error_log(1, b"Unrecognized option 'reconnect_on_network_error'.\nError splitting the argument list\n")
+    assert log.failure() == "FFmpeg exited with code 1: Error splitting the argument list"
+
+
+def test_stderr_lines_split_across_writes_are_joined():
+    log = error_log(None, b"Unrecognized opt")
+    log.write(b"ion 'foo'.\n")
+    assert list(log.lines) == ["Unrecognized option 'foo'."]
+
+
+def test_running_or_cleanly_ended_ffmpeg_is_not_a_failure():
+    assert error_log(None).failure() is None  # still running, e.g. waiting on a stalled origin
+    assert error_log(0).failure() is None  # the input ended
+    assert error_log(-9).failure() is None  # killed when playback was stopped
+
+
+def test_input_errors_are_not_blamed_on_ffmpeg():
+    log = error_log(1, b"https://origin/seg1.ts: Server returned 403 Forbidden (access denied)\n")
+    assert log.failure() is None
+
+
+def test_pcm_jitter_buffer_silence_is_detected_as_a_stall():
+    jitter_buffer = JitterBufferSource(HangingPCMSource(), target_frames=2)
+    audio_source = InstrumentedAudioSource(jitter_buffer, stall_window=0.3, warning_after=0.1)
+    frames = [audio_source.read() for _ in range(30)]  # real audio, then the buffer pads with PCM silence
+    audio_source.cleanup()
+
+    assert frames.count(PCM_FRAME) == 5
+    assert audio_source.audio_frames == 5
+    assert jitter_buffer.is_filler
+    assert time.monotonic() - audio_source.last_audio_at >= 0.3
+    # The health monitor samples the counters periodically; the first sample only starts the window
+    assert audio_source.check() is None
+    time.sleep(0.05)
+    assert audio_source.check().startswith("audio stall")
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+
+from audio_hub import BroadcastHub
+from health_monitor import HealthMonitor
+
+
+class FakeVoiceClient:
+    def __init__(self, connected=True, playing=True):
+        self.connected = connected
+        self.playing = playing
+
+    def is_connected(self):
+        return self.connected
+
+    def is_playing(self):
+        return self.playing
+
+    def is_paused(self):
+        return False
+
+
+class FakeSession:
+    def __init__(self):
+        self.events = []
+        self.handled = asyncio.Event()
+
+    def handle_health_event(self, reason):
+        self.events.append(reason)
+        self.handled.set()
+
+
+class EndingSource:
+    """Opus source that delivers a few packets and then ends, like an FFmpeg that exited"""
+
+    def __init__(self, packets=3):
+        self.packets = packets
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        if self.packets <= 0:
+            return b''
+        self.packets -= 1
+        return b'\x01' * 20
+
+    def cleanup(self):
+        pass
+
+
+def make_session(bot_module, monitor):
+    session = bot_module.DirectStreamBot(
+        extractor=object(),
+        url_cache=object(),
+        ffmpeg_available=True,
+        health_monitor=monitor,
+        profile_selector=object()
+    )
+    session.is_streaming = True
+    session.state = bot_module.StreamState.PLAYING
+    session.voice_client = FakeVoiceClient()
+    session.recoveries = []
+    session.request_recovery = session.recoveries.append
+    return session
+
+
+def test_event_from_another_thread_is_handled_without_waiting_for_the_poll():
+    async def run():
+        monitor = HealthMonitor(lambda: [], poll_interval=30)
+        monitor.ensure_running()
+        session = FakeSession()
+        started = time.monotonic()
+        threading.Thread(target=monitor.notify_threadsafe, args=(session, "stream ended")).start()
+        await asyncio.wait_for(session.handled.wait(), timeout=1)
+        monitor.stop()
+        return session.events, time.monotonic() - started
+
+    events, elapsed = asyncio.run(run())
+    assert events == ["stream ended"]
+    assert elapsed < 1
+
+
+def test_player_exit_starts_recovery_through_the_monitor(bot_module):
+    async def run():
+        monitor = HealthMonitor(lambda: [], poll_interval=30)
+        monitor.ensure_running()
+        session = make_session(bot_module, monitor)
+        after = session._make_after_callback(session._playback_id)
+        # discord.py calls the after callback on the player thread
+        threading.Thread(target=after, args=(None,)).start()
+        for _ in range(50):
+            if session.recoveries:
+                break
+            await asyncio.sleep(0.02)
+        monitor.stop()
+        return session.recoveries
+
+    assert asyncio.run(run()) == ["stream ended"]
+
+
+def test_replaced_player_does_not_start_recovery(bot_module):
+    async def run():
+        monitor = HealthMonitor(lambda: [], poll_interval=30)
+        monitor.ensure_running()
+        session = make_session(bot_module, monitor)
+        after = session._make_after_callback(session._playback_id)
+        session._playback_id += 1  # a new playback took over before the old player finished
+        threading.Thread(target=after, args=(None,)).start()
+        await asyncio.sleep(0.2)
+        monitor.stop()
+        return session.recoveries
+
+    assert asyncio.run(run()) == []
+
+
+def test_voice_state_change_checks_the_connection_at_once(bot_module):
+    async def run():
+        monitor = HealthMonitor(lambda: [], poll_interval=30)
+        monitor.ensure_running()
+        session = make_session(bot_module, monitor)
+        monitor.notify(session, bot_module.VOICE_STATE_CHANGED)
+        await asyncio.sleep(0.1)
+        still_connected = list(session.recoveries)
+        session.voice_client.connected = False
+        monitor.notify(session, bot_module.VOICE_STATE_CHANGED)
+        await asyncio.sleep(0.1)
+        monitor.stop()
+        return still_connected, session.recoveries
+
+    still_connected, recoveries = asyncio.run(run())
+    assert still_connected == []
+    assert recoveries == ["voice disconnected"]
+
+
+def test_shared_ingest_exit_is_reported_to_its_listeners():
+    hub = BroadcastHub(buffer_seconds=1, linger=0)
+    ended = threading.Event()
+    source = hub.create_source('stream', EndingSource)
+    source.on_ingest_ended = ended.set
+    assert ended.wait(timeout=2)
+    source.cleanup()
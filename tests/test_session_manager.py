@@ -0,0 +1,28 @@
+import threading
+import time
+from types import SimpleNamespace
+
+
+def test_sessions_are_created_without_waiting_for_the_ffmpeg_probe(bot_module, monkeypatch):
+    probe_may_finish = threading.Event()
+
+    def slow_check():
+        probe_may_finish.wait(timeout=5)
+        return True
+
+    monkeypatch.setattr(bot_module, 'FAST_START', True)
+    monkeypatch.setattr(bot_module.DirectStreamBot, '_check_ffmpeg_available', staticmethod(slow_check))
+    manager = bot_module.StreamSessionManager()
+    try:
+        started = time.perf_counter()
+        session = manager.get(SimpleNamespace(id=1))
+        assert time.perf_counter() - started < 1
+        assert session.ffmpeg_available is None
+
+        probe_may_finish.set()
+        manager._ffmpeg_probe.join(timeout=5)
+        assert session.ffmpeg_available is True
+        assert manager.get(SimpleNamespace(id=2)).ffmpeg_available is True
+    finally:
+        probe_may_finish.set()
+        manager.extractor.shutdown()
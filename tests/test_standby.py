@@ -0,0 +1,48 @@
+import time
+
+from audio_sources import JitterBufferSource
+from standby import StandbyIngest
+
+OPUS_PACKET = b'\x01' * 20
+
+
+class LiveOpusSource:
+    """Opus source delivering packets at real-time pace, like FFmpeg on a live stream"""
+
+    def __init__(self):
+        self.stopped = False
+        self.next_at = time.perf_counter()
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        if self.stopped:
+            return b''
+        self.next_at += 0.02
+        time.sleep(max(self.next_at - time.perf_counter(), 0))
+        return OPUS_PACKET
+
+    def cleanup(self):
+        self.stopped = True
+
+
+def test_standby_keeps_its_jitter_buffer_full_until_the_takeover():
+    jitter_buffers = []
+
+    def make_source():
+        jitter_buffers.append(JitterBufferSource(LiveOpusSource(), target_frames=10))
+        return jitter_buffers[0]
+
+    standby = StandbyIngest(make_source)
+    assert standby.ready.wait(timeout=2)
+    time.sleep(1)
+    jitter_buffer = jitter_buffers[0]
+    # Drained flat out, the buffer would underrun every time it refilled
+    assert jitter_buffer.underruns <= 1
+    assert jitter_buffer.depth >= 5
+
+    source = standby.take()
+    packets = [source.read() for _ in range(15)]
+    standby.stop()
+    assert packets == [OPUS_PACKET] * 15
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+from stream_extractor import CandidateProbe, StreamExtractor, merge_candidates
+
+
+class StagedExtractor(StreamExtractor):
+    """Extractor whose stages return fixed candidates, and whose probes are counted instead of fetched"""
+
+    def __init__(self, ytdlp, html, ytdlp_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.stage_results = {'yt-dlp': (ytdlp, ytdlp_delay), 'html': (html, 0.0)}
+        self.measured = []
+
+    async def _stage(self, stage):
+        candidates, delay = self.stage_results[stage]
+        await asyncio.sleep(delay)
+        for url in candidates:
+            self._remember(url, stage, {})
+        return candidates
+
+    async def _extract_with_ytdlp(self, page_url):
+        return await self._stage('yt-dlp')
+
+    async def _extract_from_html(self, session, page_url, depth=0):
+        return await self._stage('html')
+
+    async def measure_url(self, url, headers=None, probe_bytes=None):
+        self.measured.append(url)
+        # The yt-dlp format URLs are faster than the page's own player URL
+        return CandidateProbe(url, ttfb=0.01 if 'format' in url else 0.2, throughput=1024 * 1024)
+
+
+def extract(extractor):
+    async def run():
+        try:
+            return await extractor.extract('https://example.com/watch')
+        finally:
+            await extractor.close()
+            extractor.shutdown()
+    return asyncio.run(run())
+
+
+def test_merge_candidates_interleaves_without_duplicates():
+    assert merge_candidates(['a', 'b'], ['c', 'a', 'd']) == ['a', 'c', 'b', 'd']
+
+
+def test_single_html_hit_is_ranked_against_ytdlp_formats():
+    extractor = StagedExtractor(
+        ytdlp=['https://cdn/format-1.m3u8', 'https://cdn/format-2.m3u8'],
+        html=['https://page/player.m3u8'],
+        ytdlp_delay=0.1,
+        merge_wait=1.0
+    )
+    assert extract(extractor) == 'https://cdn/format-1.m3u8'
+    assert extractor.last_winner == 'html'
+    assert extractor.last_race_url is None  # ranked ahead of the race winner, so it didn't win the race
+    assert sorted(probe.url for probe in extractor.last_ranking) == [
+        'https://cdn/format-1.m3u8', 'https://cdn/format-2.m3u8', 'https://page/player.m3u8'
+    ]
+    # The race winner's probe is reused by the ranking
+    assert sorted(extractor.measured) == sorted(set(extractor.measured))
+
+
+def test_slow_loser_is_not_waited_for_beyond_merge_wait():
+    extractor = StagedExtractor(
+        ytdlp=['https://cdn/format-1.m3u8'],
+        html=['https://page/player.m3u8'],
+        ytdlp_delay=5,
+        merge_wait=0.1
+    )
+    assert extract(extractor) == 'https://page/player.m3u8'
+    assert extractor.measured == ['https://page/player.m3u8']
+    assert extractor.last_race_url == 'https://page/player.m3u8'
+
+
+def test_winner_returns_without_waiting_when_ranking_is_disabled():
+    extractor = StagedExtractor(
+        ytdlp=['https://cdn/format-1.m3u8'],
+        html=['https://page/player.m3u8'],
+        ytdlp_delay=5,
+        merge_wait=5,
+        rank_candidates=False
+    )
+    started = time.perf_counter()
+    assert extract(extractor) == 'https://page/player.m3u8'
+    assert time.perf_counter() - started < 1
+
+
+def test_loser_is_not_waited_for_by_default():
+    extractor = StagedExtractor(
+        ytdlp=['https://cdn/format-1.m3u8'],
+        html=['https://page/player.m3u8'],
+        ytdlp_delay=5
+    )
+    started = time.perf_counter()
+    assert extract(extractor) == 'https://page/player.m3u8'
+    assert time.perf_counter() - started < 1
+
+
+def test_sequential_extraction_is_not_reported_as_a_race():
+    extractor = StagedExtractor(ytdlp=['https://cdn/format-1.m3u8'], html=[], race=False)
+    assert extract(extractor) == 'https://cdn/format-1.m3u8'
+    assert extractor.last_race_url is None
+
+
+def test_shutdown_closes_the_worker_threads_youtubedl():
+    extractor = StreamExtractor(max_workers=1)
+    ydl = extractor.warm_up().result()
+    closed = []
+    ydl.close = lambda: closed.append(ydl)
+    extractor.shutdown()
+    assert closed == [ydl]
+
+
+def test_youtubedl_in_use_at_shutdown_is_closed_by_its_own_thread():
+    extractor = StreamExtractor(max_workers=1)
+    ydl = extractor.warm_up().result()
+    closed = []
+    extracting = threading.Event()
+    finish = threading.Event()
+
+    def extract_info(url, download=False, ie_key=None):
+        extracting.set()
+        finish.wait(timeout=5)
+        return {'url': 'https://cdn/stream.m3u8'}
+
+    ydl.close = lambda: closed.append(ydl)
+    ydl.extract_info = extract_info
+    future = extractor._executor.submit(extractor._ytdlp_extract_sync, 'https://example.com/watch')
+    assert extracting.wait(timeout=5)
+    extractor.shutdown()
+    assert closed == []  # still extracting
+
+    finish.set()
+    assert future.result(timeout=5) == ['https://cdn/stream.m3u8']
+    assert closed == [ydl]
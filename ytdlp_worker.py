@@ -0,0 +1,142 @@
+"""
+yt-dlp worker process for the Direct Stream Bot.
+
+yt-dlp's extraction is CPU-heavy Python and, run on a thread, it competes for
+the GIL with discord.py's voice thread, which has to send a packet every 20 ms.
+With process isolation each extraction worker thread hands its extractions to
+a worker process of its own instead, and only waits on a pipe.
+
+The protocol is one JSON object per line. The worker prints READY_LINE once
+yt-dlp is imported, then answers each request
+    {"url": ..., "options": {YoutubeDL options}, "ie_key": extractor or null}
+with
+    {"info": {url, http_headers, extractor_key, formats}, "page_extractor": ...}
+or {"error": "..."}. Only the fields the extractor ranks formats by are sent
+back, not yt-dlp's whole info dict. page_extractor is the extractor that
+handled the page itself, so the next request for the host can go straight to it.
+
+Run as a script by YtdlpWorkerProcess; it isn't meant to be started by hand.
+"""
+
+import copy
+import json
+import os
+import subprocess
+import sys
+import threading
+
+READY_LINE = 'YTDLP_WORKER_READY'
+WORKER_SCRIPT = os.path.abspath(__file__)
+FORMAT_FIELDS = ('format_id', 'url', 'acodec', 'abr', 'filesize', 'http_headers')
+
+
+class WorkerError(Exception):
+    """The worker process died, timed out or reported an extraction error"""
+
+
+class YtdlpWorkerProcess:
+    """One worker process, used by one thread at a time"""
+
+    def __init__(self, python=None):
+        self.python = python or sys.executable
+        self._process = None
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self, timeout=30):
+        """Start the process and wait until it has imported yt-dlp"""
+        self._process = subprocess.Popen(
+            [self.python, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        line = self._read_line(timeout)
+        if line.strip() != READY_LINE:
+            self.kill()
+            raise WorkerError(f"yt-dlp worker didn't start: {line.strip() or 'no output'}")
+
+    def extract(self, url, options, ie_key=None, timeout=45):
+        """Send one request and wait for its answer; the process is killed if it takes longer than timeout"""
+        if not self.alive:
+            self.start()
+        try:
+            self._process.stdin.write(json.dumps({'url': url, 'options': options, 'ie_key': ie_key}) + '\n')
+            self._process.stdin.flush()
+        except OSError as e:
+            self.kill()
+            raise WorkerError(f"yt-dlp worker is gone: {e}")
+        line = self._read_line(timeout)
+        if not line:
+            raise WorkerError(f"yt-dlp worker exited or gave no answer within {timeout} seconds")
+        response = json.loads(line)
+        if 'error' in response:
+            raise WorkerError(response['error'])
+        return response
+
+    def _read_line(self, timeout):
+        """Read a line from the worker, killing it (which ends the read) once timeout passes"""
+        # A timer rather than select(), which doesn't work on pipes on Windows
+        timer = threading.Timer(timeout, self.kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            return self._process.stdout.readline()
+        finally:
+            timer.cancel()
+
+    def kill(self):
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def compact_info(info):
+    """Strip a yt-dlp info dict down to what the extractor uses"""
+    compact = {key: info[key] for key in ('url', 'http_headers', 'extractor_key') if key in info}
+    if info.get('formats'):
+        compact['formats'] = [{key: format.get(key) for key in FORMAT_FIELDS} for format in info['formats']]
+    return compact
+
+
+def main():
+    # yt-dlp may print to stdout; keep the real stdout for answers only
+    answers = sys.stdout
+    sys.stdout = sys.stderr
+    import yt_dlp
+    print(READY_LINE, file=answers, flush=True)
+
+    ydl = None
+    ydl_options = None
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if ydl is None or request['options'] != ydl_options:
+                # One long-lived YoutubeDL, so cookies and connections carry over between requests
+                ydl_options = request['options']
+                # YoutubeDL fills in defaults in the dict it is given, so give it a copy to keep the comparison honest
+                ydl = yt_dlp.YoutubeDL(copy.deepcopy(ydl_options))
+            info = ydl.extract_info(request['url'], download=False, ie_key=request.get('ie_key'))
+            if not info:
+                response = {'info': None}
+            else:
+                response = {'info': compact_info(info)}
+                extractor_key = info.get('extractor_key')
+                # Only an extractor that takes the page itself, not one a page embed was handed on to
+                if extractor_key and ydl.get_info_extractor(extractor_key).suitable(request['url']):
+                    response['page_extractor'] = extractor_key
+        except Exception as e:
+            response = {'error': str(e) or type(e).__name__}
+        answers.write(json.dumps(response) + '\n')
+        answers.flush()
+
+
+if __name__ == '__main__':
+    main()